@@ -2,9 +2,11 @@
 # - 토큰 수를 계산하여 context window 제한을 초과하지 않도록 관리합니다.
 # - 오래된 대화 기록을 자동으로 삭제하여 토큰 제한 내에서 대화를 유지합니다.
 
+import hashlib
 import os
 from openai import AzureOpenAI
 import tiktoken
+from collections import OrderedDict
 
 client = AzureOpenAI(
     azure_endpoint=os.getenv("AOAI_ENDPOINT"),
@@ -20,14 +22,29 @@ token_limit = 4096  # GPT-3.5-turbo의 context window 크기
 conversation = []
 conversation.append(system_message)
 
+encoding = tiktoken.get_encoding("cl100k_base")
+
+# the system message and earlier turns are resent every turn; their counts are looked up by a hash of the text
+token_counts = OrderedDict()
+
+def num_tokens_from_string(value):
+    key = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+    num_tokens = len(encoding.encode(value))
+    token_counts[key] = num_tokens
+    if len(token_counts) > 1024:
+        token_counts.popitem(last=False)
+    return num_tokens
+
 # 대화 메시지의 총 토큰 수 계산
 def num_tokens_from_messages(messages):
-    encoding= tiktoken.get_encoding("cl100k_base")
     num_tokens = 0
     for message in messages:
         num_tokens += 4           # every message follows <im_start>{role/name}\n{content}<im_end>\n
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            num_tokens += num_tokens_from_string(value)
             if key == "name":     # if there's a name, the role is omitted
                 num_tokens += -1  # role is always required and always 1 token
     num_tokens += 2               # every reply is primed with <im_start>assistant
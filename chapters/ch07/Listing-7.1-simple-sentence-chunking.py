@@ -13,6 +13,8 @@ import re
 from openai import OpenAI
 from tqdm import tqdm # for progress bars
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 
 # Initialize the OpenAI client
 # OpenAI 클라이언트 초기화
@@ -30,7 +32,15 @@ def split_sentences(text):
 # count tokens
 # tiktoken을 사용해 문자열의 토큰 수 계산
 # 토큰 수는 API 비용과 직결되므로 정확한 카운팅 필요
+# sentences that recur in the text are encoded once; the cache holds a hash of each sentence, not the sentence
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     # cl100k_base: GPT-3.5-turbo, GPT-4 사용
     encoding = tk.get_encoding(encoding_name)
@@ -41,6 +51,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # OpenAI embeddings example from Chapter 2
@@ -11,6 +11,8 @@ from time import sleep
 from openai import AzureOpenAI
 from tqdm import tqdm # for progress bars
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 import nltk
 
 # Initialize the Azure OpenAI client
@@ -57,7 +59,15 @@ def split_sentences_by_nltk(text):
   return chunks
 
 # count tokens
+# the three splitters below count the same sentences again, so counts are looked up by a hash of the text
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     encoding = tk.get_encoding(encoding_name)
     
@@ -66,6 +76,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # OpenAI embeddings example from Chapter 2
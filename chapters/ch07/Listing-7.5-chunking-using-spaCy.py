@@ -12,6 +12,8 @@
 
 import spacy
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 from openai import AzureOpenAI
 import os
 
@@ -22,7 +24,15 @@ client = AzureOpenAI(
     api_version="2022-12-01")
 
 # count tokens
+# repeated sentences are only encoded once, keyed by their hash so the cache stays small
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     encoding = tk.get_encoding(encoding_name)
     
@@ -31,6 +41,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # OpenAI embeddings example from Chapter 2
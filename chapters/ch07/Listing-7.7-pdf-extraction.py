@@ -15,6 +15,8 @@ import PyPDF2
 from openai import OpenAI
 from tqdm import tqdm # for progress bars
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 import spacy
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_BOOK_KEY"))
@@ -69,7 +71,15 @@ def split_sentences_by_spacy(text, max_tokens,
     return chunks
 
 # count tokens
+# headers and footers recur on every PDF page, so their counts are reused by hash
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     encoding = tk.get_encoding(encoding_name)
     
@@ -78,6 +88,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # OpenAI embeddings example from Chapter 2
@@ -20,6 +20,8 @@ from tenacity import wait_random_exponential
 from time import sleep
 from tqdm import tqdm
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 
 import spacy
 
@@ -43,7 +45,15 @@ def get_embedding(text):
     return vector
 
 # count tokens
+# boilerplate sentences recur across blog posts; remember their counts by a digest of the text
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     encoding = tk.get_encoding(encoding_name)
     
@@ -52,6 +62,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # Split the text into chunks by sentences
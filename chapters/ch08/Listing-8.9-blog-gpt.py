@@ -12,6 +12,8 @@ from redis.commands.search.field import VectorField, TextField
 from redis.commands.search.query import Query
 from redis.commands.search.indexDefinition import IndexDefinition, IndexType
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 
 # OpenAI API key
 client = OpenAI(api_key=os.getenv('OPENAI_API_BOOK_KEY'))
@@ -22,7 +24,15 @@ redis_port = "6379"
 redis_password = ""
 
 # Count the number of tokens in a string
+# the same posts are counted again for every question, so counts are cached by content hash
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     encoding = tk.get_encoding(encoding_name)
     
@@ -31,6 +41,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # Vectorize the query using OpenAI's text-embedding-ada-002 model
@@ -136,7 +151,7 @@ def ask_gpt(query : str, max_token = 4096, debug_message = False) -> str:
     if debug_message:
         print("Length of messages: ", len(messages))
         if debug_message:
-            print("Total tokens: ", count_tokens(messages))
+            print("Total tokens: ", count_tokens(str(messages)))
             print(messages)
 
     # GPT에 검색된 문서를 컨텍스트로 제공하여 답변 생성
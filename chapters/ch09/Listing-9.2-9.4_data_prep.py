@@ -3,8 +3,9 @@
 # - 데이터 형식 오류, 메시지 구조, 토큰 수 분포 등을 체크합니다.
 # - tiktoken을 사용한 토큰 카운팅 및 비용 추정 포함
 
+import hashlib
 import json
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 
 import numpy as np
 import tiktoken  # for token counting
@@ -13,6 +14,20 @@ data_file = "data/emoji_ft_train.jsonl"
 
 encoding = tiktoken.get_encoding("cl100k_base")
 
+# the same system prompt is repeated in every training example, so its count is looked up by a hash of the text
+token_counts = OrderedDict()
+
+def num_tokens_from_string(value):
+    key = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+    num_tokens = len(encoding.encode(value))
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
+    return num_tokens
+
 # Pricing and default n_epochs estimate
 MAX_TOKENS = 4096
 
@@ -60,7 +75,7 @@ def num_tokens_from_messages(messages, tokens_per_message=3, tokens_per_name=1):
     for message in messages:
         num_tokens += tokens_per_message
         for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
+            num_tokens += num_tokens_from_string(value)
             if key == "name":
                 num_tokens += tokens_per_name
     num_tokens += 3
@@ -72,7 +87,7 @@ def num_assistant_tokens_from_messages(messages):
     num_tokens = 0
     for message in messages:
         if message["role"] == "assistant":
-            num_tokens += len(encoding.encode(message["content"]))
+            num_tokens += num_tokens_from_string(message["content"])
     return num_tokens
 
 # Print the distribution of values
@@ -177,8 +192,6 @@ if __name__ == "__main__":
     print("-" * 50)
 
     # Now run additional checks for validate the token counts and the number of examples per label
-    encoding = tiktoken.get_encoding("cl100k_base")
-
     files = [
         "data/emoji_ft_train.jsonl",
         "data/emoji_ft_validation.jsonl",
@@ -1,78 +1,48 @@
-import datetime
 import json
 import mimetypes
 
-import yaml
-from azure.core.credentials import AzureKeyCredential
-from azure.identity import DefaultAzureCredential
-from azure.search.documents import SearchClient
 from azure.storage.blob import BlobServiceClient
-from backend.approaches.approach import Approach
-from backend.approaches.approach_classifier import ApproachClassifier
-from backend.approaches.chatstructured import ChatStructuredApproach
-from backend.approaches.chatunstructured import ChatUnstructuredApproach
-from backend.cognition.openai_client import OpenAIClient
-from backend.config import DefaultConfig
-from backend.contracts.chat_response import Answer, ApproachType, ChatResponse
-from backend.contracts.error import (
-    ContentFilterException,
-    OutOfScopeException,
-    UnauthorizedDBAccessException,
-)
-from backend.contracts.search_settings import SearchSettings
-from backend.data_client.data_client import DataClient
-from backend.utilities.access_management import AccessManager
-from common.contracts.chat_session import (
-    ChatSession,
-    DialogClassification,
-    ParticipantType,
+from backend.app_common import (
+    access_manager,
+    answer_cache,
+    approach_classifier,
+    bot_config_loader,
+    chat_approaches,
+    chat_session_writer,
+    check_user_allowed,
+    data_client,
+    discard_speculation,
+    format_server_sent_event,
+    get_answer_cache_keys,
+    get_canned_response,
+    get_error_response,
+    get_history,
+    get_question_classification,
+    get_search_settings_item,
+    get_simplified_history,
+    get_turn_dialogs,
+    logger,
+    openai_client,
+    speculative_retrieval,
 )
-from flask import Flask, jsonify, request
-
-# Use the current user identity to authenticate with Azure OpenAI, Cognitive Search and Blob Storage (no secrets needed,
-# just use 'az login' locally, and managed identity when deployed on Azure). If you need to use keys, use separate AzureKeyCredential instances with the
-# keys for each service
-# If you encounter a blocking error during a DefaultAzureCredntial resolution, you can exclude the problematic credential by using a parameter (ex. exclude_shared_token_cache_credential=True)
-DefaultConfig.initialize()
-azure_credential = DefaultAzureCredential()
-search_credential = AzureKeyCredential(DefaultConfig.AZURE_SEARCH_KEY)
-
-openai_client = OpenAIClient()
-
-# Set up clients for Cognitive Search and Storage
-search_client = SearchClient(
-    endpoint=f"https://{DefaultConfig.AZURE_SEARCH_SERVICE}.search.windows.net",
-    index_name=DefaultConfig.AZURE_SEARCH_INDEX,
-    credential=search_credential,
-)
-
+from backend.approaches.chatunstructured import Retrieval
+from backend.approaches.speculative_retrieval import Speculation
+from backend.config import DefaultConfig
+from backend.contracts.chat_response import ApproachType, ChatResponse
+from backend.utilities.answer_cache import AnswerCacheKey, CachedAnswer
+from backend.utilities.bot_config import BotConfig
+from common.contracts.chat_session import ChatSession, DialogClassification
+from common.contracts.resource import ResourceProfile
+from common.contracts.user_profile import UserProfile
+from flask import Flask, Response, jsonify, request, stream_with_context
+from typing import List, Optional, Tuple
+
+# Set up the client for Storage, the other clients are shared with backend/async_app.py
 blob_client = BlobServiceClient.from_connection_string(
     DefaultConfig.AZURE_BLOB_CONNECTION_STRING
 )
 blob_container = blob_client.get_container_client(DefaultConfig.AZURE_STORAGE_CONTAINER)
 
-# get the logger that is already initialized
-logger = DefaultConfig.logger
-
-chat_approaches = {
-    ApproachType.unstructured.name: ChatUnstructuredApproach(
-        search_client,
-        DefaultConfig.KB_FIELDS_SOURCEPAGE,
-        DefaultConfig.KB_FIELDS_CONTENT,
-        logger,
-        search_threshold_percentage=DefaultConfig.SEARCH_THRESHOLD_PERCENTAGE,
-    ),
-    ApproachType.structured.name: ChatStructuredApproach(
-        DefaultConfig.SQL_CONNECTION_STRING, logger
-    ),
-}
-
-# initialize data client
-base_uri = DefaultConfig.DATA_SERVICE_URI
-data_client = DataClient(base_uri, logger)
-approach_classifier = ApproachClassifier(logger)
-access_manager = AccessManager()
-
 app = Flask(__name__)
 
 
@@ -117,13 +87,6 @@ def chat():
     if overrides:
         classification_override = overrides.get("classification_override", None)
 
-    # fetch user profile
-    user_profile = data_client.get_user_profile(user_id)
-
-    # check user access rules
-    allowed_resources = data_client.get_user_resources(user_id)
-    allowed_approaches = access_manager.get_allowed_approaches(allowed_resources)
-
     logger.set_conversation_and_dialog_ids(conversation_id, dialog_id)
     properties = logger.get_updated_properties(
         {"conversation_id": conversation_id, "dialog_id": dialog_id, "user_id": user_id}
@@ -131,142 +94,73 @@ def chat():
 
     logger.info(f"request: {json.dumps(request.json)}", extra=properties)
 
-    user_message = request.json.get("dialog")
+    (
+        user_profile,
+        allowed_resources,
+        allowed_approaches,
+        chat_session,
+    ) = load_chat_turn(user_id, conversation_id, properties)
 
-    chat_session: ChatSession
-    chat_session_exists = data_client.check_chat_session(user_id, conversation_id)
-    if not chat_session_exists:
-        chat_session = data_client.create_chat_session(user_id, conversation_id)
-        logger.info(
-            f"created new chat session for user {user_id} and session {conversation_id}",
-            extra=properties,
-        )
-    else:
-        chat_session = data_client.get_chat_session(user_id, conversation_id)
-        logger.info(
-            f"chat session for user {user_id} and session {conversation_id} already exists",
-            extra=properties,
-        )
+    user_message = request.json.get("dialog")
 
-    history = [
-        {
-            "participant_type": dialog.participant_type.value,
-            "utterance": dialog.utterance,
-            "question_type": dialog.classification.value,
-        }
-        for dialog in chat_session.conversation
-    ]
-    history.append(
-        {"participant_type": ParticipantType.user.value, "utterance": user_message}
-    )
+    history = get_history(chat_session, user_message)
 
-    bot_config = yaml.safe_load(open("backend/bot_config.yaml", "r"))
+    bot_config = bot_config_loader.get()
     question_classification = None
+    speculation = None
 
     try:
-
-        if classification_override:
-            approach_type = ApproachType(classification_override)
-        else:
-            approach_type = approach_classifier.run(history, bot_config, openai_client)
-
-        logger.info(f"question_type: {approach_type.name}", extra=properties)
-
-        if approach_type == ApproachType.chit_chat:
-            chit_chat_canned_response = "I'm sorry, but the question you've asked is outside my area of expertise. I'd be happy to help with any questions related to Microsoft Surface PCs and Laptops. Please feel free to ask about those, and I'll do my best to assist you!"
-            data_client.add_dialog_to_chat_session(
+        cache_keys = get_answer_cache_keys(
+            chat_session,
+            user_message,
+            allowed_resources,
+            allowed_approaches,
+            classification_override,
+            overrides or None,
+        )
+        cached_answer, utterance_embedding = get_cached_answer(
+            cache_keys, user_message, bot_config, properties
+        )
+        if cached_answer is not None:
+            add_turn_to_chat_session(
                 user_id,
                 conversation_id,
-                ParticipantType.user,
-                datetime.datetime.now(),
                 user_message,
-                DialogClassification.chit_chat,
-            )
-            logger.info(
-                f"added dialog to chat session for user {user_id} and session {conversation_id}",
-                extra=properties,
+                cached_answer.response,
+                get_question_classification(cached_answer.approach_type),
+                properties,
             )
+            return jsonify(cached_answer.response.to_item())
 
-            answer = Answer(formatted_answer=chit_chat_canned_response)
-            response = ChatResponse(answer=answer, classification=approach_type)
+        simplified_history = get_simplified_history(chat_session, user_message)
 
-            data_client.add_dialog_to_chat_session(
-                user_id,
-                conversation_id,
-                ParticipantType.assistant,
-                datetime.datetime.now(),
-                json.dumps(response.answer.to_item()),
-                DialogClassification.chit_chat,
-            )
-            logger.info(
-                f"added response {chit_chat_canned_response} to chat session for user {user_id} and session {conversation_id}",
-                extra=properties,
-            )
-
-            return jsonify(response.to_item())
+        approach_type, speculation = classify_question(
+            history,
+            simplified_history,
+            bot_config,
+            classification_override,
+            overrides or None,
+        )
 
-        elif approach_type == ApproachType.inappropriate:
+        logger.info(f"question_type: {approach_type.name}", extra=properties)
 
-            inappropiate_canned_response = "I'm sorry, but the question you've asked goes against our content safety policy due to harmful, offensive, or illegal content. I'd be happy to help with any questions related to Microsoft Surface PCs and Laptops. Please feel free to ask about those, and I'll do my best to assist you!"
+        canned_response = get_canned_response(approach_type)
+        if canned_response is not None:
             # TODO: Use DialogClassification.inappropiate once data service has been updated.
-            data_client.add_dialog_to_chat_session(
+            add_turn_to_chat_session(
                 user_id,
                 conversation_id,
-                ParticipantType.user,
-                datetime.datetime.now(),
                 user_message,
+                canned_response,
                 DialogClassification.chit_chat,
-            )
-            logger.info(
-                f"added dialog to chat session for user {user_id} and session {conversation_id}",
-                extra=properties,
-            )
-
-            answer = Answer(formatted_answer=inappropiate_canned_response)
-            response = ChatResponse(answer=answer, classification=approach_type)
-            # TODO: Use DialogClassification.inappropiate once data service has been updated.
-            data_client.add_dialog_to_chat_session(
-                user_id,
-                conversation_id,
-                ParticipantType.assistant,
-                datetime.datetime.now(),
-                json.dumps(response.answer.to_item()),
-                DialogClassification.chit_chat,
-            )
-            logger.info(
-                f"added response {inappropiate_canned_response} to chat session for user {user_id} and session {conversation_id}",
-                extra=properties,
+                properties,
             )
 
-            return jsonify(response.to_item())
+            return jsonify(canned_response.to_item())
 
-        # check if user is allowed to use the approach
-        user_allowed = access_manager.is_user_allowed(allowed_approaches, approach_type)
+        check_user_allowed(allowed_approaches, approach_type, user_profile)
 
-        if not user_allowed:
-            prohibited_resource = access_manager.map_approach_to_resource(approach_type)
-            raise Exception(
-                f"This query requires access to {prohibited_resource}\nUser: {user_profile.user_name} is not allowed to use this resource, please try another query or contact your administrator."
-            )
-
-        question_classification = (
-            DialogClassification.unstructured_query
-            if approach_type == ApproachType.unstructured
-            else DialogClassification.structured_query
-        )
-
-        # filtered_chat_session = data_client.filter_chat_session(chat_session, filter=question_classification)
-        filtered_chat_session = chat_session
-        simplified_history = [
-            {
-                "participant_type": dialog.participant_type.value,
-                "utterance": dialog.utterance,
-            }
-            for dialog in filtered_chat_session.conversation
-        ]
-        simplified_history.append(
-            {"participant_type": ParticipantType.user.value, "utterance": user_message}
-        )
+        question_classification = get_question_classification(approach_type)
 
         impl = chat_approaches.get(approach_type.name)
 
@@ -278,70 +172,347 @@ def chat():
             bot_config,
             openai_client,
             request.json.get("overrides") or None,
+            **use_speculation(
+                speculation, approach_type, bot_config, overrides or None
+            ),
         )
 
         # state store update
         if not response.error:
-            data_client.add_dialog_to_chat_session(
+            add_turn_to_chat_session(
                 user_id,
                 conversation_id,
-                ParticipantType.user,
-                datetime.datetime.now(),
                 user_message,
+                response,
                 question_classification,
+                properties,
             )
-            logger.info(
-                f"added dialog to chat session for user {user_id} and session {conversation_id}",
-                extra=properties,
+            cache_answer(
+                cache_keys, approach_type, response, utterance_embedding, properties
             )
-            data_client.add_dialog_to_chat_session(
-                user_id,
-                conversation_id,
-                ParticipantType.assistant,
-                datetime.datetime.now(),
-                json.dumps(response.answer.to_item()),
+
+        return jsonify(response.to_item())
+    except Exception as e:
+        response, status = get_error_response(
+            "/chat", e, allowed_approaches, question_classification, properties
+        )
+        return jsonify(response.to_item()), status
+    finally:
+        discard_speculation(speculation)
+
+
+# Same as /chat, but streams the answer as Server-Sent Events: "token" events carry the answer as it is generated,
+# followed by a single "response" event with the complete ChatResponse (or an "error" event).
+# The turn is added to the chat session once the stream has completed.
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    # try get conversation_id and dialog_id needed for logging
+    conversation_id = request.json.get(
+        "conversation_id", "no conversation_id found in request"
+    )
+    dialog_id = request.json.get("dialog_id", "no dialog_id found in request")
+    user_id = request.json.get("user_id", "no user_id found in request")
+    user_message = request.json.get("dialog")
+
+    classification_override = None
+    overrides = request.json.get("overrides", None)
+    if overrides:
+        classification_override = overrides.get("classification_override", None)
+
+    logger.set_conversation_and_dialog_ids(conversation_id, dialog_id)
+    properties = logger.get_updated_properties(
+        {"conversation_id": conversation_id, "dialog_id": dialog_id, "user_id": user_id}
+    )
+
+    logger.info(f"request: {json.dumps(request.json)}", extra=properties)
+
+    def generate():
+        allowed_approaches = []
+        question_classification = None
+        speculation = None
+
+        try:
+            (
+                user_profile,
+                allowed_resources,
+                allowed_approaches,
+                chat_session,
+            ) = load_chat_turn(user_id, conversation_id, properties)
+
+            history = get_history(chat_session, user_message)
+
+            bot_config = bot_config_loader.get()
+
+            cache_keys = get_answer_cache_keys(
+                chat_session,
+                user_message,
+                allowed_resources,
+                allowed_approaches,
+                classification_override,
+                overrides or None,
+            )
+            cached_answer, utterance_embedding = get_cached_answer(
+                cache_keys, user_message, bot_config, properties
+            )
+            if cached_answer is not None:
+                add_turn_to_chat_session(
+                    user_id,
+                    conversation_id,
+                    user_message,
+                    cached_answer.response,
+                    get_question_classification(cached_answer.approach_type),
+                    properties,
+                )
+                yield format_server_sent_event(
+                    "response", cached_answer.response.to_item()
+                )
+                return
+
+            simplified_history = get_simplified_history(chat_session, user_message)
+
+            approach_type, speculation = classify_question(
+                history,
+                simplified_history,
+                bot_config,
+                classification_override,
+                overrides or None,
+            )
+
+            logger.info(f"question_type: {approach_type.name}", extra=properties)
+
+            canned_response = get_canned_response(approach_type)
+            if canned_response is not None:
+                # TODO: Use DialogClassification.inappropiate once data service has been updated.
+                add_turn_to_chat_session(
+                    user_id,
+                    conversation_id,
+                    user_message,
+                    canned_response,
+                    DialogClassification.chit_chat,
+                    properties,
+                )
+                yield format_server_sent_event("response", canned_response.to_item())
+                return
+
+            check_user_allowed(allowed_approaches, approach_type, user_profile)
+
+            question_classification = get_question_classification(approach_type)
+
+            impl = chat_approaches.get(approach_type.name)
+
+            if not impl:
+                yield format_server_sent_event("error", {"error": "unknown approach"})
+                return
+
+            response = None
+            for item in impl.run_stream(
+                simplified_history,
+                bot_config,
+                openai_client,
+                overrides or None,
+                **use_speculation(
+                    speculation, approach_type, bot_config, overrides or None
+                ),
+            ):
+                if isinstance(item, ChatResponse):
+                    response = item
+                else:
+                    yield format_server_sent_event("token", {"content": item})
+
+            # state store update, once the whole answer is known
+            if not response.error:
+                add_turn_to_chat_session(
+                    user_id,
+                    conversation_id,
+                    user_message,
+                    response,
+                    question_classification,
+                    properties,
+                )
+                cache_answer(
+                    cache_keys,
+                    approach_type,
+                    response,
+                    utterance_embedding,
+                    properties,
+                )
+
+            yield format_server_sent_event("response", response.to_item())
+        except Exception as e:
+            response, status = get_error_response(
+                "/chat/stream",
+                e,
+                allowed_approaches,
                 question_classification,
+                properties,
             )
-            logger.info(
-                f"added response {response.answer.formatted_answer} to chat session for user {user_id} and session {conversation_id}",
+            yield format_server_sent_event(
+                "response" if status == 200 else "error", response.to_item()
+            )
+        finally:
+            discard_speculation(speculation)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        # keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def classify_question(
+    history: List[dict],
+    simplified_history: List[dict],
+    bot_config: BotConfig,
+    classification_override: Optional[str],
+    overrides: Optional[dict],
+) -> Tuple[ApproachType, Optional[Speculation]]:
+    if classification_override:
+        return ApproachType(classification_override), None
+
+    approach_type = approach_classifier.run_fast_path(history)
+    if approach_type is not None:
+        return approach_type, None
+
+    # only speculate when the classification needs a model round-trip
+    speculation = None
+    if speculative_retrieval is not None:
+        speculation = speculative_retrieval.start(
+            simplified_history, bot_config, openai_client, overrides
+        )
+    try:
+        approach_type = approach_classifier.run_model(
+            history, bot_config, openai_client
+        )
+    except Exception:
+        discard_speculation(speculation)
+        raise
+    return approach_type, speculation
+
+
+# Returns the keyword arguments handing the speculative retrieval to the unstructured approach, if it can be used.
+def use_speculation(
+    speculation: Optional[Speculation],
+    approach_type: ApproachType,
+    bot_config: BotConfig,
+    overrides: Optional[dict],
+) -> dict:
+    if speculation is None or approach_type != ApproachType.unstructured:
+        return {}
+    retrieval: Retrieval = speculative_retrieval.use(
+        speculation, bot_config, openai_client, overrides
+    )
+    return {"retrieval": retrieval}
+
+
+def load_chat_turn(
+    user_id: str, conversation_id: str, properties: dict
+) -> Tuple[UserProfile, List[ResourceProfile], List[ApproachType], ChatSession]:
+    # make sure the previous turn of this conversation has been persisted before it is read back
+    if chat_session_writer is not None:
+        flushed = chat_session_writer.wait_for_conversation(
+            user_id, conversation_id, DefaultConfig.CHAT_SESSION_WRITE_WAIT_SECONDS
+        )
+        if not flushed:
+            logger.warning(
+                f"previous dialogs of session {conversation_id} are still being persisted",
                 extra=properties,
             )
 
-        return jsonify(response.to_item())
-    except OutOfScopeException as e:
-        logger.exception(f"Exception in /chat: {str(e)}", extra=properties)
-        if access_manager.is_user_allowed(
-            allowed_approaches, e.suggested_classification
+    # prefetch user profile, user access rules and chat session in a single round-trip
+    chat_context = data_client.get_chat_context(
+        user_id, conversation_id, DefaultConfig.CHAT_HISTORY_LAST_N
+    )
+    allowed_approaches = access_manager.get_allowed_approaches(chat_context.resources)
+
+    # the data service creates the chat session on first use, so no separate existence check is needed
+    chat_session: ChatSession = chat_context.chat_session
+    logger.info(
+        f"loaded chat session for user {user_id} and session {conversation_id}",
+        extra=properties,
+    )
+
+    return (
+        chat_context.user_profile,
+        chat_context.resources,
+        allowed_approaches,
+        chat_session,
+    )
+
+
+# Looks the first turn up in the answer cache. Also returns the embedding of the question when the semantic tier
+# computed it, so that the answer can be cached with it on a miss. Cache errors are logged and treated as misses.
+def get_cached_answer(
+    cache_keys: List[AnswerCacheKey],
+    user_message: str,
+    bot_config: BotConfig,
+    properties: dict,
+) -> Tuple[Optional[CachedAnswer], Optional[List[float]]]:
+    if len(cache_keys) == 0:
+        return None, None
+
+    embedding = None
+    try:
+        cached_answer = answer_cache.get_exact(cache_keys)
+        if (
+            cached_answer is None
+            and len(answer_cache.get_semantic_keys(cache_keys)) > 0
         ):
-            response = ChatResponse(
-                answer=Answer(
-                    f"Error when querying knowledge-base: '{str(e.message)}'."
-                ),
-                show_retry=True,
-                suggested_classification=e.suggested_classification,
-                classification=question_classification,
-            )
-            return jsonify(response.to_item())
-        else:
-            response = ChatResponse(
-                answer=Answer(str(e.message)), classification=question_classification
+            response = openai_client.embeddings(
+                input=user_message,
+                openai_settings=bot_config.embeddings_settings,
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_EMBEDDINGS_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_EMBEDDINGS_API_KEY,
             )
-            return jsonify(response.to_item())
-    except UnauthorizedDBAccessException as e:
-        logger.exception(
-            f"UnauthorizedDBAccessExceptionException in /chat: {str(e)}",
+            embedding = response["data"][0]["embedding"]
+            cached_answer = answer_cache.get_semantic(cache_keys, embedding)
+    except Exception as e:
+        logger.warning(f"answer cache lookup failed: {e}", extra=properties)
+        return None, embedding
+
+    if cached_answer is None:
+        answer_cache.record_miss()
+    return cached_answer, embedding
+
+
+def cache_answer(
+    cache_keys: List[AnswerCacheKey],
+    approach_type: ApproachType,
+    response: ChatResponse,
+    embedding: Optional[List[float]],
+    properties: dict,
+):
+    key = next((key for key in cache_keys if key.approach_type == approach_type), None)
+    if key is None:
+        return
+    try:
+        answer_cache.set(key, response, embedding)
+    except Exception as e:
+        logger.warning(f"answer cache update failed: {e}", extra=properties)
+
+
+def add_turn_to_chat_session(
+    user_id: str,
+    conversation_id: str,
+    user_message: str,
+    response: ChatResponse,
+    classification: DialogClassification,
+    properties: dict,
+):
+    dialogs = get_turn_dialogs(user_message, response, classification)
+    if chat_session_writer is not None:
+        chat_session_writer.enqueue(user_id, conversation_id, dialogs, properties)
+        logger.info(
+            f"queued dialog and response {response.answer.formatted_answer} for chat session for user {user_id} and session {conversation_id}",
             extra=properties,
         )
-        response = ChatResponse(answer=Answer(), error=str(e.message))
-        return jsonify(response.to_item()), 403
-    except ContentFilterException as e:
-        logger.exception(f"ContentFilterException in /chat: {str(e)}", extra=properties)
-        response = ChatResponse(answer=Answer(), error=str(e.message))
-        return jsonify(response.to_item()), 400
-    except Exception as e:
-        logger.exception(f"Exception in /chat: {e}", extra=properties)
-        response = ChatResponse(answer=Answer(), error=str(e), show_retry=True)
-        return jsonify(response.to_item()), 500
+        return
+
+    data_client.add_dialogs_to_chat_session(user_id, conversation_id, dialogs, last_n=0)
+    logger.info(
+        f"added dialog and response {response.answer.formatted_answer} to chat session for user {user_id} and session {conversation_id}",
+        extra=properties,
+    )
 
 
 @app.route("/user-profiles", methods=["GET"])
@@ -362,6 +533,12 @@ def clear_chat_session(user_id: str, conversation_id: str):
     )
 
     try:
+        # dialogs still queued for the conversation must not be appended to the cleared session
+        if chat_session_writer is not None:
+            chat_session_writer.discard_conversation(user_id, conversation_id)
+            chat_session_writer.wait_for_conversation(
+                user_id, conversation_id, DefaultConfig.CHAT_SESSION_WRITE_WAIT_SECONDS
+            )
         data_client.clear_chat_session(user_id, conversation_id)
         logger.info(f"cleared chat session.", extra=properties)
         return jsonify({"message": "cleared chat session"})
@@ -375,20 +552,7 @@ def clear_chat_session(user_id: str, conversation_id: str):
 @app.route("/search-settings", methods=["GET"])
 def get_search_settings():
     try:
-        skip_vectorization_str = DefaultConfig.SEARCH_SKIP_VECTORIZATION
-        vectorization_enabled = (
-            True
-            if skip_vectorization_str.lower() == "false"
-            else False
-            if skip_vectorization_str.lower() == "true"
-            else None
-        )
-        if vectorization_enabled is None:
-            raise Exception(
-                f"Invalid value for SEARCH_SKIP_VECTORIZATION: {skip_vectorization_str}. Must be either 'true' or 'false'"
-            )
-        search_settings = SearchSettings(vectorization_enabled)
-        return jsonify(search_settings.to_item())
+        return jsonify(get_search_settings_item())
     except Exception as e:
         logger.exception(f"Exception in /search-settings: {e}")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,330 @@
+import datetime
+import json
+
+from azure.core.credentials import AzureKeyCredential
+from azure.identity import DefaultAzureCredential
+from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
+from backend.approaches.approach_classifier import (
+    ApproachClassifier,
+    load_fast_path_classifier,
+)
+from backend.approaches.chatstructured import ChatStructuredApproach
+from backend.approaches.chatunstructured import ChatUnstructuredApproach
+from backend.approaches.speculative_retrieval import Speculation, SpeculativeRetrieval
+from backend.cognition.deployment_pool import load_deployment_pools
+from backend.cognition.openai_client import OpenAIClient
+from backend.config import DefaultConfig
+from backend.contracts.chat_response import (
+    CHIT_CHAT_CANNED_RESPONSE,
+    INAPPROPRIATE_CANNED_RESPONSE,
+    Answer,
+    ApproachType,
+    ChatResponse,
+)
+from backend.contracts.error import (
+    ContentFilterException,
+    DeploymentUnavailableException,
+    OutOfScopeException,
+    UnauthorizedDBAccessException,
+)
+from backend.contracts.search_settings import SearchSettings
+from backend.data_client.chat_session_writer import ChatSessionWriter
+from backend.data_client.data_client import DataClient
+from backend.utilities.access_management import AccessManager
+from backend.utilities.answer_cache import AnswerCacheKey, load_answer_cache
+from backend.utilities.bot_config import BotConfigLoader
+from common.contracts.chat_session import (
+    ChatSession,
+    Dialog,
+    DialogClassification,
+    ParticipantType,
+)
+from common.contracts.resource import ResourceProfile
+from common.contracts.user_profile import UserProfile
+from common.utilities.embedding_cache import EmbeddingCache
+from typing import List, Optional, Tuple
+
+# Clients, approaches and helpers shared by the Flask app (backend/app.py) and its asyncio-native variant
+# (backend/async_app.py). The apps only add their routes, the blob storage client and the blocking or awaited
+# calls of the /chat flow on top of this module.
+
+# Use the current user identity to authenticate with Azure OpenAI, Cognitive Search and Blob Storage (no secrets needed,
+# just use 'az login' locally, and managed identity when deployed on Azure). If you need to use keys, use separate AzureKeyCredential instances with the
+# keys for each service
+# If you encounter a blocking error during a DefaultAzureCredntial resolution, you can exclude the problematic credential by using a parameter (ex. exclude_shared_token_cache_credential=True)
+DefaultConfig.initialize()
+azure_credential = DefaultAzureCredential()
+search_credential = AzureKeyCredential(DefaultConfig.AZURE_SEARCH_KEY)
+
+openai_client = OpenAIClient(
+    pool_size=DefaultConfig.OPENAI_POOL_SIZE,
+    deployment_pools=load_deployment_pools(DefaultConfig.logger),
+)
+
+# Set up clients for Cognitive Search. The async client does not open a connection until it is first used,
+# so it only costs anything in backend/async_app.py, which also closes it.
+search_client = SearchClient(
+    endpoint=f"https://{DefaultConfig.AZURE_SEARCH_SERVICE}.search.windows.net",
+    index_name=DefaultConfig.AZURE_SEARCH_INDEX,
+    credential=search_credential,
+)
+async_search_client = AsyncSearchClient(
+    endpoint=f"https://{DefaultConfig.AZURE_SEARCH_SERVICE}.search.windows.net",
+    index_name=DefaultConfig.AZURE_SEARCH_INDEX,
+    credential=search_credential,
+)
+
+# get the logger that is already initialized
+logger = DefaultConfig.logger
+
+chat_approaches = {
+    ApproachType.unstructured.name: ChatUnstructuredApproach(
+        search_client,
+        DefaultConfig.KB_FIELDS_SOURCEPAGE,
+        DefaultConfig.KB_FIELDS_CONTENT,
+        logger,
+        search_threshold_percentage=DefaultConfig.SEARCH_THRESHOLD_PERCENTAGE,
+        query_cache_max_size=DefaultConfig.SEARCH_QUERY_CACHE_MAX_SIZE,
+        query_cache_ttl_seconds=DefaultConfig.SEARCH_QUERY_CACHE_TTL_SECONDS,
+        search_cache_max_size=DefaultConfig.SEARCH_RESULTS_CACHE_MAX_SIZE,
+        search_cache_ttl_seconds=DefaultConfig.SEARCH_RESULTS_CACHE_TTL_SECONDS,
+        embedding_cache=EmbeddingCache(
+            DefaultConfig.EMBEDDING_CACHE_MAX_SIZE,
+            DefaultConfig.EMBEDDING_CACHE_DIRECTORY or None,
+        ),
+        async_search_client=async_search_client,
+    ),
+    ApproachType.structured.name: ChatStructuredApproach(
+        DefaultConfig.SQL_CONNECTION_STRING,
+        logger,
+        pool_size=DefaultConfig.SQL_POOL_SIZE,
+        query_timeout_seconds=DefaultConfig.SQL_QUERY_TIMEOUT_SECONDS,
+        max_rows=DefaultConfig.SQL_RESULT_MAX_ROWS,
+        max_bytes=DefaultConfig.SQL_RESULT_MAX_BYTES,
+        max_tokens=DefaultConfig.SQL_RESULT_MAX_TOKENS,
+        query_cache_max_size=DefaultConfig.SQL_QUERY_CACHE_MAX_SIZE,
+        query_cache_ttl_seconds=DefaultConfig.SQL_QUERY_CACHE_TTL_SECONDS,
+        result_cache_max_size=DefaultConfig.SQL_RESULT_CACHE_MAX_SIZE,
+        result_cache_ttl_seconds=DefaultConfig.SQL_RESULT_CACHE_TTL_SECONDS,
+        change_token_query=DefaultConfig.SQL_RESULT_CACHE_CHANGE_TOKEN_QUERY,
+        change_token_seconds=DefaultConfig.SQL_RESULT_CACHE_CHANGE_TOKEN_SECONDS,
+    ),
+}
+
+# initialize data client
+base_uri = DefaultConfig.DATA_SERVICE_URI
+data_client = DataClient(
+    base_uri,
+    logger,
+    pool_size=DefaultConfig.DATA_SERVICE_POOL_SIZE,
+    timeout_seconds=DefaultConfig.DATA_SERVICE_TIMEOUT_SECONDS,
+    user_cache_ttl_seconds=DefaultConfig.USER_CACHE_TTL_SECONDS,
+    user_cache_max_size=DefaultConfig.USER_CACHE_MAX_SIZE,
+)
+# dialogs are persisted by a background writer so the response does not wait on the data service
+chat_session_writer = (
+    ChatSessionWriter(
+        data_client, logger, DefaultConfig.CHAT_SESSION_FLUSH_TIMEOUT_SECONDS
+    )
+    if DefaultConfig.CHAT_SESSION_WRITE_BEHIND
+    else None
+)
+approach_classifier = ApproachClassifier(logger, load_fast_path_classifier(logger))
+# opt-in: generate the unstructured search query (and optionally search) while the question is classified
+speculative_retrieval = (
+    SpeculativeRetrieval(
+        chat_approaches[ApproachType.unstructured.name],
+        logger,
+        include_search=DefaultConfig.SPECULATIVE_SEARCH,
+    )
+    if DefaultConfig.SPECULATIVE_QUERY_GENERATION
+    else None
+)
+# bot_config.yaml is parsed once and only re-read when the file changes
+bot_config_loader = BotConfigLoader("backend/bot_config.yaml", logger)
+access_manager = AccessManager()
+answer_cache = load_answer_cache(access_manager, logger)
+
+
+def discard_speculation(speculation: Optional[Speculation]):
+    if speculation is not None:
+        speculative_retrieval.discard(speculation)
+
+
+def format_server_sent_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def get_question_classification(approach_type: ApproachType) -> DialogClassification:
+    return (
+        DialogClassification.unstructured_query
+        if approach_type == ApproachType.unstructured
+        else DialogClassification.structured_query
+    )
+
+
+def get_answer_cache_keys(
+    chat_session: ChatSession,
+    user_message: str,
+    allowed_resources: List[ResourceProfile],
+    allowed_approaches: List[ApproachType],
+    classification_override: Optional[str],
+    overrides: Optional[dict],
+) -> List[AnswerCacheKey]:
+    # only the first turn of a conversation is cached, later answers depend on the history
+    if answer_cache is None or len(chat_session.conversation) > 0:
+        return []
+
+    approach_types = (
+        [ApproachType(classification_override)]
+        if classification_override
+        else [ApproachType.unstructured, ApproachType.structured]
+    )
+    approach_types = [
+        approach_type
+        for approach_type in approach_types
+        if approach_type in [ApproachType.unstructured, ApproachType.structured]
+        and access_manager.is_user_allowed(allowed_approaches, approach_type)
+    ]
+    return answer_cache.get_keys(
+        user_message, approach_types, allowed_resources, overrides
+    )
+
+
+def get_canned_response(approach_type: ApproachType) -> Optional[ChatResponse]:
+    if approach_type == ApproachType.chit_chat:
+        answer = Answer(formatted_answer=CHIT_CHAT_CANNED_RESPONSE)
+        return ChatResponse(answer=answer, classification=approach_type)
+    elif approach_type == ApproachType.inappropriate:
+        answer = Answer(formatted_answer=INAPPROPRIATE_CANNED_RESPONSE)
+        return ChatResponse(answer=answer, classification=approach_type)
+    return None
+
+
+def check_user_allowed(
+    allowed_approaches: List[ApproachType],
+    approach_type: ApproachType,
+    user_profile: UserProfile,
+):
+    # check if user is allowed to use the approach
+    user_allowed = access_manager.is_user_allowed(allowed_approaches, approach_type)
+
+    if not user_allowed:
+        prohibited_resource = access_manager.map_approach_to_resource(approach_type)
+        raise Exception(
+            f"This query requires access to {prohibited_resource}\nUser: {user_profile.user_name} is not allowed to use this resource, please try another query or contact your administrator."
+        )
+
+
+def get_history(chat_session: ChatSession, user_message: str) -> List[dict]:
+    history = [
+        {
+            "participant_type": dialog.participant_type.value,
+            "utterance": dialog.utterance,
+            "question_type": dialog.classification.value,
+        }
+        for dialog in chat_session.conversation
+    ]
+    history.append(
+        {"participant_type": ParticipantType.user.value, "utterance": user_message}
+    )
+    return history
+
+
+def get_simplified_history(chat_session: ChatSession, user_message: str) -> List[dict]:
+    # filtered_chat_session = data_client.filter_chat_session(chat_session, filter=question_classification)
+    filtered_chat_session = chat_session
+    simplified_history = [
+        {
+            "participant_type": dialog.participant_type.value,
+            "utterance": dialog.utterance,
+        }
+        for dialog in filtered_chat_session.conversation
+    ]
+    simplified_history.append(
+        {"participant_type": ParticipantType.user.value, "utterance": user_message}
+    )
+    return simplified_history
+
+
+def get_turn_dialogs(
+    user_message: str, response: ChatResponse, classification: DialogClassification
+) -> List[Dialog]:
+    # the user dialog and the assistant answer are appended together in a single request
+    now = datetime.datetime.now()
+    return [
+        Dialog(ParticipantType.user, user_message, now, classification),
+        Dialog(
+            ParticipantType.assistant,
+            json.dumps(response.answer.to_item()),
+            now,
+            classification,
+        ),
+    ]
+
+
+def get_error_response(
+    route: str,
+    e: Exception,
+    allowed_approaches: List[ApproachType],
+    question_classification: Optional[DialogClassification],
+    properties: dict,
+) -> Tuple[ChatResponse, int]:
+    if isinstance(e, OutOfScopeException):
+        logger.exception(f"Exception in {route}: {str(e)}", extra=properties)
+        if access_manager.is_user_allowed(
+            allowed_approaches, e.suggested_classification
+        ):
+            response = ChatResponse(
+                answer=Answer(
+                    f"Error when querying knowledge-base: '{str(e.message)}'."
+                ),
+                show_retry=True,
+                suggested_classification=e.suggested_classification,
+                classification=question_classification,
+            )
+            return response, 200
+        else:
+            response = ChatResponse(
+                answer=Answer(str(e.message)), classification=question_classification
+            )
+            return response, 200
+    elif isinstance(e, UnauthorizedDBAccessException):
+        logger.exception(
+            f"UnauthorizedDBAccessExceptionException in {route}: {str(e)}",
+            extra=properties,
+        )
+        response = ChatResponse(answer=Answer(), error=str(e.message))
+        return response, 403
+    elif isinstance(e, ContentFilterException):
+        logger.exception(f"ContentFilterException in {route}: {str(e)}", extra=properties)
+        response = ChatResponse(answer=Answer(), error=str(e.message))
+        return response, 400
+    elif isinstance(e, DeploymentUnavailableException):
+        # every deployment is throttled or failing, the user can retry once they recover
+        logger.exception(
+            f"DeploymentUnavailableException in {route}: {str(e)}", extra=properties
+        )
+        response = ChatResponse(answer=Answer(), error=str(e.message), show_retry=True)
+        return response, 503
+    else:
+        logger.exception(f"Exception in {route}: {e}", extra=properties)
+        response = ChatResponse(answer=Answer(), error=str(e), show_retry=True)
+        return response, 500
+
+
+def get_search_settings_item() -> dict:
+    skip_vectorization_str = DefaultConfig.SEARCH_SKIP_VECTORIZATION
+    vectorization_enabled = (
+        True
+        if skip_vectorization_str.lower() == "false"
+        else False
+        if skip_vectorization_str.lower() == "true"
+        else None
+    )
+    if vectorization_enabled is None:
+        raise Exception(
+            f"Invalid value for SEARCH_SKIP_VECTORIZATION: {skip_vectorization_str}. Must be either 'true' or 'false'"
+        )
+    return SearchSettings(vectorization_enabled).to_item()
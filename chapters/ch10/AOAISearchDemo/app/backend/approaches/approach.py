@@ -1,7 +1,31 @@
 from backend.cognition.openai_client import OpenAIClient
 from backend.contracts.chat_response import ChatResponse
-from typing import Dict, List, Optional
+from backend.utilities.bot_config import BotConfig
+from common.utilities.ttl_cache import TTLCache
+from typing import Any, AsyncIterator, Dict, Hashable, Iterator, List, Optional, Union
 
 class Approach:
-    def run(self, history: List[Dict[str, str]], bot_config: dict, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> ChatResponse:
+    def run(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> ChatResponse:
         raise NotImplementedError
+
+    async def arun(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> ChatResponse:
+        raise NotImplementedError
+
+    # Yields the tokens of the final answer as they are generated, followed by the complete ChatResponse as the last item.
+    # Approaches that cannot stream only yield the ChatResponse of run.
+    def run_stream(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> Iterator[Union[str, ChatResponse]]:
+        yield self.run(history, bot_config, openai_client, overrides)
+
+    async def arun_stream(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> AsyncIterator[Union[str, ChatResponse]]:
+        yield await self.arun(history, bot_config, openai_client, overrides)
+
+    # Looks the key up in one of the caches of the approach, logging whether it hit along with the cache statistics.
+    def get_cached(self, name: str, cache: TTLCache, key: Hashable) -> Optional[Any]:
+        if not cache.enabled:
+            return None
+        value = cache.get(key)
+        addl_dimensions = {f"{name}_cache_hit": value is not None}
+        addl_dimensions.update({f"{name}_cache_{stat}": stat_value for stat, stat_value in cache.get_stats().items()})
+        addl_properties = self.logger.get_updated_properties(addl_dimensions)
+        self.logger.info(f"{name} cache {'hit' if value is not None else 'miss'}", extra=addl_properties)
+        return value
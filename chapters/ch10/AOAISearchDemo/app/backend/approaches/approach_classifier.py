@@ -1,28 +1,120 @@
-from textwrap import dedent
-from typing import List
+from typing import List, Optional
 
 import openai
 from backend.approaches.approach import Approach
+from backend.approaches.fast_path_classifier import FastPathClassifier
 from backend.cognition.openai_client import OpenAIClient
-from backend.cognition.openai_settings import ChatCompletionsSettings
 from backend.config import DefaultConfig
 from backend.contracts.chat_response import ApproachType
+from backend.utilities.bot_config import BotConfig
 from common.contracts.chat_session import DialogClassification
 from common.logging.log_helper import CustomLogger
 
 
+def load_fast_path_classifier(logger: CustomLogger) -> Optional[FastPathClassifier]:
+    if not DefaultConfig.CLASSIFIER_FAST_PATH_ENABLED:
+        return None
+
+    logger.info("approach classifier fast path enabled for greetings and continuations")
+    return FastPathClassifier()
+
+
 class ApproachClassifier(Approach):
-    def __init__(self, logger: CustomLogger):
+    def __init__(
+        self, logger: CustomLogger, fast_path: Optional[FastPathClassifier] = None
+    ):
         self.logger = logger
+        # answers obvious utterances locally, everything else is classified by the LLM
+        self.fast_path = fast_path
 
     def run(
-        self, history: List[str], bot_config, openai_client: OpenAIClient
+        self,
+        history: List[str],
+        bot_config: BotConfig,
+        openai_client: OpenAIClient,
     ) -> ApproachType:
+        fast_path_classification = self.run_fast_path(history)
+        if fast_path_classification is not None:
+            return fast_path_classification
+
+        return self.run_model(history, bot_config, openai_client)
+
+    def run_model(
+        self,
+        history: List[str],
+        bot_config: BotConfig,
+        openai_client: OpenAIClient,
+    ) -> ApproachType:
+        message_list = self.build_message_list(history, bot_config)
+        try:
+            response = openai_client.chat_completions(
+                messages=message_list,
+                openai_settings=bot_config.get_chat_completions_settings(
+                    "approach_classifier"
+                ),
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_CLASSIFIER_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_CLASSIFIER_API_KEY,
+            )
+        except openai.error.InvalidRequestError as e:
+            self.logger.error(f"OpenAI API Error: {e}", exc_info=True)
+            raise e
+
+        return self.parse_classification_response(history, response)
+
+    async def arun(
+        self,
+        history: List[str],
+        bot_config: BotConfig,
+        openai_client: OpenAIClient,
+    ) -> ApproachType:
+        fast_path_classification = self.run_fast_path(history)
+        if fast_path_classification is not None:
+            return fast_path_classification
+
+        return await self.arun_model(history, bot_config, openai_client)
+
+    async def arun_model(
+        self,
+        history: List[str],
+        bot_config: BotConfig,
+        openai_client: OpenAIClient,
+    ) -> ApproachType:
+        message_list = self.build_message_list(history, bot_config)
+        try:
+            response = await openai_client.achat_completions(
+                messages=message_list,
+                openai_settings=bot_config.get_chat_completions_settings(
+                    "approach_classifier"
+                ),
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_CLASSIFIER_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_CLASSIFIER_API_KEY,
+            )
+        except openai.error.InvalidRequestError as e:
+            self.logger.error(f"OpenAI API Error: {e}", exc_info=True)
+            raise e
+
+        return self.parse_classification_response(history, response)
 
+    def run_fast_path(self, history: List[str]) -> Optional[ApproachType]:
+        if self.fast_path is None:
+            return None
+
+        classification = self.fast_path.classify(history[-1]["utterance"])
+        if classification is None:
+            return None
+
+        addl_properties = self.logger.get_updated_properties({"fast_path": True})
+        self.logger.info(
+            f'Classification Prompt:{history[-1]["utterance"]}, fast path response: {classification}',
+            extra=addl_properties,
+        )
+        return self.map_classification(history, classification)
+
+    def build_message_list(self, history: List[str], bot_config: BotConfig) -> List[dict]:
         message_list = [
             {
                 "role": "system",
-                "content": dedent(bot_config["approach_classifier"]["system_prompt"]),
+                "content": bot_config.get_system_prompt("approach_classifier"),
             }
         ]
 
@@ -58,25 +150,23 @@ class ApproachClassifier(Approach):
                     )
         else:
             message_list.append({"role": "user", "content": history[-1]["utterance"]})
-        try:
-            response = openai_client.chat_completions(
-                messages=message_list,
-                openai_settings=ChatCompletionsSettings(
-                    **bot_config["approach_classifier"]["openai_settings"]
-                ),
-                api_base=f"https://{DefaultConfig.AZURE_OPENAI_CLASSIFIER_SERVICE}.openai.azure.com",
-                api_key=DefaultConfig.AZURE_OPENAI_CLASSIFIER_API_KEY,
-            )
-        except openai.error.InvalidRequestError as e:
-            self.logger.error(f"OpenAI API Error: {e}", exc_info=True)
-            raise e
 
+        return message_list
+
+    def parse_classification_response(
+        self, history: List[str], response
+    ) -> ApproachType:
         classification_response: str = response["choices"][0]["message"]["content"]
         self.log_aoai_response_details(
             f'Classification Prompt:{history[-1]["utterance"]}',
             f"Response: {classification_response}",
             response,
         )
+        return self.map_classification(history, classification_response)
+
+    def map_classification(
+        self, history: List[str], classification_response: str
+    ) -> ApproachType:
         if classification_response == "1":
             return ApproachType.structured
         elif classification_response == "2":
@@ -1,18 +1,24 @@
+import asyncio
+import hashlib
 import json
-import pyodbc
 import re
-import pandas as pd
+import threading
+import time
 from backend.approaches.approach import Approach
 from backend.cognition.openai_client import OpenAIClient
-from backend.cognition.openai_settings import ChatCompletionsSettings
 from backend.config import DefaultConfig
 from backend.contracts.chat_response import Answer, ApproachType, ChatResponse
 from backend.contracts.error import OutOfScopeException, UnauthorizedDBAccessException
+from backend.cognition.openai_settings import ChatCompletionsSettings
+from backend.utilities.bot_config import BotConfig
 from backend.utilities.openai_utils import generate_history_messages
 from backend.utilities.prompt_composer_utils import trim_history, compute_tokens
+from backend.utilities.sql_connection_pool import DATABASE_ERRORS, SqlConnectionPool
+from backend.utilities.text import normalize_utterance
+from backend.utilities.tokenizer import get_tokenizer
 from common.logging.log_helper import CustomLogger
-from textwrap import dedent
-from typing import Dict, List, Optional
+from common.utilities.ttl_cache import TTLCache
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union
 
 # Structured information retrieval, using Azure SQL DB and Azure OpenAI APIs directly. It first uses OpenAI to generate
 # a SQL query to retrieve data from a SQL database using dialog from the user. Then, after retrieving the data,
@@ -21,20 +27,184 @@ from typing import Dict, List, Optional
 
 
 class ChatStructuredApproach(Approach):
-    def __init__(self, sql_connection_string: str, logger: CustomLogger):
+    UNAUTHORIZED_ERROR_MESSAGES = ["I am not authorized to make changes to the data"]
+
+    def __init__(self, sql_connection_string: str, logger: CustomLogger, pool_size: int = 10, query_timeout_seconds: int = 30,
+                 max_rows: int = 500, max_bytes: int = 1048576, max_tokens: int = 3000, fetch_size: int = 100, query_cache_max_size: int = 0,
+                 query_cache_ttl_seconds: float = 0, result_cache_max_size: int = 0, result_cache_ttl_seconds: float = 0,
+                 change_token_query: str = "", change_token_seconds: float = 5):
         self.sql_connection_string = sql_connection_string
         self.logger = logger
+        self.connection_pool = SqlConnectionPool(sql_connection_string, pool_size, query_timeout_seconds)
+        # the generated query is not trusted to be selective: at most max_rows rows or max_bytes of values are fetched,
+        # and at most max_tokens tokens of them are passed to the answer generation prompt
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_tokens = max_tokens
+        self.fetch_size = fetch_size
+        # repeated questions reuse the SQL query generated for the same history window, and repeated SQL queries reuse
+        # the result read at the same change token of the database
+        self.sql_query_cache: TTLCache[str] = TTLCache(query_cache_max_size, query_cache_ttl_seconds)
+        self.sql_result_cache: TTLCache[str] = TTLCache(result_cache_max_size, result_cache_ttl_seconds)
+        # e.g. SELECT CAST(@@DBTS AS BIGINT) when the tables have a rowversion column, or
+        # SELECT CHANGE_TRACKING_CURRENT_VERSION() when change tracking is enabled; without it results only expire with their TTL
+        self.change_token_query = change_token_query
+        self.change_token_seconds = change_token_seconds
+        self._change_token: Optional[str] = None
+        self._change_token_expires_at = 0.0
+        self._change_token_lock = threading.Lock()
+
+    def run(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> any:
+        # STEP 1: Generate an SQL query using the chat history
+        answer = Answer()
+        answer.query = self.generate_sql_query(history, bot_config, openai_client)
+
+        # STEP 2: Run generated SQL query against the database
+        sql_result = self.run_sql_query(answer.query)
+
+        # STEP 3: Format the SQL query and SQL result into a natural language response
+        if sql_result is not None:
+            answer.query_result = sql_result
+            message_list = self.build_answer_generation_messages(history, bot_config, sql_result)
+
+            sql_result_to_nl_response = openai_client.chat_completions(
+                messages=message_list,
+                openai_settings=bot_config.get_chat_completions_settings("structured_final_answer_generation"),
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+            )
+
+            answer.formatted_answer = self.parse_formatted_answer(message_list, sql_result_to_nl_response)
+
+        return ChatResponse(classification=ApproachType.structured, answer=answer)
+
+    async def arun(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> any:
+        # STEP 1: Generate an SQL query using the chat history
+        answer = Answer()
+        answer.query = await self.agenerate_sql_query(history, bot_config, openai_client)
+
+        # STEP 2: Run generated SQL query against the database. pyodbc is blocking, so it runs on a worker thread.
+        sql_result = await asyncio.to_thread(self.run_sql_query, answer.query)
+
+        # STEP 3: Format the SQL query and SQL result into a natural language response
+        if sql_result is not None:
+            answer.query_result = sql_result
+            message_list = self.build_answer_generation_messages(history, bot_config, sql_result)
 
-    def run(self, history: List[Dict[str, str]], bot_config: dict, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> any:        
-        unauthorized_error_messages = ["I am not authorized to make changes to the data"]
+            sql_result_to_nl_response = await openai_client.achat_completions(
+                messages=message_list,
+                openai_settings=bot_config.get_chat_completions_settings("structured_final_answer_generation"),
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+            )
 
+            answer.formatted_answer = self.parse_formatted_answer(message_list, sql_result_to_nl_response)
+
+        return ChatResponse(classification=ApproachType.structured, answer=answer)
+
+    def run_stream(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> Iterator[Union[str, ChatResponse]]:
         # STEP 1: Generate an SQL query using the chat history
+        answer = Answer()
+        answer.query = self.generate_sql_query(history, bot_config, openai_client)
+
+        # STEP 2: Run generated SQL query against the database
+        sql_result = self.run_sql_query(answer.query)
+
+        # STEP 3: Stream the SQL query and SQL result formatted into a natural language response
+        if sql_result is not None:
+            answer.query_result = sql_result
+            message_list = self.build_answer_generation_messages(history, bot_config, sql_result)
+
+            start = time.perf_counter()
+            formatted_answer = ""
+            for content in openai_client.chat_completions_stream(
+                messages=message_list,
+                openai_settings=bot_config.get_chat_completions_settings("structured_final_answer_generation"),
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+            ):
+                formatted_answer += content
+                yield content
+
+            self.log_aoai_stream_details(json.dumps(message_list), json.dumps(formatted_answer), formatted_answer, (time.perf_counter() - start) * 1000)
+            answer.formatted_answer = formatted_answer
+
+        yield ChatResponse(classification=ApproachType.structured, answer=answer)
+
+    async def arun_stream(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> AsyncIterator[Union[str, ChatResponse]]:
+        # STEP 1: Generate an SQL query using the chat history
+        answer = Answer()
+        answer.query = await self.agenerate_sql_query(history, bot_config, openai_client)
+
+        # STEP 2: Run generated SQL query against the database. pyodbc is blocking, so it runs on a worker thread.
+        sql_result = await asyncio.to_thread(self.run_sql_query, answer.query)
+
+        # STEP 3: Stream the SQL query and SQL result formatted into a natural language response
+        if sql_result is not None:
+            answer.query_result = sql_result
+            message_list = self.build_answer_generation_messages(history, bot_config, sql_result)
+
+            start = time.perf_counter()
+            formatted_answer = ""
+            async for content in openai_client.achat_completions_stream(
+                messages=message_list,
+                openai_settings=bot_config.get_chat_completions_settings("structured_final_answer_generation"),
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+            ):
+                formatted_answer += content
+                yield content
+
+            self.log_aoai_stream_details(json.dumps(message_list), json.dumps(formatted_answer), formatted_answer, (time.perf_counter() - start) * 1000)
+            answer.formatted_answer = formatted_answer
+
+        yield ChatResponse(classification=ApproachType.structured, answer=answer)
+
+    def generate_sql_query(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient) -> str:
+        message_list = self.build_nl_to_sql_messages(history, bot_config)
+        openai_settings = bot_config.get_chat_completions_settings("structured_query_nl_to_sql")
+        cache_key = self.get_sql_query_cache_key(history, message_list, openai_settings)
+        sql_query = self.get_cached("sql_query", self.sql_query_cache, cache_key)
+        if sql_query is not None:
+            return sql_query
+
+        nl_to_sql_response = openai_client.chat_completions(
+            messages=message_list,
+            openai_settings=openai_settings,
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        )
+
+        sql_query = self.parse_generated_sql_query(message_list, nl_to_sql_response)
+        self.sql_query_cache.set(cache_key, sql_query)
+        return sql_query
+
+    async def agenerate_sql_query(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient) -> str:
+        message_list = self.build_nl_to_sql_messages(history, bot_config)
+        openai_settings = bot_config.get_chat_completions_settings("structured_query_nl_to_sql")
+        cache_key = self.get_sql_query_cache_key(history, message_list, openai_settings)
+        sql_query = self.get_cached("sql_query", self.sql_query_cache, cache_key)
+        if sql_query is not None:
+            return sql_query
+
+        nl_to_sql_response = await openai_client.achat_completions(
+            messages=message_list,
+            openai_settings=openai_settings,
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        )
+
+        sql_query = self.parse_generated_sql_query(message_list, nl_to_sql_response)
+        self.sql_query_cache.set(cache_key, sql_query)
+        return sql_query
+
+    def build_nl_to_sql_messages(self, history: List[Dict[str, str]], bot_config: BotConfig) -> List[Dict[str, str]]:
         message_list = [{
             "role": "system",
-            "content": dedent(bot_config["structured_query_nl_to_sql"]["system_prompt"])
+            "content": bot_config.get_system_prompt("structured_query_nl_to_sql")
                 }
         ]
-        
+
         if bot_config["structured_query_nl_to_sql"]["history"]["include"]:
             chat_history = generate_history_messages(
                 history[:-1], bot_config["structured_query_nl_to_sql"]["history"])
@@ -45,66 +215,158 @@ class ChatStructuredApproach(Approach):
             message_list.extend(chat_history)
 
         message_list.append({"role": "user", "content": history[-1]['utterance'] + " SQL Code: "})
+        return message_list
 
-        nl_to_sql_response = openai_client.chat_completions(
-            messages=message_list,
-            openai_settings=ChatCompletionsSettings(**bot_config["structured_query_nl_to_sql"]["openai_settings"]),
-            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
-            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
-        )
-
+    def parse_generated_sql_query(self, message_list: List[Dict[str, str]], nl_to_sql_response) -> str:
         generated_sql_query = nl_to_sql_response['choices'][0]['message']['content']
         self.log_aoai_response_details(json.dumps(message_list), generated_sql_query, nl_to_sql_response)
-        answer = Answer()
-
-        # STEP 2: Run generated SQL query against the database
-        sql_result = None
 
         if "ERROR:" in generated_sql_query:
-            if any(message in generated_sql_query for message in unauthorized_error_messages):
+            if any(message in generated_sql_query for message in self.UNAUTHORIZED_ERROR_MESSAGES):
                 raise UnauthorizedDBAccessException("Error: I am not allowed to make changes to the data.")
             m = re.search(r"ERROR:(.*?)\.", generated_sql_query)
             if m:
                 raise OutOfScopeException(message=m.group(1), suggested_classification=ApproachType.unstructured)
 
-        answer.query = generated_sql_query
+        return generated_sql_query
+
+    def run_sql_query(self, sql_query: str) -> Optional[str]:
+        change_token = self.get_change_token() if self.sql_result_cache.enabled else None
+        cache_key = self.get_sql_result_cache_key(sql_query, change_token)
+        if change_token is not None:
+            sql_result = self.get_cached("sql_result", self.sql_result_cache, cache_key)
+            if sql_result is not None:
+                return sql_result
+
         try:
-            with pyodbc.connect(self.sql_connection_string) as conn:
-                df = pd.read_sql(generated_sql_query, conn)
-                sql_result = str(df.to_string(index=False))
-        except pd.errors.DatabaseError as e:
-            raise OutOfScopeException(message=str(e), suggested_classification=ApproachType.unstructured)
+            with self.connection_pool.connection() as conn:
+                try:
+                    columns, rows, truncated = self.fetch_rows(conn, sql_query)
+                except DATABASE_ERRORS as e:
+                    raise OutOfScopeException(message=str(e), suggested_classification=ApproachType.unstructured)
+        except (OutOfScopeException, UnauthorizedDBAccessException):
+            raise
         except Exception as e:
             raise Exception(f"Unknown error when querying SQL database: {str(e)}")
 
-        # STEP 3: Format the SQL query and SQL result into a natural language response
-        if sql_result is not None:
-            answer.query_result = sql_result
-            message_list = [{
-                "role": "system",
-                "content": dedent(bot_config["structured_final_answer_generation"]["system_prompt"])
-            }]
+        sql_result = self.format_sql_result(columns, rows, truncated)
+        if change_token is not None:
+            self.sql_result_cache.set(cache_key, sql_result)
+        return sql_result
 
-            if bot_config["structured_final_answer_generation"]["history"]["include"]:
-                message_list.extend(generate_history_messages(history[:-1], bot_config["structured_final_answer_generation"]["history"]))
+    """
+    Returns the change token of the database, read with change_token_query at most every change_token_seconds, or an
+    empty token when no query is configured. Returns None when the token could not be read, so the result cache is
+    bypassed rather than serving results that may be stale.
+    """
+    def get_change_token(self) -> Optional[str]:
+        if not self.change_token_query:
+            return ""
+        with self._change_token_lock:
+            if time.monotonic() < self._change_token_expires_at:
+                return self._change_token
+            try:
+                with self.connection_pool.connection() as conn:
+                    cursor = conn.cursor()
+                    try:
+                        self._change_token = str(cursor.execute(self.change_token_query).fetchone()[0])
+                    finally:
+                        cursor.close()
+            except Exception as e:
+                self.logger.warning(f"Could not read the change token of the SQL database: {e}")
+                return None
+            self._change_token_expires_at = time.monotonic() + self.change_token_seconds
+            return self._change_token
 
-            message_list.append({"role": "user", "content": "Question: " + history[-1]['utterance'] + "\nAnswer:\n" + sql_result})
+    def get_sql_query_cache_key(self, history: List[Dict[str, str]], message_list: List[Dict[str, str]], openai_settings: ChatCompletionsSettings) -> str:
+        # the messages before the question hold the system prompt and the history window, the question itself is normalized
+        serialized = json.dumps([message_list[:-1], normalize_utterance(history[-1]['utterance']), vars(openai_settings)], sort_keys=True)
+        return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
 
-            sql_result_to_nl_response = openai_client.chat_completions(
-                messages=message_list,
-                openai_settings=ChatCompletionsSettings(**bot_config["structured_final_answer_generation"]["openai_settings"]),
-                api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
-                api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
-            )
+    def get_sql_result_cache_key(self, sql_query: str, change_token: Optional[str]) -> Tuple[str, Optional[str]]:
+        # entries read at an older change token are never matched again and age out of the cache
+        return (sql_query.strip().rstrip(";").strip(), change_token)
 
-            formatted_sql_result = sql_result_to_nl_response['choices'][0]['message']['content']
+    """
+    Streams the rows of the query result with fetchmany until the result, max_rows rows or max_bytes of values is
+    reached. Returns the column names, the rows and whether the result has more rows than were fetched.
+    A statement without a result set changes the data: it is refused, and rolled back when the connection is released.
+    """
+    def fetch_rows(self, conn, sql_query: str) -> Tuple[List[str], List[Tuple[Any, ...]], bool]:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(sql_query)
+            if cursor.description is None:
+                raise UnauthorizedDBAccessException("Error: I am not allowed to make changes to the data.")
+            columns = [column[0] for column in cursor.description]
+            rows: List[Tuple[Any, ...]] = []
+            size = 0
+            while len(rows) < self.max_rows:
+                batch = cursor.fetchmany(min(self.fetch_size, self.max_rows - len(rows)))
+                if len(batch) == 0:
+                    return columns, rows, False
+                for row in batch:
+                    rows.append(tuple(row))
+                    size += sum(len(self.format_value(value).encode("utf-8")) for value in row)
+                    if size >= self.max_bytes:
+                        return columns, rows, True
+            return columns, rows, cursor.fetchone() is not None
+        finally:
+            # also stops the server from sending the rest of a truncated result
+            cursor.close()
 
-            self.log_aoai_response_details(json.dumps(message_list), json.dumps(
-                formatted_sql_result), sql_result_to_nl_response)
+    """
+    Renders the rows as compact pipe-separated lines under a header line, keeping as many rows as fit in max_tokens,
+    followed by a notice when rows were left out so the answer does not present them as the complete result.
+    """
+    def format_sql_result(self, columns: List[str], rows: List[Tuple[Any, ...]], truncated: bool) -> str:
+        header = " | ".join(columns)
+        lines = [" | ".join(self.format_value(value) for value in row) for row in rows]
 
-            answer.formatted_answer = formatted_sql_result
+        budget = self.max_tokens - get_tokenizer().count(header)
+        kept = 0
+        for line_tokens in get_tokenizer().count_batch(["\n" + line for line in lines]):
+            if line_tokens > budget:
+                break
+            budget -= line_tokens
+            kept += 1
 
-        return ChatResponse(classification=ApproachType.structured, answer=answer)
+        result = "\n".join([header] + lines[:kept])
+        if len(rows) == 0:
+            result += "\n(no rows)"
+        elif truncated or kept < len(rows):
+            total_rows = f"more than {len(rows)}" if truncated else str(len(rows))
+            result += f"\n(truncated: showing the first {kept} of {total_rows} rows)"
+            self.logger.info(f"SQL result truncated to {kept} rows", extra=self.logger.get_updated_properties({
+                "sql_rows_fetched": len(rows),
+                "sql_rows_kept": kept,
+                "sql_result_truncated": truncated
+            }))
+        return result
+
+    @staticmethod
+    def format_value(value: Any) -> str:
+        return "NULL" if value is None else str(value)
+
+    def build_answer_generation_messages(self, history: List[Dict[str, str]], bot_config: BotConfig, sql_result: str) -> List[Dict[str, str]]:
+        message_list = [{
+            "role": "system",
+            "content": bot_config.get_system_prompt("structured_final_answer_generation")
+        }]
+
+        if bot_config["structured_final_answer_generation"]["history"]["include"]:
+            message_list.extend(generate_history_messages(history[:-1], bot_config["structured_final_answer_generation"]["history"]))
+
+        message_list.append({"role": "user", "content": "Question: " + history[-1]['utterance'] + "\nAnswer:\n" + sql_result})
+        return message_list
+
+    def parse_formatted_answer(self, message_list: List[Dict[str, str]], sql_result_to_nl_response) -> str:
+        formatted_sql_result = sql_result_to_nl_response['choices'][0]['message']['content']
+
+        self.log_aoai_response_details(json.dumps(message_list), json.dumps(
+            formatted_sql_result), sql_result_to_nl_response)
+
+        return formatted_sql_result
 
     def log_aoai_response_details(self, prompt, result, aoai_response):
         addl_dimensions = {
@@ -116,3 +378,14 @@ class ChatStructuredApproach(Approach):
         addl_properties = self.logger.get_updated_properties(addl_dimensions)
         self.logger.info(
             f"prompt: {prompt}, response: {result}", extra=addl_properties)
+
+    def log_aoai_stream_details(self, prompt, result, completion, response_ms):
+        # streamed completions carry no usage, so the completion tokens are counted locally
+        addl_dimensions = {
+            "completion_tokens": compute_tokens(completion),
+            "aoai_response[MS]": response_ms,
+            "streamed": True
+        }
+        addl_properties = self.logger.get_updated_properties(addl_dimensions)
+        self.logger.info(
+            f"prompt: {prompt}, response: {result}", extra=addl_properties)
@@ -1,35 +1,320 @@
+import hashlib
 import json
+import time
 from azure.search.documents import SearchClient
+from azure.search.documents.aio import SearchClient as AsyncSearchClient
 from azure.search.documents.models import QueryType
 from backend.approaches.approach import Approach
 from backend.cognition.openai_client import OpenAIClient
-from backend.cognition.openai_settings import ChatCompletionsSettings, EmbeddingsSettings
+from backend.cognition.openai_settings import ChatCompletionsSettings
 from backend.config import DefaultConfig
 from backend.contracts.chat_response import Answer, ApproachType, ChatResponse
 from backend.contracts.error import OutOfScopeException
+from backend.utilities.bot_config import BotConfig
 from backend.utilities.openai_utils import generate_history_messages, generate_system_prompt
-from backend.utilities.prompt_composer_utils import trim_history_and_index_combined
+from backend.utilities.prompt_composer_utils import compute_tokens, trim_history_and_index_combined
 from backend.utilities.text import nonewlines
 from common.logging.log_helper import CustomLogger
-from textwrap import dedent
-from typing import Dict, List, Optional
+from common.utilities.embedding_cache import EmbeddingCache
+from common.utilities.ttl_cache import TTLCache
+from typing import Any, AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-# Unstructured information retrieval, using the Cognitive Search and Azure OpenAI APIs directly. It first uses OpenAI to generate 
-# a search query to retrieve top documents from a Cognitive Search index using dialog from the user. Then, after retrieving the 
+class GeneratedSearchQuery(NamedTuple):
+    query_generation_messages: List[Dict[str, str]]
+    search_query: str
+    total_tokens: int
+
+class Retrieval(NamedTuple):
+    query_generation_messages: List[Dict[str, str]]
+    search_query: str
+    filtered_results: List[str]
+    # tokens spent generating the search query
+    total_tokens: int
+
+# Holds back the start of a streamed answer until it is clear whether it begins with the ERROR: marker,
+# so an out-of-scope answer is never partially sent to the client.
+class ErrorPrefixBuffer:
+    PREFIX = "ERROR:"
+
+    def __init__(self):
+        self.text = ""
+        self._released = 0
+
+    @property
+    def is_error(self) -> bool:
+        return self.text.startswith(self.PREFIX)
+
+    def push(self, content: str) -> str:
+        self.text += content
+        if self.is_error or self.PREFIX.startswith(self.text):
+            return ""
+        return self.flush()
+
+    # Releases whatever has been held back, unless the answer is an error
+    def flush(self) -> str:
+        if self.is_error:
+            return ""
+        released = self.text[self._released:]
+        self._released = len(self.text)
+        return released
+
+# Unstructured information retrieval, using the Cognitive Search and Azure OpenAI APIs directly. It first uses OpenAI to generate
+# a search query to retrieve top documents from a Cognitive Search index using dialog from the user. Then, after retrieving the
 # documents, it constructs a prompt injected with the retrieved documents. Finally, it uses this prompt to request OpenAI to generate a
 # completion (answer) that the user can understand.
 class ChatUnstructuredApproach(Approach):
-    def __init__(self, search_client: SearchClient, sourcepage_field: str, content_field: str, logger: CustomLogger, search_threshold_percentage: float = 50):
+    def __init__(self, search_client: SearchClient, sourcepage_field: str, content_field: str, logger: CustomLogger, search_threshold_percentage: float = 50,
+            async_search_client: Optional[AsyncSearchClient] = None, query_cache_max_size: int = 0, query_cache_ttl_seconds: float = 0,
+            search_cache_max_size: int = 0, search_cache_ttl_seconds: float = 0, embedding_cache: Optional[EmbeddingCache] = None):
         self.search_client = search_client
+        self.async_search_client = async_search_client
         self.sourcepage_field = sourcepage_field
         self.content_field = content_field
         self.search_threshold_percentage = search_threshold_percentage
         self.logger = logger
+        # repeated utterances reuse the search query generated for the same history window, and repeated search queries
+        # reuse the results retrieved with the same search options
+        self.search_query_cache: TTLCache[str] = TTLCache(query_cache_max_size, query_cache_ttl_seconds)
+        self.search_results_cache: TTLCache[Tuple[List[dict], Optional[list]]] = TTLCache(search_cache_max_size, search_cache_ttl_seconds)
+        # search queries embedded before, by this process or another one sharing the on-disk tier, skip the embeddings call
+        self.embedding_cache = embedding_cache
+
+    def run(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None,
+            retrieval: Optional[Retrieval] = None) -> any:
+        if retrieval is None:
+            retrieval = self.retrieve(history, bot_config, openai_client, overrides)
+
+        # STEP 3: Generate a contextual and content specific answer using the search results and chat history
+        contextual_answer_generation_messages = self.build_answer_generation_messages(history, bot_config, retrieval.filtered_results)
+        contextual_answer_reponse = openai_client.chat_completions(
+            messages=contextual_answer_generation_messages,
+            openai_settings=bot_config.get_chat_completions_settings("unstructured_final_answer_generation"),
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        )
+
+        return self.build_chat_response(retrieval.query_generation_messages, retrieval.search_query, retrieval.filtered_results,
+                                        contextual_answer_generation_messages, contextual_answer_reponse)
+
+    async def arun(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None,
+                   retrieval: Optional[Retrieval] = None) -> any:
+        if retrieval is None:
+            retrieval = await self.aretrieve(history, bot_config, openai_client, overrides)
+
+        # STEP 3: Generate a contextual and content specific answer using the search results and chat history
+        contextual_answer_generation_messages = self.build_answer_generation_messages(history, bot_config, retrieval.filtered_results)
+        contextual_answer_reponse = await openai_client.achat_completions(
+            messages=contextual_answer_generation_messages,
+            openai_settings=bot_config.get_chat_completions_settings("unstructured_final_answer_generation"),
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        )
+
+        return self.build_chat_response(retrieval.query_generation_messages, retrieval.search_query, retrieval.filtered_results,
+                                        contextual_answer_generation_messages, contextual_answer_reponse)
+
+    def run_stream(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None,
+                   retrieval: Optional[Retrieval] = None) -> Iterator[Union[str, ChatResponse]]:
+        if retrieval is None:
+            retrieval = self.retrieve(history, bot_config, openai_client, overrides)
+
+        # STEP 3: Stream a contextual and content specific answer using the search results and chat history
+        contextual_answer_generation_messages = self.build_answer_generation_messages(history, bot_config, retrieval.filtered_results)
+        start = time.perf_counter()
+        answer_buffer = ErrorPrefixBuffer()
+        for content in openai_client.chat_completions_stream(
+            messages=contextual_answer_generation_messages,
+            openai_settings=bot_config.get_chat_completions_settings("unstructured_final_answer_generation"),
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        ):
+            released = answer_buffer.push(content)
+            if released:
+                yield released
+
+        released = answer_buffer.flush()
+        if released:
+            yield released
+        yield self.build_streamed_chat_response(retrieval.query_generation_messages, retrieval.search_query, retrieval.filtered_results,
+                                                contextual_answer_generation_messages, answer_buffer.text, (time.perf_counter() - start) * 1000, bot_config)
+
+    async def arun_stream(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict] = None,
+                          retrieval: Optional[Retrieval] = None) -> AsyncIterator[Union[str, ChatResponse]]:
+        if retrieval is None:
+            retrieval = await self.aretrieve(history, bot_config, openai_client, overrides)
+
+        # STEP 3: Stream a contextual and content specific answer using the search results and chat history
+        contextual_answer_generation_messages = self.build_answer_generation_messages(history, bot_config, retrieval.filtered_results)
+        start = time.perf_counter()
+        answer_buffer = ErrorPrefixBuffer()
+        async for content in openai_client.achat_completions_stream(
+            messages=contextual_answer_generation_messages,
+            openai_settings=bot_config.get_chat_completions_settings("unstructured_final_answer_generation"),
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        ):
+            released = answer_buffer.push(content)
+            if released:
+                yield released
+
+        released = answer_buffer.flush()
+        if released:
+            yield released
+        yield self.build_streamed_chat_response(retrieval.query_generation_messages, retrieval.search_query, retrieval.filtered_results,
+                                                contextual_answer_generation_messages, answer_buffer.text, (time.perf_counter() - start) * 1000, bot_config)
+
+    """
+    Runs STEP 1 and STEP 2 of the approach. A search query generated ahead of time, e.g. speculatively while the question
+    was still being classified, can be passed in to only run the search.
+    """
+    def retrieve(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict],
+                 generated_search_query: Optional[GeneratedSearchQuery] = None) -> Retrieval:
+        if generated_search_query is None:
+            generated_search_query = self.generate_search_query(history, bot_config, openai_client)
+        filtered_results = self.search(generated_search_query.search_query, bot_config, openai_client, overrides)
+        return Retrieval(generated_search_query.query_generation_messages, generated_search_query.search_query, filtered_results,
+                         generated_search_query.total_tokens)
+
+    async def aretrieve(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict],
+                        generated_search_query: Optional[GeneratedSearchQuery] = None) -> Retrieval:
+        if generated_search_query is None:
+            generated_search_query = await self.agenerate_search_query(history, bot_config, openai_client)
+        filtered_results = await self.asearch(generated_search_query.search_query, bot_config, openai_client, overrides)
+        return Retrieval(generated_search_query.query_generation_messages, generated_search_query.search_query, filtered_results,
+                         generated_search_query.total_tokens)
+
+    def generate_search_query(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient) -> GeneratedSearchQuery:
+        query_generation_messages = self.build_query_generation_messages(history, bot_config)
+        openai_settings = bot_config.get_chat_completions_settings("unstructured_search_query_generation")
+
+        cache_key = self.get_search_query_cache_key(query_generation_messages, openai_settings)
+        search_query = self.get_cached("search_query", self.search_query_cache, cache_key)
+        if search_query is not None:
+            return GeneratedSearchQuery(query_generation_messages, search_query, 0)
+
+        # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
+        search_query_response = openai_client.chat_completions(
+            messages=query_generation_messages,
+            openai_settings=openai_settings,
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        )
+        search_query = self.parse_search_query(query_generation_messages, search_query_response)
+        self.search_query_cache.set(cache_key, search_query)
+        return GeneratedSearchQuery(query_generation_messages, search_query, search_query_response.usage.total_tokens)
+
+    async def agenerate_search_query(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient) -> GeneratedSearchQuery:
+        query_generation_messages = self.build_query_generation_messages(history, bot_config)
+        openai_settings = bot_config.get_chat_completions_settings("unstructured_search_query_generation")
+
+        cache_key = self.get_search_query_cache_key(query_generation_messages, openai_settings)
+        search_query = self.get_cached("search_query", self.search_query_cache, cache_key)
+        if search_query is not None:
+            return GeneratedSearchQuery(query_generation_messages, search_query, 0)
+
+        # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
+        search_query_response = await openai_client.achat_completions(
+            messages=query_generation_messages,
+            openai_settings=openai_settings,
+            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
+            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
+        )
+        search_query = self.parse_search_query(query_generation_messages, search_query_response)
+        self.search_query_cache.set(cache_key, search_query)
+        return GeneratedSearchQuery(query_generation_messages, search_query, search_query_response.usage.total_tokens)
+
+    def search(self, search_query: str, bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict]) -> List[str]:
+        search_options = self.get_search_options(overrides)
+
+        cache_key = self.get_search_results_cache_key(search_query, search_options)
+        cached_results = self.get_cached("search_results", self.search_results_cache, cache_key)
+        if cached_results is not None:
+            parsed_results, semantic_answers = cached_results
+            return self.filter_search_results(search_query, parsed_results, semantic_answers, search_options)
+
+        # STEP 1.2: Generate a vectorized representation of the search query using an Azure OpenAI embeddings endpoint, if configured
+        embedding = None
+        if search_options["vectorized_index"] and search_options["use_vector_search"]:
+            embedding = self.get_cached_embedding(search_query, bot_config)
+            if embedding is None:
+                response = openai_client.embeddings(
+                    input=search_query,
+                    openai_settings=bot_config.embeddings_settings,
+                    api_base=f"https://{DefaultConfig.AZURE_OPENAI_EMBEDDINGS_SERVICE}.openai.azure.com",
+                    api_key=DefaultConfig.AZURE_OPENAI_EMBEDDINGS_API_KEY
+                )
+                embedding = response['data'][0]['embedding']
+                self.log_aoai_embeddings_response_details(response)
+                if self.embedding_cache is not None:
+                    self.embedding_cache.set(bot_config.embeddings_settings.engine, search_query, embedding)
+
+        # STEP 2: Retrieve relevant documents from the search index with the GPT optimized query
+        r = self.search_client.search(search_query, **self.build_search_kwargs(embedding, search_options))
+        semantic_answers = r.get_answers() if search_options["use_semantic_captions"] else None
+        parsed_results = list(r)
+        self.search_results_cache.set(cache_key, (parsed_results, semantic_answers))
+        return self.filter_search_results(search_query, parsed_results, semantic_answers, search_options)
 
-    def run(self, history: List[Dict[str, str]], bot_config: dict, openai_client: OpenAIClient, overrides: Optional[dict] = None) -> any:
+    async def asearch(self, search_query: str, bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict]) -> List[str]:
+        if self.async_search_client is None:
+            raise Exception("An async search client is required to run the unstructured approach asynchronously.")
+
+        search_options = self.get_search_options(overrides)
+
+        cache_key = self.get_search_results_cache_key(search_query, search_options)
+        cached_results = self.get_cached("search_results", self.search_results_cache, cache_key)
+        if cached_results is not None:
+            parsed_results, semantic_answers = cached_results
+            return self.filter_search_results(search_query, parsed_results, semantic_answers, search_options)
+
+        # STEP 1.2: Generate a vectorized representation of the search query using an Azure OpenAI embeddings endpoint, if configured
+        embedding = None
+        if search_options["vectorized_index"] and search_options["use_vector_search"]:
+            embedding = self.get_cached_embedding(search_query, bot_config)
+            if embedding is None:
+                response = await openai_client.aembeddings(
+                    input=search_query,
+                    openai_settings=bot_config.embeddings_settings,
+                    api_base=f"https://{DefaultConfig.AZURE_OPENAI_EMBEDDINGS_SERVICE}.openai.azure.com",
+                    api_key=DefaultConfig.AZURE_OPENAI_EMBEDDINGS_API_KEY
+                )
+                embedding = response['data'][0]['embedding']
+                self.log_aoai_embeddings_response_details(response)
+                if self.embedding_cache is not None:
+                    self.embedding_cache.set(bot_config.embeddings_settings.engine, search_query, embedding)
+
+        # STEP 2: Retrieve relevant documents from the search index with the GPT optimized query
+        r = await self.async_search_client.search(search_query, **self.build_search_kwargs(embedding, search_options))
+        semantic_answers = await r.get_answers() if search_options["use_semantic_captions"] else None
+        parsed_results = [doc async for doc in r]
+        self.search_results_cache.set(cache_key, (parsed_results, semantic_answers))
+        return self.filter_search_results(search_query, parsed_results, semantic_answers, search_options)
+
+    def get_search_query_cache_key(self, query_generation_messages: List[Dict[str, str]], openai_settings: ChatCompletionsSettings) -> str:
+        # the messages hold the system prompt, the history window and the utterance
+        serialized = json.dumps([query_generation_messages, vars(openai_settings)], sort_keys=True)
+        return hashlib.blake2b(serialized.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get_search_results_cache_key(self, search_query: str, search_options: Dict[str, Any]) -> Tuple:
+        use_vector = bool(search_options["vectorized_index"] and search_options["use_vector_search"])
+        return (search_query, search_options["filter"], search_options["top"], search_options["use_semantic_ranker"],
+                search_options["use_semantic_captions"], use_vector)
+
+    def get_cached_embedding(self, search_query: str, bot_config: BotConfig) -> Optional[List[float]]:
+        if self.embedding_cache is None:
+            return None
+        embedding = self.embedding_cache.get(bot_config.embeddings_settings.engine, search_query)
+        addl_dimensions = {"embedding_cache_hit": embedding is not None}
+        addl_dimensions.update({f"embedding_cache_{stat}": stat_value for stat, stat_value in self.embedding_cache.get_stats().items()})
+        addl_properties = self.logger.get_updated_properties(addl_dimensions)
+        self.logger.info(f"embedding cache {'hit' if embedding is not None else 'miss'}", extra=addl_properties)
+        return embedding
+
+    def get_search_options(self, overrides: Optional[dict]) -> Dict[str, Any]:
         use_semantic_captions = True if overrides is not None and overrides.get(
             "semantic_captions") else False
         use_vector_search = True if overrides is not None and overrides.get("vector_search") else False
+        use_semantic_ranker = True if overrides is not None and overrides.get("semantic_ranker") else False
         vectorized_index = True if DefaultConfig.SEARCH_SKIP_VECTORIZATION.lower() == "false" else False if DefaultConfig.SEARCH_SKIP_VECTORIZATION.lower() == "true" else None
         if vectorized_index is None:
             raise Exception(f"Invalid value for SEARCH_SKIP_VECTORIZATION: {DefaultConfig.SEARCH_SKIP_VECTORIZATION}. Must be either 'true' or 'false'.")
@@ -38,10 +323,20 @@ class ChatUnstructuredApproach(Approach):
         filter = "category ne '{}'".format(
             exclude_category.replace("'", "''")) if exclude_category else None
 
+        return {
+            "use_semantic_captions": use_semantic_captions,
+            "use_vector_search": use_vector_search,
+            "use_semantic_ranker": use_semantic_ranker,
+            "vectorized_index": vectorized_index,
+            "top": top,
+            "filter": filter
+        }
+
+    def build_query_generation_messages(self, history: List[Dict[str, str]], bot_config: BotConfig) -> List[Dict[str, str]]:
         query_generation_messages = [
             {
                 "role": "system",
-                "content": dedent(bot_config["unstructured_search_query_generation"]["system_prompt"])
+                "content": bot_config.get_system_prompt("unstructured_search_query_generation")
             }
         ]
 
@@ -49,81 +344,48 @@ class ChatUnstructuredApproach(Approach):
             query_generation_messages.extend(generate_history_messages(history[:-1], bot_config["unstructured_search_query_generation"]["history"]))
 
         query_generation_messages.append({ "role": "user", "content": history[-1]["utterance"] + " Search Query: "})
+        return query_generation_messages
 
-        # STEP 1: Generate an optimized keyword search query based on the chat history and the last question
-
-        search_query_response = openai_client.chat_completions(
-            messages=query_generation_messages,
-            openai_settings=ChatCompletionsSettings(**bot_config["unstructured_search_query_generation"]["openai_settings"]),
-            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
-            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
-        )
-
+    def parse_search_query(self, query_generation_messages: List[Dict[str, str]], search_query_response) -> str:
         # Not sure why search results are coming with double quotes, so removing them. Double quotes making search to return no results
         search_query = search_query_response['choices'][0]['message']['content'].replace(
             '"', "")
         self.log_aoai_completions_response_details(json.dumps(
             query_generation_messages), f'Generated Search Query: {search_query}', search_query_response)
+        return search_query
 
-        # STEP 1.2: Generate a vectorized representation of the search query using an Azure OpenAI embeddings endpoint, if configured
-        embedding = None
-        if vectorized_index and use_vector_search:
-            response = openai_client.embeddings(
-                input=search_query,
-                openai_settings=EmbeddingsSettings(**bot_config["embeddings"]["openai_settings"]),
-                api_base=f"https://{DefaultConfig.AZURE_OPENAI_EMBEDDINGS_SERVICE}.openai.azure.com",
-                api_key=DefaultConfig.AZURE_OPENAI_EMBEDDINGS_API_KEY
-            )
-            embedding = response['data'][0]['embedding']
-            self.log_aoai_embeddings_response_details(response)
+    def build_search_kwargs(self, embedding: Optional[List[float]], search_options: Dict[str, Any]) -> Dict[str, Any]:
+        use_semantic_captions = search_options["use_semantic_captions"]
+        use_vector = search_options["vectorized_index"] and search_options["use_vector_search"]
+        search_kwargs: Dict[str, Any] = {
+            "filter": search_options["filter"],
+            "top": search_options["top"]
+        }
 
-        # STEP 2: Retrieve relevant documents from the search index with the GPT optimized query
-        if overrides.get("semantic_ranker") and vectorized_index and use_vector_search:
-            r = self.search_client.search(
-                search_query,
-                filter=filter,
-                query_type=QueryType.SEMANTIC,
-                query_language="en-us",
-                semantic_configuration_name="default",
-                query_answer= "extractive|count-3" if use_semantic_captions else None,
-                query_caption="extractive" if use_semantic_captions else None,
-                top=top,
-                vector=embedding,
-                top_k=3,
-                vector_fields="contentVector")
-        elif overrides.get("semantic_ranker"):
-            r = self.search_client.search(
-                search_query,
-                filter=filter,
+        if search_options["use_semantic_ranker"]:
+            search_kwargs.update(
                 query_type=QueryType.SEMANTIC,
                 query_language="en-us",
                 semantic_configuration_name="default",
                 query_answer= "extractive|count-3" if use_semantic_captions else None,
-                query_caption="extractive" if use_semantic_captions else None,
-                top=top)
-        elif vectorized_index and use_vector_search:
-            r = self.search_client.search(
-                search_query,
-                filter=filter,
-                top=top,
+                query_caption="extractive" if use_semantic_captions else None)
+        if use_vector:
+            search_kwargs.update(
                 vector=embedding,
                 top_k=3,
                 vector_fields="contentVector")
-        else:
-            r = self.search_client.search(search_query, filter=filter, top=top)
-
-        score_field = "@search.reranker_score" if overrides.get("semantic_ranker") else "@search.score"
 
-        semantic_answers = r.get_answers() if use_semantic_captions else None
+        return search_kwargs
 
-        parsed_results = list(r)
+    def filter_search_results(self, search_query: str, parsed_results: List[dict], semantic_answers, search_options: Dict[str, Any]) -> List[str]:
+        score_field = "@search.reranker_score" if search_options["use_semantic_ranker"] else "@search.score"
 
         max_score = max([parsed_result[score_field] for parsed_result in parsed_results])
         lower_bound = max_score * (self.search_threshold_percentage / 100)
 
         filtered_results = []
-        
-        if use_semantic_captions:
+
+        if search_options["use_semantic_captions"]:
             if semantic_answers:
                 for answers in semantic_answers:
                     # find the source page from the search results by matching key to id
@@ -144,13 +406,15 @@ class ChatUnstructuredApproach(Approach):
             f"found {len(parsed_results)} results from search for query {search_query}. \
                 After threshold filtering (Threshold: {self.search_threshold_percentage}) {len(filtered_results)} results from query are being used for answer generation", extra=properties)
 
-        # STEP 3: Generate a contextual and content specific answer using the search results and chat history
+        return filtered_results
+
+    def build_answer_generation_messages(self, history: List[Dict[str, str]], bot_config: BotConfig, filtered_results: List[str]) -> List[Dict[str, str]]:
         chat_history = list()
         if bot_config["unstructured_final_answer_generation"]["history"]["include"]:
             chat_history = generate_history_messages(history[:-1], bot_config["unstructured_final_answer_generation"]["history"])
-        
-        chat_history, search_content = trim_history_and_index_combined(chat_history, 
-                                                                       filtered_results, 
+
+        chat_history, search_content = trim_history_and_index_combined(chat_history,
+                                                                       filtered_results,
                                                                        bot_config["unstructured_final_answer_generation"]["model_params"]["total_max_tokens"] - bot_config["unstructured_final_answer_generation"]["openai_settings"]["max_tokens"] - 300,
                                                                        bot_config["unstructured_final_answer_generation"]["model_params"]["model_name"])
         search_content = '\n'.join(search_content)
@@ -163,16 +427,12 @@ class ChatUnstructuredApproach(Approach):
 
         if bot_config["unstructured_final_answer_generation"]["history"]["include"]:
             contextual_answer_generation_messages.extend(chat_history)
-        
-        contextual_answer_generation_messages.append({ "role": "user", "content": history[-1]["utterance"]})
 
-        contextual_answer_reponse = openai_client.chat_completions(
-            messages=contextual_answer_generation_messages,
-            openai_settings=ChatCompletionsSettings(**bot_config["unstructured_final_answer_generation"]["openai_settings"]),
-            api_base=f"https://{DefaultConfig.AZURE_OPENAI_GPT4_SERVICE}.openai.azure.com",
-            api_key=DefaultConfig.AZURE_OPENAI_GPT4_API_KEY
-        )
+        contextual_answer_generation_messages.append({ "role": "user", "content": history[-1]["utterance"]})
+        return contextual_answer_generation_messages
 
+    def build_chat_response(self, query_generation_messages: List[Dict[str, str]], search_query: str, filtered_results: List[str],
+            contextual_answer_generation_messages: List[Dict[str, str]], contextual_answer_reponse) -> ChatResponse:
         contextual_answer = contextual_answer_reponse['choices'][0]['message']['content']
 
         if contextual_answer.startswith("ERROR:"):
@@ -182,11 +442,25 @@ class ChatUnstructuredApproach(Approach):
         self.log_aoai_completions_response_details(json.dumps(
             contextual_answer_generation_messages), f'Search Result: {contextual_answer}', contextual_answer_reponse)
 
+        return self.build_answer(query_generation_messages, search_query, filtered_results, contextual_answer)
+
+    def build_streamed_chat_response(self, query_generation_messages: List[Dict[str, str]], search_query: str, filtered_results: List[str],
+            contextual_answer_generation_messages: List[Dict[str, str]], contextual_answer: str, response_ms: float, bot_config: BotConfig) -> ChatResponse:
+        if contextual_answer.startswith("ERROR:"):
+            contextual_answer = contextual_answer.replace("ERROR:", "").strip()
+            raise OutOfScopeException(message=contextual_answer, suggested_classification=ApproachType.structured)
+
+        self.log_aoai_stream_details(json.dumps(contextual_answer_generation_messages), f'Search Result: {contextual_answer}', contextual_answer,
+                                     response_ms, bot_config["unstructured_final_answer_generation"]["model_params"]["model_name"])
+
+        return self.build_answer(query_generation_messages, search_query, filtered_results, contextual_answer)
+
+    def build_answer(self, query_generation_messages: List[Dict[str, str]], search_query: str, filtered_results: List[str], contextual_answer: str) -> ChatResponse:
         formatted_query_generation_messages = self.format_messages(query_generation_messages)
 
         answer = Answer(formatted_answer=contextual_answer, query_generation_prompt=formatted_query_generation_messages, query=search_query)
         return ChatResponse(answer=answer, data_points=filtered_results, classification=ApproachType.unstructured)
-    
+
     def format_messages(self, message) -> str:
         formatted_messages = ""
         for msg in message:
@@ -204,7 +478,18 @@ class ChatUnstructuredApproach(Approach):
         addl_properties = self.logger.get_updated_properties(addl_dimensions)
         self.logger.info(
             f"prompt: {prompt}, response: {result}", extra=addl_properties)
-        
+
+    def log_aoai_stream_details(self, prompt, result, completion, response_ms, model_name):
+        # streamed completions carry no usage, so the completion tokens are counted locally
+        addl_dimensions = {
+            "completion_tokens": compute_tokens(completion, model_name),
+            "aoai_response[MS]": response_ms,
+            "streamed": True
+        }
+        addl_properties = self.logger.get_updated_properties(addl_dimensions)
+        self.logger.info(
+            f"prompt: {prompt}, response: {result}", extra=addl_properties)
+
     def log_aoai_embeddings_response_details(self, aoai_response):
         addl_dimensions = {
             "total_tokens": aoai_response.usage.total_tokens,
@@ -0,0 +1,29 @@
+import re
+from typing import List, Optional, Pattern, Tuple
+
+# Classification values returned by the approach classifier prompt in bot_config.yaml
+CHIT_CHAT = "3"
+CONTINUATION = "4"
+
+# Obvious cases answered without the model. The patterns match whole utterances that carry nothing besides the greeting
+# or the request to continue, so the content checks of the LLM classifier have nothing to catch in them. Everything else,
+# including any question about the data, is left to the LLM, which is also what decides inappropriate content (5).
+DEFAULT_RULES: List[Tuple[Pattern, str]] = [
+    (re.compile(r"^\s*(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|bye|goodbye)\b[\s!.,]*(there)?[\s!.]*$", re.IGNORECASE), CHIT_CHAT),
+    (re.compile(r"^\s*(tell me more|(can you )?(go|dive) (more )?(deeper|in-depth)|what else( can you tell me)?|(can you )?elaborate|more details( please)?)\b[^a-z]*$", re.IGNORECASE), CONTINUATION),
+]
+
+
+"""
+Local classifier answering the approach classification of obvious utterances without an LLM round-trip, by matching
+them against keyword rules. Returns None for any other utterance, and the caller falls back to the LLM.
+"""
+class FastPathClassifier:
+    def __init__(self, rules: Optional[List[Tuple[Pattern, str]]] = None):
+        self.rules = DEFAULT_RULES if rules is None else rules
+
+    def classify(self, utterance: str) -> Optional[str]:
+        for pattern, classification in self.rules:
+            if pattern.search(utterance):
+                return classification
+        return None
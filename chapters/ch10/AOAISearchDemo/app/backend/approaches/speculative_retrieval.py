@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+
+from backend.approaches.chatunstructured import ChatUnstructuredApproach, GeneratedSearchQuery, Retrieval
+from backend.cognition.openai_client import OpenAIClient
+from backend.utilities.bot_config import BotConfig
+from common.logging.log_helper import CustomLogger
+
+"""
+Search query generation (and optionally the search) of the unstructured approach started while the question is still
+being classified. Created by SpeculativeRetrieval.start/astart and resolved exactly once with use/ause or discard.
+"""
+class Speculation:
+    def __init__(self, history: List[Dict[str, str]], work: Union[Future, asyncio.Task]):
+        self.history = history
+        self.work = work
+        self.started_at = time.perf_counter()
+        self.done_at: Optional[float] = None
+        self.resolved = False
+        work.add_done_callback(self._on_done)
+
+    def _on_done(self, _):
+        self.done_at = time.perf_counter()
+
+"""
+Speculatively runs the first steps of the unstructured approach concurrently with the approach classifier, since
+unstructured is the most common classification. If the classifier agrees, the route hands the result to the approach
+and saves up to the classification time; otherwise the result is discarded (or the task cancelled) and the tokens it
+spent are counted as wasted. get_stats reports the wasted-token rate against the latency saved.
+"""
+class SpeculativeRetrieval:
+    def __init__(self, approach: ChatUnstructuredApproach, logger: CustomLogger, include_search: bool = False, max_workers: int = 4):
+        self.approach = approach
+        self.logger = logger
+        self.include_search = include_search
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculative-retrieval")
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        self.tokens_used = 0
+        self.tokens_wasted = 0
+        self.saved_ms = 0.0
+
+    def start(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict]) -> Speculation:
+        if self.include_search:
+            future = self._executor.submit(self.approach.retrieve, history, bot_config, openai_client, overrides)
+        else:
+            future = self._executor.submit(self.approach.generate_search_query, history, bot_config, openai_client)
+        return self._started(Speculation(history, future))
+
+    async def astart(self, history: List[Dict[str, str]], bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict]) -> Speculation:
+        if self.include_search:
+            task = asyncio.create_task(self.approach.aretrieve(history, bot_config, openai_client, overrides))
+        else:
+            task = asyncio.create_task(self.approach.agenerate_search_query(history, bot_config, openai_client))
+        return self._started(Speculation(history, task))
+
+    """
+    Waits for the speculative work and completes it into the Retrieval the unstructured approach expects.
+    Errors of the speculative work are raised here, as they would have been by the approach itself.
+    """
+    def use(self, speculation: Speculation, bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict]) -> Retrieval:
+        needed_at = time.perf_counter()
+        speculation.resolved = True
+        result = speculation.work.result()
+        self._used(speculation, needed_at, result)
+        if isinstance(result, GeneratedSearchQuery):
+            return self.approach.retrieve(speculation.history, bot_config, openai_client, overrides, generated_search_query=result)
+        return result
+
+    async def ause(self, speculation: Speculation, bot_config: BotConfig, openai_client: OpenAIClient, overrides: Optional[dict]) -> Retrieval:
+        needed_at = time.perf_counter()
+        speculation.resolved = True
+        result = await speculation.work
+        self._used(speculation, needed_at, result)
+        if isinstance(result, GeneratedSearchQuery):
+            return await self.approach.aretrieve(speculation.history, bot_config, openai_client, overrides, generated_search_query=result)
+        return result
+
+    """
+    Drops a speculation that was not used. Work that has not started yet, and asyncio tasks, are cancelled; work already
+    running on a thread cannot be interrupted, so its tokens are counted as wasted once it completes.
+    Tokens the service spent on a cancelled in-flight request are not reported. Does nothing if the speculation was used.
+    """
+    def discard(self, speculation: Speculation):
+        if speculation.resolved:
+            return
+        speculation.resolved = True
+        speculation.work.cancel()
+        self._discarded(speculation)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            spent = self.tokens_used + self.tokens_wasted
+            return {
+                "started": self.started,
+                "used": self.used,
+                "discarded": self.discarded,
+                "tokens_used": self.tokens_used,
+                "tokens_wasted": self.tokens_wasted,
+                "wasted_token_rate": self.tokens_wasted / spent if spent > 0 else 0.0,
+                "saved[MS]": self.saved_ms,
+                "average_saved[MS]": self.saved_ms / self.used if self.used > 0 else 0.0
+            }
+
+    def _started(self, speculation: Speculation) -> Speculation:
+        with self._lock:
+            self.started += 1
+        return speculation
+
+    def _used(self, speculation: Speculation, needed_at: float, result: Union[GeneratedSearchQuery, Retrieval]):
+        # the work ran in the background until the classifier was done, or until it finished if that was earlier
+        done_at = speculation.done_at if speculation.done_at is not None else needed_at
+        saved_ms = (min(done_at, needed_at) - speculation.started_at) * 1000
+        with self._lock:
+            self.used += 1
+            self.tokens_used += result.total_tokens
+            self.saved_ms += saved_ms
+        self.logger.info(f"used speculative retrieval, saved {saved_ms:.0f} ms",
+                         extra=self.logger.get_updated_properties({"speculation_saved[MS]": saved_ms, **self.get_stats()}))
+
+    def _discarded(self, speculation: Speculation):
+        with self._lock:
+            self.discarded += 1
+
+        def count_wasted_tokens(work):
+            if work.cancelled() or work.exception() is not None:
+                return
+            with self._lock:
+                self.tokens_wasted += work.result().total_tokens
+
+        speculation.work.add_done_callback(count_wasted_tokens)
+        self.logger.info("discarded speculative retrieval", extra=self.logger.get_updated_properties(self.get_stats()))
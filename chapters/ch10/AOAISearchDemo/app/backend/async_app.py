@@ -0,0 +1,591 @@
+import asyncio
+import json
+import mimetypes
+
+from azure.storage.blob.aio import BlobServiceClient
+from backend.app_common import (
+    access_manager,
+    answer_cache,
+    approach_classifier,
+    async_search_client,
+    bot_config_loader,
+    chat_approaches,
+    chat_session_writer,
+    check_user_allowed,
+    data_client,
+    discard_speculation,
+    format_server_sent_event,
+    get_answer_cache_keys,
+    get_canned_response,
+    get_error_response,
+    get_history,
+    get_question_classification,
+    get_search_settings_item,
+    get_simplified_history,
+    get_turn_dialogs,
+    logger,
+    openai_client,
+    speculative_retrieval,
+)
+from backend.approaches.chatunstructured import Retrieval
+from backend.approaches.speculative_retrieval import Speculation
+from backend.config import DefaultConfig
+from backend.contracts.chat_response import ApproachType, ChatResponse
+from backend.utilities.answer_cache import AnswerCacheKey, CachedAnswer
+from backend.utilities.bot_config import BotConfig
+from common.contracts.chat_session import ChatSession, DialogClassification
+from common.contracts.resource import ResourceProfile
+from common.contracts.user_profile import UserProfile
+from quart import Quart, Response, jsonify, request
+from typing import List, Optional, Tuple
+
+# asyncio-native (ASGI) variant of backend/app.py. Every outbound call in the /chat flow is awaited instead of blocking a
+# worker, and calls that do not depend on each other are issued concurrently. Serve it with an ASGI server, e.g.:
+#   hypercorn backend.async_app:app --bind 0.0.0.0:5000
+# The clients, approaches and helpers without blocking calls are shared with it through backend/app_common.py.
+blob_client = BlobServiceClient.from_connection_string(
+    DefaultConfig.AZURE_BLOB_CONNECTION_STRING
+)
+blob_container = blob_client.get_container_client(DefaultConfig.AZURE_STORAGE_CONTAINER)
+
+app = Quart(__name__)
+
+
+@app.after_serving
+async def close_clients():
+    await data_client.aclose()
+    await openai_client.aclose()
+    await async_search_client.close()
+    await blob_client.close()
+
+
+@app.route("/", defaults={"path": ""})
+@app.route("/<path:path>")
+async def index(path):
+    return await app.send_static_file("index.html")
+
+
+@app.route("/assets/<path:rest_of_path>")
+async def assets(rest_of_path):
+    return await app.send_static_file(f"assets/{rest_of_path}")
+
+
+# Serve content files from blob storage from within the app to keep the example self-contained.
+# *** NOTE *** this assumes that the content files are public, or at least that all users of the app
+# can access all the files. This is also slow and memory hungry.
+@app.route("/content/<path>")
+async def content_file(path):
+    blob = await blob_container.get_blob_client(path).download_blob()
+    mime_type = blob.properties["content_settings"]["content_type"]
+    if mime_type == "application/octet-stream":
+        mime_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    return (
+        await blob.readall(),
+        200,
+        {"Content-Type": mime_type, "Content-Disposition": f"inline; filename={path}"},
+    )
+
+
+@app.route("/chat", methods=["POST"])
+async def chat():
+    request_json = await request.get_json()
+
+    # try get conversation_id and dialog_id needed for logging
+    conversation_id = request_json.get(
+        "conversation_id", "no conversation_id found in request"
+    )
+    dialog_id = request_json.get("dialog_id", "no dialog_id found in request")
+    user_id = request_json.get("user_id", "no user_id found in request")
+
+    classification_override = None
+    overrides = request_json.get("overrides", None)
+    if overrides:
+        classification_override = overrides.get("classification_override", None)
+
+    logger.set_conversation_and_dialog_ids(conversation_id, dialog_id)
+    properties = logger.get_updated_properties(
+        {"conversation_id": conversation_id, "dialog_id": dialog_id, "user_id": user_id}
+    )
+
+    logger.info(f"request: {json.dumps(request_json)}", extra=properties)
+
+    (
+        user_profile,
+        allowed_resources,
+        allowed_approaches,
+        chat_session,
+    ) = await load_chat_turn(user_id, conversation_id, properties)
+
+    user_message = request_json.get("dialog")
+
+    history = get_history(chat_session, user_message)
+
+    bot_config = bot_config_loader.get()
+    question_classification = None
+    speculation = None
+
+    try:
+        cache_keys = get_answer_cache_keys(
+            chat_session,
+            user_message,
+            allowed_resources,
+            allowed_approaches,
+            classification_override,
+            overrides or None,
+        )
+        cached_answer, utterance_embedding = await get_cached_answer(
+            cache_keys, user_message, bot_config, properties
+        )
+        if cached_answer is not None:
+            await add_turn_to_chat_session(
+                user_id,
+                conversation_id,
+                user_message,
+                cached_answer.response,
+                get_question_classification(cached_answer.approach_type),
+                properties,
+            )
+            return jsonify(cached_answer.response.to_item())
+
+        simplified_history = get_simplified_history(chat_session, user_message)
+
+        approach_type, speculation = await classify_question(
+            history,
+            simplified_history,
+            bot_config,
+            classification_override,
+            overrides or None,
+        )
+
+        logger.info(f"question_type: {approach_type.name}", extra=properties)
+
+        canned_response = get_canned_response(approach_type)
+        if canned_response is not None:
+            # TODO: Use DialogClassification.inappropiate once data service has been updated.
+            await add_turn_to_chat_session(
+                user_id,
+                conversation_id,
+                user_message,
+                canned_response,
+                DialogClassification.chit_chat,
+                properties,
+            )
+
+            return jsonify(canned_response.to_item())
+
+        check_user_allowed(allowed_approaches, approach_type, user_profile)
+
+        question_classification = get_question_classification(approach_type)
+
+        impl = chat_approaches.get(approach_type.name)
+
+        if not impl:
+            return jsonify({"error": "unknown approach"}), 400
+
+        response = await impl.arun(
+            simplified_history,
+            bot_config,
+            openai_client,
+            request_json.get("overrides") or None,
+            **await use_speculation(
+                speculation, approach_type, bot_config, overrides or None
+            ),
+        )
+
+        # state store update
+        if not response.error:
+            await add_turn_to_chat_session(
+                user_id,
+                conversation_id,
+                user_message,
+                response,
+                question_classification,
+                properties,
+            )
+            await cache_answer(
+                cache_keys, approach_type, response, utterance_embedding, properties
+            )
+
+        return jsonify(response.to_item())
+    except Exception as e:
+        response, status = get_error_response(
+            "/chat", e, allowed_approaches, question_classification, properties
+        )
+        return jsonify(response.to_item()), status
+    finally:
+        discard_speculation(speculation)
+
+
+# Same as /chat, but streams the answer as Server-Sent Events: "token" events carry the answer as it is generated,
+# followed by a single "response" event with the complete ChatResponse (or an "error" event).
+# The turn is added to the chat session once the stream has completed.
+@app.route("/chat/stream", methods=["POST"])
+async def chat_stream():
+    request_json = await request.get_json()
+
+    # try get conversation_id and dialog_id needed for logging
+    conversation_id = request_json.get(
+        "conversation_id", "no conversation_id found in request"
+    )
+    dialog_id = request_json.get("dialog_id", "no dialog_id found in request")
+    user_id = request_json.get("user_id", "no user_id found in request")
+    user_message = request_json.get("dialog")
+
+    classification_override = None
+    overrides = request_json.get("overrides", None)
+    if overrides:
+        classification_override = overrides.get("classification_override", None)
+
+    logger.set_conversation_and_dialog_ids(conversation_id, dialog_id)
+    properties = logger.get_updated_properties(
+        {"conversation_id": conversation_id, "dialog_id": dialog_id, "user_id": user_id}
+    )
+
+    logger.info(f"request: {json.dumps(request_json)}", extra=properties)
+
+    async def generate():
+        allowed_approaches = []
+        question_classification = None
+        speculation = None
+
+        try:
+            (
+                user_profile,
+                allowed_resources,
+                allowed_approaches,
+                chat_session,
+            ) = await load_chat_turn(user_id, conversation_id, properties)
+
+            history = get_history(chat_session, user_message)
+
+            bot_config = bot_config_loader.get()
+
+            cache_keys = get_answer_cache_keys(
+                chat_session,
+                user_message,
+                allowed_resources,
+                allowed_approaches,
+                classification_override,
+                overrides or None,
+            )
+            cached_answer, utterance_embedding = await get_cached_answer(
+                cache_keys, user_message, bot_config, properties
+            )
+            if cached_answer is not None:
+                await add_turn_to_chat_session(
+                    user_id,
+                    conversation_id,
+                    user_message,
+                    cached_answer.response,
+                    get_question_classification(cached_answer.approach_type),
+                    properties,
+                )
+                yield format_server_sent_event(
+                    "response", cached_answer.response.to_item()
+                )
+                return
+
+            simplified_history = get_simplified_history(chat_session, user_message)
+
+            approach_type, speculation = await classify_question(
+                history,
+                simplified_history,
+                bot_config,
+                classification_override,
+                overrides or None,
+            )
+
+            logger.info(f"question_type: {approach_type.name}", extra=properties)
+
+            canned_response = get_canned_response(approach_type)
+            if canned_response is not None:
+                # TODO: Use DialogClassification.inappropiate once data service has been updated.
+                await add_turn_to_chat_session(
+                    user_id,
+                    conversation_id,
+                    user_message,
+                    canned_response,
+                    DialogClassification.chit_chat,
+                    properties,
+                )
+                yield format_server_sent_event("response", canned_response.to_item())
+                return
+
+            check_user_allowed(allowed_approaches, approach_type, user_profile)
+
+            question_classification = get_question_classification(approach_type)
+
+            impl = chat_approaches.get(approach_type.name)
+
+            if not impl:
+                yield format_server_sent_event("error", {"error": "unknown approach"})
+                return
+
+            response = None
+            async for item in impl.arun_stream(
+                simplified_history,
+                bot_config,
+                openai_client,
+                overrides or None,
+                **await use_speculation(
+                    speculation, approach_type, bot_config, overrides or None
+                ),
+            ):
+                if isinstance(item, ChatResponse):
+                    response = item
+                else:
+                    yield format_server_sent_event("token", {"content": item})
+
+            # state store update, once the whole answer is known
+            if not response.error:
+                await add_turn_to_chat_session(
+                    user_id,
+                    conversation_id,
+                    user_message,
+                    response,
+                    question_classification,
+                    properties,
+                )
+                await cache_answer(
+                    cache_keys,
+                    approach_type,
+                    response,
+                    utterance_embedding,
+                    properties,
+                )
+
+            yield format_server_sent_event("response", response.to_item())
+        except Exception as e:
+            response, status = get_error_response(
+                "/chat/stream",
+                e,
+                allowed_approaches,
+                question_classification,
+                properties,
+            )
+            yield format_server_sent_event(
+                "response" if status == 200 else "error", response.to_item()
+            )
+        finally:
+            discard_speculation(speculation)
+
+    # the response is sent as soon as the first event is yielded
+    response = Response(generate(), mimetype="text/event-stream")
+    # keep proxies from buffering the stream
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None
+    return response
+
+
+async def classify_question(
+    history: List[dict],
+    simplified_history: List[dict],
+    bot_config: BotConfig,
+    classification_override: Optional[str],
+    overrides: Optional[dict],
+) -> Tuple[ApproachType, Optional[Speculation]]:
+    if classification_override:
+        return ApproachType(classification_override), None
+
+    approach_type = approach_classifier.run_fast_path(history)
+    if approach_type is not None:
+        return approach_type, None
+
+    # only speculate when the classification needs a model round-trip
+    speculation = None
+    if speculative_retrieval is not None:
+        speculation = await speculative_retrieval.astart(
+            simplified_history, bot_config, openai_client, overrides
+        )
+    try:
+        approach_type = await approach_classifier.arun_model(
+            history, bot_config, openai_client
+        )
+    except Exception:
+        discard_speculation(speculation)
+        raise
+    return approach_type, speculation
+
+
+# Returns the keyword arguments handing the speculative retrieval to the unstructured approach, if it can be used.
+async def use_speculation(
+    speculation: Optional[Speculation],
+    approach_type: ApproachType,
+    bot_config: BotConfig,
+    overrides: Optional[dict],
+) -> dict:
+    if speculation is None or approach_type != ApproachType.unstructured:
+        return {}
+    retrieval: Retrieval = await speculative_retrieval.ause(
+        speculation, bot_config, openai_client, overrides
+    )
+    return {"retrieval": retrieval}
+
+
+async def load_chat_turn(
+    user_id: str, conversation_id: str, properties: dict
+) -> Tuple[UserProfile, List[ResourceProfile], List[ApproachType], ChatSession]:
+    # make sure the previous turn of this conversation has been persisted before it is read back
+    if chat_session_writer is not None:
+        flushed = await asyncio.to_thread(
+            chat_session_writer.wait_for_conversation,
+            user_id,
+            conversation_id,
+            DefaultConfig.CHAT_SESSION_WRITE_WAIT_SECONDS,
+        )
+        if not flushed:
+            logger.warning(
+                f"previous dialogs of session {conversation_id} are still being persisted",
+                extra=properties,
+            )
+
+    # the user profile, the user access rules and the chat session are looked up concurrently by the data service
+    chat_context = await data_client.aget_chat_context(
+        user_id, conversation_id, DefaultConfig.CHAT_HISTORY_LAST_N
+    )
+    allowed_approaches = access_manager.get_allowed_approaches(chat_context.resources)
+
+    # the data service creates the chat session on first use, so no separate existence check is needed
+    chat_session: ChatSession = chat_context.chat_session
+    logger.info(
+        f"loaded chat session for user {user_id} and session {conversation_id}",
+        extra=properties,
+    )
+
+    return (
+        chat_context.user_profile,
+        chat_context.resources,
+        allowed_approaches,
+        chat_session,
+    )
+
+
+# Looks the first turn up in the answer cache. Also returns the embedding of the question when the semantic tier
+# computed it, so that the answer can be cached with it on a miss. Cache errors are logged and treated as misses.
+async def get_cached_answer(
+    cache_keys: List[AnswerCacheKey],
+    user_message: str,
+    bot_config: BotConfig,
+    properties: dict,
+) -> Tuple[Optional[CachedAnswer], Optional[List[float]]]:
+    if len(cache_keys) == 0:
+        return None, None
+
+    embedding = None
+    try:
+        # the store may be remote, so it is not queried on the event loop
+        cached_answer = await asyncio.to_thread(answer_cache.get_exact, cache_keys)
+        if (
+            cached_answer is None
+            and len(answer_cache.get_semantic_keys(cache_keys)) > 0
+        ):
+            response = await openai_client.aembeddings(
+                input=user_message,
+                openai_settings=bot_config.embeddings_settings,
+                api_base=f"https://{DefaultConfig.AZURE_OPENAI_EMBEDDINGS_SERVICE}.openai.azure.com",
+                api_key=DefaultConfig.AZURE_OPENAI_EMBEDDINGS_API_KEY,
+            )
+            embedding = response["data"][0]["embedding"]
+            cached_answer = await asyncio.to_thread(
+                answer_cache.get_semantic, cache_keys, embedding
+            )
+    except Exception as e:
+        logger.warning(f"answer cache lookup failed: {e}", extra=properties)
+        return None, embedding
+
+    if cached_answer is None:
+        answer_cache.record_miss()
+    return cached_answer, embedding
+
+
+async def cache_answer(
+    cache_keys: List[AnswerCacheKey],
+    approach_type: ApproachType,
+    response: ChatResponse,
+    embedding: Optional[List[float]],
+    properties: dict,
+):
+    key = next((key for key in cache_keys if key.approach_type == approach_type), None)
+    if key is None:
+        return
+    try:
+        await asyncio.to_thread(answer_cache.set, key, response, embedding)
+    except Exception as e:
+        logger.warning(f"answer cache update failed: {e}", extra=properties)
+
+
+async def add_turn_to_chat_session(
+    user_id: str,
+    conversation_id: str,
+    user_message: str,
+    response: ChatResponse,
+    classification: DialogClassification,
+    properties: dict,
+):
+    dialogs = get_turn_dialogs(user_message, response, classification)
+    if chat_session_writer is not None:
+        chat_session_writer.enqueue(user_id, conversation_id, dialogs, properties)
+        logger.info(
+            f"queued dialog and response {response.answer.formatted_answer} for chat session for user {user_id} and session {conversation_id}",
+            extra=properties,
+        )
+        return
+
+    await data_client.aadd_dialogs_to_chat_session(
+        user_id, conversation_id, dialogs, last_n=0
+    )
+    logger.info(
+        f"added dialog and response {response.answer.formatted_answer} to chat session for user {user_id} and session {conversation_id}",
+        extra=properties,
+    )
+
+
+@app.route("/user-profiles", methods=["GET"])
+async def get_all_user_profiles():
+    try:
+        user_profiles = await data_client.aget_all_user_profiles()
+        user_profiles_dict = [user_profile.to_item() for user_profile in user_profiles]
+        return jsonify(user_profiles_dict)
+    except Exception as e:
+        logger.exception(f"Exception in /user-profiles: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/chat-sessions/<user_id>/<conversation_id>", methods=["DELETE"])
+async def clear_chat_session(user_id: str, conversation_id: str):
+    properties = logger.get_updated_properties(
+        {"user_id": user_id, "conversation_id": conversation_id}
+    )
+
+    try:
+        # dialogs still queued for the conversation must not be appended to the cleared session
+        if chat_session_writer is not None:
+            chat_session_writer.discard_conversation(user_id, conversation_id)
+            await asyncio.to_thread(
+                chat_session_writer.wait_for_conversation,
+                user_id,
+                conversation_id,
+                DefaultConfig.CHAT_SESSION_WRITE_WAIT_SECONDS,
+            )
+        await data_client.aclear_chat_session(user_id, conversation_id)
+        logger.info(f"cleared chat session.", extra=properties)
+        return jsonify({"message": "cleared chat session"})
+    except Exception as e:
+        logger.exception(
+            f"Exception in /chat-sessions/<user_id>/<conversation_id>: {e}"
+        )
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/search-settings", methods=["GET"])
+async def get_search_settings():
+    try:
+        return jsonify(get_search_settings_item())
+    except Exception as e:
+        logger.exception(f"Exception in /search-settings: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+if __name__ == "__main__":
+    app.run()
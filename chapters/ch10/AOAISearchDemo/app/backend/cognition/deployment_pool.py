@@ -0,0 +1,216 @@
+import json
+import openai
+import threading
+import time
+from backend.config import DefaultConfig
+from common.logging.log_helper import CustomLogger
+from enum import Enum
+from typing import Any, Dict, List, NamedTuple, Optional
+
+class DeploymentTier(Enum):
+    ptu = "ptu"
+    paygo = "paygo"
+
+# provisioned throughput is paid for whether it is used or not, so it is filled first and pay-as-you-go takes the spillover
+TIER_PRIORITY = {DeploymentTier.ptu: 0, DeploymentTier.paygo: 1}
+
+"""
+One Azure OpenAI endpoint (and optionally a deployment name overriding the engine of the request settings) of a
+DeploymentPool, along with its routing state. The state is only read and updated under the lock of its pool.
+"""
+class Deployment:
+    def __init__(self, api_base: str, api_key: str, deployment_name: Optional[str] = None, weight: float = 1.0,
+                 tier: DeploymentTier = DeploymentTier.paygo, max_outstanding: Optional[int] = None):
+        self.api_base = api_base
+        self.api_key = api_key
+        self.deployment_name = deployment_name
+        self.weight = weight
+        self.tier = tier
+        self.max_outstanding = max_outstanding
+
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        # set from Retry-After on 429s, and when the circuit breaker opens
+        self.unavailable_until = 0.0
+        self.trial_in_flight = False
+
+        self.requests = 0
+        self.throttled = 0
+        self.failures = 0
+
+    def get_settings(self, openai_settings) -> Dict[str, Any]:
+        settings = dict(vars(openai_settings))
+        if self.deployment_name:
+            settings["engine"] = self.deployment_name
+        return settings
+
+    def get_name(self) -> str:
+        return f"{self.api_base}/{self.deployment_name}" if self.deployment_name else self.api_base
+
+class DeploymentLease(NamedTuple):
+    deployment: Deployment
+    # whether this request is the single trial request of a half-open circuit
+    trial: bool
+
+"""
+Deployments serving the same role (classifier, gpt4 or embeddings), e.g. a PTU deployment with pay-as-you-go
+deployments in other regions to spill over to.
+acquire routes each request to the available deployment of the highest priority tier with the fewest outstanding
+requests relative to its weight. A deployment is unavailable while it is throttled (until its Retry-After has passed),
+while its circuit breaker is open (after `failure_threshold` consecutive failures, for `reset_seconds`, after which a
+single trial request is let through), and while it has `max_outstanding` requests in flight.
+"""
+class DeploymentPool:
+    def __init__(self, name: str, deployments: List[Deployment], logger: CustomLogger, failure_threshold: int = 5,
+                 reset_seconds: float = 30, default_retry_after_seconds: float = 10):
+        self.name = name
+        self.deployments = deployments
+        self.logger = logger
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.default_retry_after_seconds = default_retry_after_seconds
+        self._lock = threading.Lock()
+
+    """
+    Builds the pool of a role from its configured service and key, plus the deployments listed in `deployments_json`:
+    a JSON list of {"service", "api_key", "deployment", "weight", "tier", "max_outstanding"} objects where only
+    "service" is required and the key defaults to the one of the role. Listing the configured service sets its
+    options, otherwise it is added as a pay-as-you-go deployment of weight 1.
+    """
+    @classmethod
+    def from_config(cls, name: str, service: str, api_key: str, deployments_json: str, logger: CustomLogger,
+                    failure_threshold: int = 5, reset_seconds: float = 30, default_retry_after_seconds: float = 10) -> "DeploymentPool":
+        deployments: List[Deployment] = []
+        for item in json.loads(deployments_json) if deployments_json else []:
+            deployments.append(Deployment(
+                f"https://{item['service']}.openai.azure.com",
+                item.get("api_key", api_key),
+                item.get("deployment"),
+                float(item.get("weight", 1.0)),
+                DeploymentTier(item.get("tier", DeploymentTier.paygo.value)),
+                item.get("max_outstanding")
+            ))
+        api_base = f"https://{service}.openai.azure.com"
+        if not any(deployment.api_base == api_base for deployment in deployments):
+            deployments.insert(0, Deployment(api_base, api_key))
+        return cls(name, deployments, logger, failure_threshold, reset_seconds, default_retry_after_seconds)
+
+    def acquire(self, excluded: List[Deployment] = []) -> Optional[DeploymentLease]:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [deployment for deployment in self.deployments if deployment not in excluded and self._is_available(deployment, now)]
+            if len(candidates) == 0:
+                return None
+            best_tier = min(TIER_PRIORITY[deployment.tier] for deployment in candidates)
+            deployment = min(
+                (deployment for deployment in candidates if TIER_PRIORITY[deployment.tier] == best_tier),
+                key=lambda deployment: (deployment.outstanding + 1) / deployment.weight
+            )
+            deployment.outstanding += 1
+            deployment.requests += 1
+            # half-open: this request decides whether the circuit closes again
+            trial = deployment.consecutive_failures >= self.failure_threshold
+            if trial:
+                deployment.trial_in_flight = True
+            return DeploymentLease(deployment, trial)
+
+    """
+    Records the outcome of a request acquired with `lease`. Returns whether the error is specific to the deployment
+    (throttling or a service failure), in which case the request can be retried on another deployment.
+    """
+    def release(self, lease: DeploymentLease, error: Optional[Exception] = None) -> bool:
+        deployment = lease.deployment
+        now = time.monotonic()
+        with self._lock:
+            deployment.outstanding -= 1
+            # requests acquired before the circuit opened may complete while it is half-open, only the trial ends it
+            if lease.trial:
+                deployment.trial_in_flight = False
+
+            if isinstance(error, openai.error.RateLimitError):
+                retry_after = self._get_retry_after(error)
+                deployment.throttled += 1
+                deployment.unavailable_until = max(deployment.unavailable_until, now + retry_after)
+                self.logger.warning(f"{self.name} deployment {deployment.get_name()} throttled for {retry_after} seconds",
+                                    extra=self.logger.get_updated_properties({"deployment_retry_after[S]": retry_after}))
+                return True
+
+            if self._is_service_failure(error):
+                deployment.failures += 1
+                deployment.consecutive_failures += 1
+                if deployment.consecutive_failures >= self.failure_threshold:
+                    deployment.unavailable_until = now + self.reset_seconds
+                    self.logger.warning(f"{self.name} deployment {deployment.get_name()} circuit opened after "
+                                        f"{deployment.consecutive_failures} consecutive failures: {error}")
+                return True
+
+            # the deployment answered, even if the request itself was rejected
+            deployment.consecutive_failures = 0
+            return False
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "deployment": deployment.get_name(),
+                    "tier": deployment.tier.value,
+                    "available": self._is_available(deployment, now),
+                    "outstanding": deployment.outstanding,
+                    "requests": deployment.requests,
+                    "throttled": deployment.throttled,
+                    "failures": deployment.failures
+                }
+                for deployment in self.deployments
+            ]
+
+    def _is_available(self, deployment: Deployment, now: float) -> bool:
+        if now < deployment.unavailable_until or deployment.trial_in_flight:
+            return False
+        return deployment.max_outstanding is None or deployment.outstanding < deployment.max_outstanding
+
+    def _get_retry_after(self, error: openai.error.RateLimitError) -> float:
+        # Azure OpenAI sends retry-after-ms along with the standard Retry-After header
+        try:
+            if error.headers.get("retry-after-ms") is not None:
+                return float(error.headers.get("retry-after-ms")) / 1000
+            if error.headers.get("retry-after") is not None:
+                return float(error.headers.get("retry-after"))
+        except ValueError:
+            pass
+        return self.default_retry_after_seconds
+
+    @staticmethod
+    def _is_service_failure(error: Optional[Exception]) -> bool:
+        if isinstance(error, (openai.error.ServiceUnavailableError, openai.error.Timeout, openai.error.APIConnectionError, openai.error.TryAgain)):
+            return True
+        return isinstance(error, openai.error.APIError) and (error.http_status is None or error.http_status >= 500)
+
+
+"""
+Builds the deployment pools of the roles that have additional deployments configured, keyed by the configured
+endpoint of the role as the approaches pass it to OpenAIClient. Roles without additional deployments are not pooled.
+"""
+def load_deployment_pools(logger: CustomLogger) -> Dict[str, DeploymentPool]:
+    roles = [
+        ("gpt4", DefaultConfig.AZURE_OPENAI_GPT4_SERVICE, DefaultConfig.AZURE_OPENAI_GPT4_API_KEY, DefaultConfig.AZURE_OPENAI_GPT4_DEPLOYMENTS),
+        ("classifier", DefaultConfig.AZURE_OPENAI_CLASSIFIER_SERVICE, DefaultConfig.AZURE_OPENAI_CLASSIFIER_API_KEY, DefaultConfig.AZURE_OPENAI_CLASSIFIER_DEPLOYMENTS),
+        ("embeddings", DefaultConfig.AZURE_OPENAI_EMBEDDINGS_SERVICE, DefaultConfig.AZURE_OPENAI_EMBEDDINGS_API_KEY, DefaultConfig.AZURE_OPENAI_EMBEDDINGS_DEPLOYMENTS),
+    ]
+    pools: Dict[str, DeploymentPool] = {}
+    for name, service, api_key, deployments_json in roles:
+        if not deployments_json:
+            continue
+        api_base = f"https://{service}.openai.azure.com"
+        if api_base in pools:
+            # the pool would also receive the requests of the other role, with the wrong deployment names
+            logger.warning(f"{name} deployments ignored, its service is shared with the {pools[api_base].name} deployments")
+            continue
+        pools[api_base] = DeploymentPool.from_config(
+            name, service, api_key, deployments_json, logger,
+            DefaultConfig.DEPLOYMENT_FAILURE_THRESHOLD,
+            DefaultConfig.DEPLOYMENT_CIRCUIT_RESET_SECONDS,
+            DefaultConfig.DEPLOYMENT_DEFAULT_RETRY_AFTER_SECONDS
+        )
+        logger.info(f"routing {name} requests across {len(pools[api_base].deployments)} deployments")
+    return pools
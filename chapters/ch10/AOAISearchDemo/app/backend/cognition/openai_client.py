@@ -1,29 +1,188 @@
+import aiohttp
+import asyncio
 import openai
-from backend.contracts.error import ContentFilterException
+from backend.contracts.error import ContentFilterException, DeploymentUnavailableException
+from backend.cognition.deployment_pool import Deployment, DeploymentLease, DeploymentPool
 from backend.cognition.openai_settings import ChatCompletionsSettings, EmbeddingsSettings
-from typing import Dict, List
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
 
+# the pool and deployment lease a request was routed to, None when the endpoint has no pool
+Lease = Optional[Tuple[DeploymentPool, DeploymentLease]]
+
+"""
+Thin wrapper over the OpenAI SDK that never mutates its module-level settings: the API type, version, endpoint and key
+are passed with every request, so the classifier, GPT-4 and embeddings endpoints can be called concurrently from any
+number of threads and coroutines.
+Sync requests reuse the keep-alive requests.Session the SDK keeps per thread. Async requests use one pooled keep-alive
+aiohttp session per (event loop, endpoint, key) instead of the SDK default of opening a new session for every call.
+
+Requests for an endpoint that has a DeploymentPool (keyed by the configured endpoint of its role) are routed across the
+deployments of the pool, and retried on another deployment when one is throttled or failing. Streamed completions are
+only retried until the stream has started.
+"""
 class OpenAIClient:
-    def __init__(self):
-        # Used by the OpenAI SDK
-        openai.api_type = "azure"
-        openai.api_version = "2023-03-15-preview"
+    def __init__(self, api_type: str = "azure", api_version: str = "2023-03-15-preview", pool_size: int = 100, keepalive_seconds: float = 60,
+                 deployment_pools: Dict[str, DeploymentPool] = {}):
+        self.api_type = api_type
+        self.api_version = api_version
+        self.pool_size = pool_size
+        self.keepalive_seconds = keepalive_seconds
+        self.deployment_pools = deployment_pools
+        # aiohttp sessions are bound to the event loop they were created on, so they are keyed by loop as well
+        self._async_sessions: Dict[Tuple[asyncio.AbstractEventLoop, str, str], aiohttp.ClientSession] = {}
 
     def chat_completions(self, messages: List[Dict[str, str]], openai_settings: ChatCompletionsSettings, api_base: str, api_key: str):
-        openai.api_base = api_base
-        openai.api_key = api_key
-        completion = openai.ChatCompletion.create(
-            **vars(openai_settings),
-            messages=messages
-        )
+        lease, completion = self._create(openai.ChatCompletion.create, openai_settings, api_base, api_key, messages=messages)
+        self._release(lease)
         if completion['choices'][0].get('finish_reason', '') == 'content_filter':
             raise ContentFilterException('Completion for this request has been blocked by the content filter.')
         return completion
 
+    """
+    Streams the completion, yielding the content of each chunk as soon as it arrives.
+    Raises ContentFilterException when the content filter stops the completion, which can happen mid-stream.
+    """
+    def chat_completions_stream(self, messages: List[Dict[str, str]], openai_settings: ChatCompletionsSettings, api_base: str, api_key: str) -> Iterator[str]:
+        lease, chunks = self._create(openai.ChatCompletion.create, openai_settings, api_base, api_key, messages=messages, stream=True)
+        error = None
+        try:
+            for chunk in chunks:
+                content = self._get_chunk_content(chunk)
+                if content:
+                    yield content
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # also reached when the caller stops consuming the stream
+            self._release(lease, error)
+
     def embeddings(self, input: str, openai_settings: EmbeddingsSettings, api_base: str, api_key: str):
-        openai.api_base = api_base
-        openai.api_key = api_key
-        return openai.Embedding.create(
-            **vars(openai_settings), 
-            input=input
-        )
\ No newline at end of file
+        lease, response = self._create(openai.Embedding.create, openai_settings, api_base, api_key, input=input)
+        self._release(lease)
+        return response
+
+    async def achat_completions(self, messages: List[Dict[str, str]], openai_settings: ChatCompletionsSettings, api_base: str, api_key: str):
+        lease, completion = await self._acreate(openai.ChatCompletion.acreate, openai_settings, api_base, api_key, messages=messages)
+        self._release(lease)
+        if completion['choices'][0].get('finish_reason', '') == 'content_filter':
+            raise ContentFilterException('Completion for this request has been blocked by the content filter.')
+        return completion
+
+    async def achat_completions_stream(self, messages: List[Dict[str, str]], openai_settings: ChatCompletionsSettings, api_base: str, api_key: str) -> AsyncIterator[str]:
+        lease, chunks = await self._acreate(openai.ChatCompletion.acreate, openai_settings, api_base, api_key, messages=messages, stream=True)
+        error = None
+        try:
+            async for chunk in chunks:
+                content = self._get_chunk_content(chunk)
+                if content:
+                    yield content
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            # also reached when the caller stops consuming the stream
+            self._release(lease, error)
+
+    async def aembeddings(self, input: str, openai_settings: EmbeddingsSettings, api_base: str, api_key: str):
+        lease, response = await self._acreate(openai.Embedding.acreate, openai_settings, api_base, api_key, input=input)
+        self._release(lease)
+        return response
+
+    def get_deployment_stats(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {pool.name: pool.get_stats() for pool in self.deployment_pools.values()}
+
+    async def aclose(self):
+        loop = asyncio.get_running_loop()
+        for key in [key for key in self._async_sessions if key[0] is loop]:
+            await self._async_sessions.pop(key).close()
+
+    """
+    Sends the request to the endpoint, or to the deployments of its pool until one of them accepts it.
+    The returned lease must be released once the response has been consumed.
+    """
+    def _create(self, create: Callable, openai_settings, api_base: str, api_key: str, **kwargs) -> Tuple[Lease, Any]:
+        pool = self.deployment_pools.get(api_base)
+        if pool is None:
+            return None, create(**vars(openai_settings), **kwargs, **self._get_endpoint_args(api_base, api_key))
+
+        tried: List[Deployment] = []
+        last_error = None
+        while True:
+            deployment_lease = self._acquire(pool, tried, last_error)
+            deployment = deployment_lease.deployment
+            try:
+                return (pool, deployment_lease), create(**deployment.get_settings(openai_settings), **kwargs,
+                                                        **self._get_endpoint_args(deployment.api_base, deployment.api_key))
+            except Exception as e:
+                if not pool.release(deployment_lease, e):
+                    raise
+                tried.append(deployment)
+                last_error = e
+
+    async def _acreate(self, create: Callable, openai_settings, api_base: str, api_key: str, **kwargs) -> Tuple[Lease, Any]:
+        pool = self.deployment_pools.get(api_base)
+        if pool is None:
+            async with self._pooled_session(api_base, api_key):
+                return None, await create(**vars(openai_settings), **kwargs, **self._get_endpoint_args(api_base, api_key))
+
+        tried: List[Deployment] = []
+        last_error = None
+        while True:
+            deployment_lease = self._acquire(pool, tried, last_error)
+            deployment = deployment_lease.deployment
+            try:
+                async with self._pooled_session(deployment.api_base, deployment.api_key):
+                    return (pool, deployment_lease), await create(**deployment.get_settings(openai_settings), **kwargs,
+                                                                  **self._get_endpoint_args(deployment.api_base, deployment.api_key))
+            except Exception as e:
+                if not pool.release(deployment_lease, e):
+                    raise
+                tried.append(deployment)
+                last_error = e
+
+    @staticmethod
+    def _acquire(pool: DeploymentPool, tried: List[Deployment], last_error: Optional[Exception]) -> DeploymentLease:
+        deployment_lease = pool.acquire(tried)
+        if deployment_lease is None:
+            raise DeploymentUnavailableException(f"No {pool.name} deployment is available, {len(tried)} tried.") from last_error
+        return deployment_lease
+
+    @staticmethod
+    def _release(lease: Lease, error: Optional[Exception] = None):
+        if lease is not None:
+            pool, deployment_lease = lease
+            pool.release(deployment_lease, error)
+
+    def _get_endpoint_args(self, api_base: str, api_key: str) -> Dict[str, str]:
+        return {"api_base": api_base, "api_key": api_key, "api_type": self.api_type, "api_version": self.api_version}
+
+    @asynccontextmanager
+    async def _pooled_session(self, api_base: str, api_key: str):
+        # the SDK picks up the session from its context variable when the request is sent; streamed responses keep it
+        # until they are consumed, and the session is left open for the next request
+        token = openai.aiosession.set(self._get_async_session(api_base, api_key))
+        try:
+            yield
+        finally:
+            openai.aiosession.reset(token)
+
+    def _get_async_session(self, api_base: str, api_key: str) -> aiohttp.ClientSession:
+        key = (asyncio.get_running_loop(), api_base, api_key)
+        session = self._async_sessions.get(key)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_seconds)
+            session = aiohttp.ClientSession(connector=connector)
+            self._async_sessions[key] = session
+        return session
+
+    @staticmethod
+    def _get_chunk_content(chunk) -> str:
+        # Azure OpenAI sends the prompt filter results in a first chunk without choices
+        if len(chunk['choices']) == 0:
+            return ""
+        choice = chunk['choices'][0]
+        if choice.get('finish_reason', '') == 'content_filter':
+            raise ContentFilterException('Completion for this request has been blocked by the content filter.')
+        return choice.get('delta', {}).get('content', "")
@@ -41,7 +41,7 @@ class Config_Reader():
             start = datetime.now()
             value = self._get_secret_from_keyvault(key_name)
             end = datetime.now()
-            duration = (end - start).microseconds/1000
+            duration = (end - start).total_seconds()*1000
             addl_dimension = {"keyvault_duration": duration}
             
             if self.logger:
@@ -90,11 +90,55 @@ class DefaultConfig:
                 cls.AZURE_BLOB_CONNECTION_STRING = config_reader.read_config_value("AZURE-BLOB-CONNECTION-STRING")
 
                 cls.DATA_SERVICE_URI = config_reader.read_config_value("DATA-SERVICE-URI")
+                cls.DATA_SERVICE_POOL_SIZE = int(os.getenv("DATA_SERVICE_POOL_SIZE", 10)) if os.getenv("DATA_SERVICE_POOL_SIZE") != "" else 10
+                cls.DATA_SERVICE_TIMEOUT_SECONDS = int(os.getenv("DATA_SERVICE_TIMEOUT_SECONDS", 30)) if os.getenv("DATA_SERVICE_TIMEOUT_SECONDS") != "" else 30
+                cls.USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", 300)) if os.getenv("USER_CACHE_TTL_SECONDS") != "" else 300
+                cls.USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 1024)) if os.getenv("USER_CACHE_MAX_SIZE") != "" else 1024
 
                 cls.SQL_CONNECTION_STRING = config_reader.read_config_value("SQL-CONNECTION-STRING")
 
                 cls.RATIO_OF_INDEX_TO_HISTORY = int(os.getenv("RATIO_OF_INDEX_TO_HISTORY", 5)) if os.getenv("RATIO_OF_INDEX_TO_HISTORY") != "" else 5
                 cls.SEARCH_THRESHOLD_PERCENTAGE = int(os.getenv("SEARCH_THRESHOLD_PERCENTAGE", 50)) if os.getenv("SEARCH_THRESHOLD_PERCENTAGE") != "" else 50
+                cls.CHAT_HISTORY_LAST_N = int(os.getenv("CHAT_HISTORY_LAST_N", 20)) if os.getenv("CHAT_HISTORY_LAST_N") != "" else 20
+                cls.CHAT_SESSION_WRITE_BEHIND = os.getenv("CHAT_SESSION_WRITE_BEHIND", "true").lower() == "true"
+                cls.CHAT_SESSION_WRITE_WAIT_SECONDS = int(os.getenv("CHAT_SESSION_WRITE_WAIT_SECONDS", 10)) if os.getenv("CHAT_SESSION_WRITE_WAIT_SECONDS") != "" else 10
+                cls.CHAT_SESSION_FLUSH_TIMEOUT_SECONDS = int(os.getenv("CHAT_SESSION_FLUSH_TIMEOUT_SECONDS", 30)) if os.getenv("CHAT_SESSION_FLUSH_TIMEOUT_SECONDS") != "" else 30
+                cls.TOKEN_COUNT_CACHE_MAX_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_MAX_SIZE", 8192)) if os.getenv("TOKEN_COUNT_CACHE_MAX_SIZE") != "" else 8192
+                cls.TOKENIZER_THREADS = int(os.getenv("TOKENIZER_THREADS", 4)) if os.getenv("TOKENIZER_THREADS") != "" else 4
+                cls.CLASSIFIER_FAST_PATH_ENABLED = os.getenv("CLASSIFIER_FAST_PATH_ENABLED", "false").lower() == "true"
+                cls.SPECULATIVE_QUERY_GENERATION = os.getenv("SPECULATIVE_QUERY_GENERATION", "false").lower() == "true"
+                cls.SPECULATIVE_SEARCH = os.getenv("SPECULATIVE_SEARCH", "false").lower() == "true"
+                cls.OPENAI_POOL_SIZE = int(os.getenv("OPENAI_POOL_SIZE", 100)) if os.getenv("OPENAI_POOL_SIZE") != "" else 100
+                cls.AZURE_OPENAI_GPT4_DEPLOYMENTS = os.getenv("AZURE_OPENAI_GPT4_DEPLOYMENTS", "")
+                cls.AZURE_OPENAI_CLASSIFIER_DEPLOYMENTS = os.getenv("AZURE_OPENAI_CLASSIFIER_DEPLOYMENTS", "")
+                cls.AZURE_OPENAI_EMBEDDINGS_DEPLOYMENTS = os.getenv("AZURE_OPENAI_EMBEDDINGS_DEPLOYMENTS", "")
+                cls.DEPLOYMENT_FAILURE_THRESHOLD = int(os.getenv("DEPLOYMENT_FAILURE_THRESHOLD", 5)) if os.getenv("DEPLOYMENT_FAILURE_THRESHOLD") != "" else 5
+                cls.DEPLOYMENT_CIRCUIT_RESET_SECONDS = float(os.getenv("DEPLOYMENT_CIRCUIT_RESET_SECONDS", 30)) if os.getenv("DEPLOYMENT_CIRCUIT_RESET_SECONDS") != "" else 30
+                cls.DEPLOYMENT_DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv("DEPLOYMENT_DEFAULT_RETRY_AFTER_SECONDS", 10)) if os.getenv("DEPLOYMENT_DEFAULT_RETRY_AFTER_SECONDS") != "" else 10
+                cls.ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+                cls.ANSWER_CACHE_STORE = os.getenv("ANSWER_CACHE_STORE", "memory")
+                cls.ANSWER_CACHE_REDIS_URL = os.getenv("ANSWER_CACHE_REDIS_URL", "")
+                cls.ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", 3600)) if os.getenv("ANSWER_CACHE_TTL_SECONDS") != "" else 3600
+                cls.ANSWER_CACHE_MAX_SIZE = int(os.getenv("ANSWER_CACHE_MAX_SIZE", 1024)) if os.getenv("ANSWER_CACHE_MAX_SIZE") != "" else 1024
+                cls.ANSWER_CACHE_SEMANTIC_ENABLED = os.getenv("ANSWER_CACHE_SEMANTIC_ENABLED", "true").lower() == "true"
+                cls.ANSWER_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD", 0.95)) if os.getenv("ANSWER_CACHE_SIMILARITY_THRESHOLD") != "" else 0.95
+                cls.SEARCH_QUERY_CACHE_MAX_SIZE = int(os.getenv("SEARCH_QUERY_CACHE_MAX_SIZE", 1024)) if os.getenv("SEARCH_QUERY_CACHE_MAX_SIZE") != "" else 1024
+                cls.SEARCH_QUERY_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_QUERY_CACHE_TTL_SECONDS", 3600)) if os.getenv("SEARCH_QUERY_CACHE_TTL_SECONDS") != "" else 3600
+                cls.SEARCH_RESULTS_CACHE_MAX_SIZE = int(os.getenv("SEARCH_RESULTS_CACHE_MAX_SIZE", 256)) if os.getenv("SEARCH_RESULTS_CACHE_MAX_SIZE") != "" else 256
+                cls.SEARCH_RESULTS_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_RESULTS_CACHE_TTL_SECONDS", 300)) if os.getenv("SEARCH_RESULTS_CACHE_TTL_SECONDS") != "" else 300
+                cls.EMBEDDING_CACHE_MAX_SIZE = int(os.getenv("EMBEDDING_CACHE_MAX_SIZE", 4096)) if os.getenv("EMBEDDING_CACHE_MAX_SIZE") != "" else 4096
+                cls.EMBEDDING_CACHE_DIRECTORY = os.getenv("EMBEDDING_CACHE_DIRECTORY", "")
+                cls.SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", 10)) if os.getenv("SQL_POOL_SIZE") != "" else 10
+                cls.SQL_QUERY_TIMEOUT_SECONDS = int(os.getenv("SQL_QUERY_TIMEOUT_SECONDS", 30)) if os.getenv("SQL_QUERY_TIMEOUT_SECONDS") != "" else 30
+                cls.SQL_RESULT_MAX_ROWS = int(os.getenv("SQL_RESULT_MAX_ROWS", 500)) if os.getenv("SQL_RESULT_MAX_ROWS") != "" else 500
+                cls.SQL_RESULT_MAX_BYTES = int(os.getenv("SQL_RESULT_MAX_BYTES", 1048576)) if os.getenv("SQL_RESULT_MAX_BYTES") != "" else 1048576
+                cls.SQL_RESULT_MAX_TOKENS = int(os.getenv("SQL_RESULT_MAX_TOKENS", 3000)) if os.getenv("SQL_RESULT_MAX_TOKENS") != "" else 3000
+                cls.SQL_QUERY_CACHE_MAX_SIZE = int(os.getenv("SQL_QUERY_CACHE_MAX_SIZE", 1024)) if os.getenv("SQL_QUERY_CACHE_MAX_SIZE") != "" else 1024
+                cls.SQL_QUERY_CACHE_TTL_SECONDS = int(os.getenv("SQL_QUERY_CACHE_TTL_SECONDS", 3600)) if os.getenv("SQL_QUERY_CACHE_TTL_SECONDS") != "" else 3600
+                cls.SQL_RESULT_CACHE_MAX_SIZE = int(os.getenv("SQL_RESULT_CACHE_MAX_SIZE", 256)) if os.getenv("SQL_RESULT_CACHE_MAX_SIZE") != "" else 256
+                cls.SQL_RESULT_CACHE_TTL_SECONDS = int(os.getenv("SQL_RESULT_CACHE_TTL_SECONDS", 300)) if os.getenv("SQL_RESULT_CACHE_TTL_SECONDS") != "" else 300
+                cls.SQL_RESULT_CACHE_CHANGE_TOKEN_QUERY = os.getenv("SQL_RESULT_CACHE_CHANGE_TOKEN_QUERY", "")
+                cls.SQL_RESULT_CACHE_CHANGE_TOKEN_SECONDS = float(os.getenv("SQL_RESULT_CACHE_CHANGE_TOKEN_SECONDS", 5)) if os.getenv("SQL_RESULT_CACHE_CHANGE_TOKEN_SECONDS") != "" else 5
                 cls.logger.info(f"SEARCH_THRESHOLD_PERCENTAGE: {cls.SEARCH_THRESHOLD_PERCENTAGE}")
 
                 cls._initialized = True
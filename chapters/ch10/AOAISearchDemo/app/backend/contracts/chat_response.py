@@ -10,6 +10,10 @@ class ApproachType(Enum):
     inappropriate = "5"
 
 
+CHIT_CHAT_CANNED_RESPONSE = "I'm sorry, but the question you've asked is outside my area of expertise. I'd be happy to help with any questions related to Microsoft Surface PCs and Laptops. Please feel free to ask about those, and I'll do my best to assist you!"
+INAPPROPRIATE_CANNED_RESPONSE = "I'm sorry, but the question you've asked goes against our content safety policy due to harmful, offensive, or illegal content. I'd be happy to help with any questions related to Microsoft Surface PCs and Laptops. Please feel free to ask about those, and I'll do my best to assist you!"
+
+
 class Answer:
     def __init__(
         self,
@@ -31,6 +35,15 @@ class Answer:
             "query_result": self.query_result,
         }
 
+    @staticmethod
+    def as_item(item: dict):
+        return Answer(
+            item.get("formatted_answer", ""),
+            item.get("query_generation_prompt"),
+            item.get("query"),
+            item.get("query_result"),
+        )
+
 
 class ChatResponse:
     def __init__(
@@ -62,3 +75,18 @@ class ChatResponse:
             else None,
             "show_retry": self.show_retry,
         }
+
+    @staticmethod
+    def as_item(item: dict):
+        return ChatResponse(
+            answer=Answer.as_item(item["answer"]),
+            classification=ApproachType[item["classification"]]
+            if item.get("classification") is not None
+            else None,
+            data_points=item.get("data_points", []),
+            error=item.get("error"),
+            suggested_classification=ApproachType(item["suggested_classification"])
+            if item.get("suggested_classification") is not None
+            else None,
+            show_retry=item.get("show_retry", False),
+        )
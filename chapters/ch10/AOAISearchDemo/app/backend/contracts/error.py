@@ -12,6 +12,11 @@ class UnauthorizedDBAccessException(Exception):
         self.message = message
 
 class ContentFilterException(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+class DeploymentUnavailableException(Exception):
     def __init__(self, message):
         super().__init__(message)
         self.message = message
\ No newline at end of file
@@ -0,0 +1,196 @@
+import atexit
+import queue
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from backend.data_client.data_client import DataClient
+from common.contracts.chat_session import Dialog
+from common.logging.log_helper import CustomLogger
+
+"""
+Dialogs of a conversation waiting to be written again after a failed attempt, split into the batches they were first
+sent in so that every retry reuses the same batch IDs and the data service skips batches that did get written.
+Dialogs enqueued for the conversation in the meantime are held back behind them, so the conversation stays in order.
+"""
+class PendingWrite:
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.batches: List[Tuple[str, List[Dialog]]] = []
+        self.entries = 0
+        self.properties: dict = {}
+        self.attempts = 0
+        self.next_attempt_at = 0.0
+
+    def add(self, entries: List[Tuple[List[Dialog], dict]], max_dialogs_per_batch: int):
+        dialogs = [dialog for entry_dialogs, _ in entries for dialog in entry_dialogs]
+        for i in range(0, len(dialogs), max_dialogs_per_batch):
+            self.batches.append((str(uuid.uuid4()), dialogs[i:i + max_dialogs_per_batch]))
+        self.entries += len(entries)
+        if len(entries) > 0:
+            self.properties = entries[-1][1]
+
+"""
+Write-behind queue persisting chat session dialogs off the request path.
+Dialogs are acknowledged as soon as they are enqueued and flushed to the data service by a background thread,
+which coalesces pending dialogs of the same conversation into as few batch requests as possible.
+A failed write stays pending and is retried with exponential backoff, up to MAX_ATTEMPTS attempts.
+wait_for_conversation gives read-your-writes ordering: it blocks until all dialogs enqueued for a conversation
+by this process have been flushed, so the next turn of the conversation sees them.
+"""
+class ChatSessionWriter:
+    # the data service accepts at most 10 dialogs per batch request
+    MAX_DIALOGS_PER_REQUEST = 10
+    MAX_ATTEMPTS = 8
+    RETRY_BASE_SECONDS = 1.0
+    RETRY_MAX_SECONDS = 60.0
+
+    def __init__(self, data_client: DataClient, logger: CustomLogger, flush_timeout_seconds: float = 30):
+        self.data_client = data_client
+        self.logger = logger
+        self.flush_timeout_seconds = flush_timeout_seconds
+        self._queue: "queue.Queue[Tuple[str, str, List[Dialog], dict, int]]" = queue.Queue()
+        self._pending: Dict[Tuple[str, str], int] = {}
+        # bumped by discard_conversation; entries of an older generation are dropped instead of written
+        self._generations: Dict[Tuple[str, str], int] = {}
+        self._pending_condition = threading.Condition()
+        # only used by the worker thread
+        self._retries: Dict[Tuple[str, str], PendingWrite] = {}
+        self._worker = threading.Thread(target=self._run, name="chat-session-writer", daemon=True)
+        self._worker.start()
+        # bounded, so shutdown does not hang on retries while the data service is down
+        atexit.register(self._flush_at_exit)
+
+    def enqueue(self, user_id: str, conversation_id: str, dialogs: List[Dialog], properties: Optional[dict] = None):
+        with self._pending_condition:
+            key = (user_id, conversation_id)
+            self._pending[key] = self._pending.get(key, 0) + 1
+            generation = self._generations.get(key, 0)
+        self._queue.put((user_id, conversation_id, dialogs, properties or {}, generation))
+
+    """
+    Drops the dialogs of the specified conversation that have not been written yet, including those waiting to be
+    retried, e.g. before the conversation is cleared. A write already in flight is not interrupted: call
+    wait_for_conversation afterwards to wait for it.
+    """
+    def discard_conversation(self, user_id: str, conversation_id: str):
+        key = (user_id, conversation_id)
+        with self._pending_condition:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            self._pending[key] = self._pending.get(key, 0) + 1
+        # wakes the worker up, so dialogs waiting to be retried are dropped now rather than at their next attempt
+        self._queue.put((user_id, conversation_id, [], {}, generation))
+
+    """
+    Blocks until every dialog enqueued for the specified conversation has been written or given up on.
+    Returns False if the timeout expired first.
+    """
+    def wait_for_conversation(self, user_id: str, conversation_id: str, timeout: Optional[float] = None) -> bool:
+        key = (user_id, conversation_id)
+        with self._pending_condition:
+            return self._pending_condition.wait_for(lambda: self._pending.get(key, 0) == 0, timeout)
+
+    """
+    Blocks until the queue has been fully drained. Returns False if the timeout expired first.
+    """
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        with self._pending_condition:
+            return self._pending_condition.wait_for(lambda: len(self._pending) == 0, timeout)
+
+    def _flush_at_exit(self):
+        if not self.flush(self.flush_timeout_seconds):
+            with self._pending_condition:
+                pending_entries = sum(self._pending.values())
+            self.logger.warning(f"gave up persisting {pending_entries} queued chat session entries at exit after {self.flush_timeout_seconds} seconds")
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self._get_next_retry_delay())]
+            except queue.Empty:
+                batch = []
+            # coalesce whatever else is already waiting, so a burst costs one request per conversation
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            grouped: Dict[Tuple[str, str], List[Tuple[List[Dialog], dict]]] = {}
+            with self._pending_condition:
+                generations = dict(self._generations)
+            for user_id, conversation_id, dialogs, properties, generation in batch:
+                key = (user_id, conversation_id)
+                if generation != generations.get(key, 0):
+                    self._complete(key, 1)
+                    continue
+                grouped.setdefault(key, []).append((dialogs, properties))
+
+            now = time.monotonic()
+            due = [key for key, pending_write in self._retries.items() if pending_write.next_attempt_at <= now]
+            for key in list(grouped.keys()) + [key for key in due if key not in grouped]:
+                self._write(key, grouped.get(key, []), generations.get(key, 0))
+
+    def _get_next_retry_delay(self) -> Optional[float]:
+        if len(self._retries) == 0:
+            return None
+        next_attempt_at = min(pending_write.next_attempt_at for pending_write in self._retries.values())
+        return max(next_attempt_at - time.monotonic(), 0)
+
+    def _write(self, key: Tuple[str, str], entries: List[Tuple[List[Dialog], dict]], generation: int):
+        user_id, conversation_id = key
+        pending_write = self._retries.pop(key, None)
+        if pending_write is not None and pending_write.generation != generation:
+            self._complete(key, pending_write.entries)
+            pending_write = None
+        if pending_write is None:
+            pending_write = PendingWrite(generation)
+        pending_write.add(entries, self.MAX_DIALOGS_PER_REQUEST)
+
+        if pending_write.next_attempt_at > time.monotonic():
+            # still backing off: the new dialogs wait behind the ones that failed
+            self._retries[key] = pending_write
+            return
+        if len(pending_write.batches) == 0:
+            self._complete(key, pending_write.entries)
+            return
+
+        dialog_count = sum(len(dialogs) for _, dialogs in pending_write.batches)
+        properties = pending_write.properties
+        pending_write.attempts += 1
+        try:
+            while len(pending_write.batches) > 0:
+                batch_id, dialogs = pending_write.batches[0]
+                self.data_client.add_dialogs_to_chat_session(user_id, conversation_id, dialogs, last_n=0, batch_id=batch_id)
+                pending_write.batches.pop(0)
+            self.logger.info(
+                f"persisted {dialog_count} dialogs to chat session for user {user_id} and session {conversation_id}",
+                extra=properties)
+        except Exception as e:
+            if pending_write.attempts < self.MAX_ATTEMPTS:
+                delay = min(self.RETRY_BASE_SECONDS * 2 ** (pending_write.attempts - 1), self.RETRY_MAX_SECONDS)
+                pending_write.next_attempt_at = time.monotonic() + delay
+                self._retries[key] = pending_write
+                self.logger.warning(
+                    f"failed to persist {dialog_count} dialogs to chat session for user {user_id} and session {conversation_id} "
+                    f"(attempt {pending_write.attempts}), retrying in {delay} seconds: {e}",
+                    extra=properties)
+                return
+            self.logger.exception(
+                f"failed to persist {dialog_count} dialogs to chat session for user {user_id} and session {conversation_id} "
+                f"after {pending_write.attempts} attempts: {e}",
+                extra=properties)
+        self._complete(key, pending_write.entries)
+
+    def _complete(self, key: Tuple[str, str], entries: int):
+        with self._pending_condition:
+            remaining = self._pending.get(key, 0) - entries
+            if remaining > 0:
+                self._pending[key] = remaining
+            else:
+                self._pending.pop(key, None)
+                # nothing of the conversation is queued anymore, so the next entries can start over from generation 0
+                self._generations.pop(key, None)
+            self._pending_condition.notify_all()
@@ -1,15 +1,21 @@
+import aiohttp
+import asyncio
 import copy
 import json
 import requests
+import uuid
 
 from common.contracts.access_rule import AccessRule, Member, Resource
+from common.contracts.chat_context import ChatContext
 from common.contracts.chat_session import ChatSession, Dialog, DialogClassification, ParticipantType
 from common.contracts.resource import ResourceProfile
 from common.contracts.user_profile import UserProfile
+from common.utilities.ttl_cache import TTLCache
 from datetime import datetime
 from enum import Enum
+from requests.adapters import HTTPAdapter
 from tenacity import retry, stop_after_attempt, wait_exponential
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from common.logging.log_helper import CustomLogger
 
@@ -20,9 +26,26 @@ class DataClient:
         PUT="PUT"
         DELETE="DELETE"
 
-    def __init__(self, base_uri: str, logger: CustomLogger):
+    def __init__(self, base_uri: str, logger: CustomLogger, pool_size: int = 10, timeout_seconds: float = 30, keepalive_seconds: float = 60,
+            user_cache_ttl_seconds: float = 300, user_cache_max_size: int = 1024):
         self.base_uri = base_uri
         self.logger = logger
+        self.pool_size = pool_size
+        self.timeout_seconds = timeout_seconds
+        self.keepalive_seconds = keepalive_seconds
+
+        # keep-alive connections to the data service are reused across requests instead of being opened per call
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # aiohttp sessions are bound to the event loop they were created on, so one is kept per loop
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+        # user profiles and resource ACLs rarely change, so repeat turns from the same user are served from memory
+        self.user_profile_cache: TTLCache[UserProfile] = TTLCache(user_cache_max_size, user_cache_ttl_seconds)
+        self.user_resources_cache: TTLCache[List[ResourceProfile]] = TTLCache(user_cache_max_size, user_cache_ttl_seconds)
         
     def check_chat_session(self, user_id: str, conversation_id: str) -> bool:
         path = f"/check-chat-session/{user_id}/{conversation_id}"
@@ -42,14 +65,19 @@ class DataClient:
         json_chat_session = self._make_request(path, self.HttpMethod.POST, payload)
         return ChatSession.as_payload(json_chat_session)
 
-    def get_chat_session(self, user_id: str, conversation_id: str) -> ChatSession:
-        path = f"/chat-sessions/{user_id}/{conversation_id}"
+    def get_or_create_chat_session(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> ChatSession:
+        path = self._with_last_n(f"/get-or-create-chat-session/{user_id}/{conversation_id}", last_n)
+        json_chat_session = self._make_request(path, self.HttpMethod.POST)
+        return ChatSession.as_payload(json_chat_session)
+
+    def get_chat_session(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> ChatSession:
+        path = self._with_last_n(f"/chat-sessions/{user_id}/{conversation_id}", last_n)
         json_chat_session = self._make_request(path, self.HttpMethod.GET)
         return ChatSession.as_payload(json_chat_session)
     
     def add_dialog_to_chat_session(self, user_id: str, conversation_id: str, participant_type: ParticipantType, 
-            timestamp: datetime, utterance: str, classification: DialogClassification) -> ChatSession:
-        path = f"/chat-sessions/{user_id}/{conversation_id}"
+            timestamp: datetime, utterance: str, classification: DialogClassification, last_n: Optional[int] = None) -> ChatSession:
+        path = self._with_last_n(f"/chat-sessions/{user_id}/{conversation_id}", last_n)
         payload = {
             "participant_type": participant_type.value,
             "timestamp": timestamp.isoformat(),
@@ -59,6 +87,17 @@ class DataClient:
         json_chat_session = self._make_request(path, self.HttpMethod.PUT, payload)
         return ChatSession.as_payload(json_chat_session)
     
+    def add_dialogs_to_chat_session(self, user_id: str, conversation_id: str, dialogs: List[Dialog], last_n: Optional[int] = None,
+            batch_id: Optional[str] = None) -> ChatSession:
+        path = self._with_last_n(f"/chat-sessions/{user_id}/{conversation_id}/dialogs", last_n)
+        payload = {
+            "dialogs": [dialog.to_item() for dialog in dialogs],
+            # the same batch ID is sent on every retry, so the data service appends the dialogs only once
+            "batch_id": batch_id or str(uuid.uuid4())
+        }
+        json_chat_session = self._make_request(path, self.HttpMethod.POST, payload)
+        return ChatSession.as_payload(json_chat_session)
+
     def clear_chat_session(self, user_id: str, conversation_id: str):
         path = f"/chat-sessions/{user_id}/{conversation_id}"
         self._make_request(path, self.HttpMethod.DELETE)
@@ -70,15 +109,21 @@ class DataClient:
             "description": description
         }
         json_user_profile = self._make_request(path, self.HttpMethod.POST, payload)
+        self.invalidate_user(user_id)
         return UserProfile.as_payload(json_user_profile)
     
     def get_user_profile(self, user_id: str) -> UserProfile:
+        user_profile = self.user_profile_cache.get(user_id)
+        if user_profile is not None:
+            return user_profile
         path = f"/user-profiles/{user_id}"
         json_user_profile = self._make_request(path, self.HttpMethod.GET)
-        return UserProfile.as_payload(json_user_profile)
+        user_profile = UserProfile.as_payload(json_user_profile)
+        self.user_profile_cache.set(user_id, user_profile)
+        return user_profile
     
     def get_all_user_profiles(self) -> List[UserProfile]:
-        path = f"/user-profiles"
+        path = "/user-profiles"
         json_user_profiles = self._make_request(path, self.HttpMethod.GET)
         return [UserProfile.as_item(json_user_profile) for json_user_profile in json.loads(json_user_profiles)]
 
@@ -99,6 +144,8 @@ class DataClient:
             "members": members
         }
         json_user_profile = self._make_request(path, self.HttpMethod.POST, payload)
+        # an access rule can grant resources to any number of users and groups, so every cached ACL is dropped
+        self.user_resources_cache.clear()
         return AccessRule.as_payload(json_user_profile)
     
     def get_access_rule(self, rule_id: str) -> AccessRule:
@@ -107,9 +154,131 @@ class DataClient:
         return AccessRule.as_payload(json_access_rule)
     
     def get_user_resources(self, user_id: str) -> List[ResourceProfile]:
+        resources = self.user_resources_cache.get(user_id)
+        if resources is not None:
+            return resources
         path = f"/resources/user/{user_id}"
         json_resources = self._make_request(path, self.HttpMethod.GET)
-        return [ResourceProfile.as_item(json_resource) for json_resource in json.loads(json_resources)]
+        resources = [ResourceProfile.as_item(json_resource) for json_resource in json.loads(json_resources)]
+        self.user_resources_cache.set(user_id, resources)
+        return resources
+
+    def get_chat_context(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> ChatContext:
+        cached_chat_context = self._get_cached_user_context(user_id)
+        if cached_chat_context is not None:
+            cached_chat_context.chat_session = self.get_or_create_chat_session(user_id, conversation_id, last_n)
+            return cached_chat_context
+
+        path = self._with_last_n(f"/chat-context/{user_id}/{conversation_id}", last_n)
+        json_chat_context = self._make_request(path, self.HttpMethod.GET)
+        chat_context = self._parse_chat_context(json_chat_context)
+        self._cache_user_context(user_id, chat_context)
+        return chat_context
+
+    async def aget_chat_context(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> ChatContext:
+        cached_chat_context = self._get_cached_user_context(user_id)
+        if cached_chat_context is not None:
+            cached_chat_context.chat_session = await self.aget_or_create_chat_session(user_id, conversation_id, last_n)
+            return cached_chat_context
+
+        path = self._with_last_n(f"/chat-context/{user_id}/{conversation_id}", last_n)
+        json_chat_context = await self._make_request_async(path, self.HttpMethod.GET)
+        chat_context = self._parse_chat_context(json_chat_context)
+        self._cache_user_context(user_id, chat_context)
+        return chat_context
+
+    def invalidate_user(self, user_id: str):
+        self.user_profile_cache.invalidate(user_id)
+        self.user_resources_cache.invalidate(user_id)
+
+    def clear_caches(self):
+        self.user_profile_cache.clear()
+        self.user_resources_cache.clear()
+
+    def get_cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            "user_profiles": self.user_profile_cache.get_stats(),
+            "user_resources": self.user_resources_cache.get_stats()
+        }
+
+    async def aget_or_create_chat_session(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> ChatSession:
+        path = self._with_last_n(f"/get-or-create-chat-session/{user_id}/{conversation_id}", last_n)
+        json_chat_session = await self._make_request_async(path, self.HttpMethod.POST)
+        return ChatSession.as_payload(json_chat_session)
+
+    async def aget_chat_session(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> ChatSession:
+        path = self._with_last_n(f"/chat-sessions/{user_id}/{conversation_id}", last_n)
+        json_chat_session = await self._make_request_async(path, self.HttpMethod.GET)
+        return ChatSession.as_payload(json_chat_session)
+
+    async def aadd_dialogs_to_chat_session(self, user_id: str, conversation_id: str, dialogs: List[Dialog], last_n: Optional[int] = None,
+            batch_id: Optional[str] = None) -> ChatSession:
+        path = self._with_last_n(f"/chat-sessions/{user_id}/{conversation_id}/dialogs", last_n)
+        payload = {
+            "dialogs": [dialog.to_item() for dialog in dialogs],
+            # the same batch ID is sent on every retry, so the data service appends the dialogs only once
+            "batch_id": batch_id or str(uuid.uuid4())
+        }
+        json_chat_session = await self._make_request_async(path, self.HttpMethod.POST, payload)
+        return ChatSession.as_payload(json_chat_session)
+
+    async def aclear_chat_session(self, user_id: str, conversation_id: str):
+        path = f"/chat-sessions/{user_id}/{conversation_id}"
+        await self._make_request_async(path, self.HttpMethod.DELETE)
+
+    async def aget_user_profile(self, user_id: str) -> UserProfile:
+        user_profile = self.user_profile_cache.get(user_id)
+        if user_profile is not None:
+            return user_profile
+        path = f"/user-profiles/{user_id}"
+        json_user_profile = await self._make_request_async(path, self.HttpMethod.GET)
+        user_profile = UserProfile.as_payload(json_user_profile)
+        self.user_profile_cache.set(user_id, user_profile)
+        return user_profile
+
+    async def aget_all_user_profiles(self) -> List[UserProfile]:
+        path = "/user-profiles"
+        json_user_profiles = await self._make_request_async(path, self.HttpMethod.GET)
+        return [UserProfile.as_item(json_user_profile) for json_user_profile in json.loads(json_user_profiles)]
+
+    async def aget_user_resources(self, user_id: str) -> List[ResourceProfile]:
+        resources = self.user_resources_cache.get(user_id)
+        if resources is not None:
+            return resources
+        path = f"/resources/user/{user_id}"
+        json_resources = await self._make_request_async(path, self.HttpMethod.GET)
+        resources = [ResourceProfile.as_item(json_resource) for json_resource in json.loads(json_resources)]
+        self.user_resources_cache.set(user_id, resources)
+        return resources
+
+    def _get_cached_user_context(self, user_id: str) -> Optional[ChatContext]:
+        user_profile = self.user_profile_cache.get(user_id)
+        resources = self.user_resources_cache.get(user_id) if user_profile is not None else None
+        cache_hit = user_profile is not None and resources is not None
+
+        addl_dimension = {
+            "user_cache_hit": cache_hit,
+            "user_cache_hit_ratio": self.user_profile_cache.get_stats()["hit_ratio"]
+        }
+        properties = self.logger.get_updated_properties(addl_dimension)
+        self.logger.info(f"user cache {'hit' if cache_hit else 'miss'} for user {user_id}", extra=properties)
+
+        return ChatContext(user_profile, resources) if cache_hit else None
+
+    def _parse_chat_context(self, json_chat_context: str) -> ChatContext:
+        chat_context = ChatContext.as_payload(json_chat_context)
+        # the data service gets or creates the chat session, so a context without one is a contract violation
+        if chat_context.chat_session is None:
+            raise Exception("Invalid ChatContext payload: missing chat session.")
+        return chat_context
+
+    def _cache_user_context(self, user_id: str, chat_context: ChatContext):
+        self.user_profile_cache.set(user_id, chat_context.user_profile)
+        self.user_resources_cache.set(user_id, chat_context.resources)
+
+    def _with_last_n(self, path: str, last_n: Optional[int]) -> str:
+        # limits the returned chat session to its last N dialogs
+        return path if last_n is None else f"{path}?last_n={last_n}"
 
     @retry(reraise=True, stop = stop_after_attempt(3), wait = wait_exponential(multiplier = 1, max = 60))
     def _make_request(self, path: str, method: HttpMethod, payload: Optional[dict] = None) -> str:
@@ -123,19 +292,19 @@ class DataClient:
         try:
             response: requests.Response
             if method == self.HttpMethod.POST:
-                response = requests.post(url = self.base_uri + path, json = payload, headers=headers)
+                response = self.session.post(url = self.base_uri + path, json = payload, headers=headers, timeout=self.timeout_seconds)
             elif method == self.HttpMethod.GET:
-                response = requests.get(url = self.base_uri + path, json = payload, headers=headers)
+                response = self.session.get(url = self.base_uri + path, json = payload, headers=headers, timeout=self.timeout_seconds)
             elif method == self.HttpMethod.PUT:
-                response = requests.put(url = self.base_uri + path, json = payload, headers=headers)
+                response = self.session.put(url = self.base_uri + path, json = payload, headers=headers, timeout=self.timeout_seconds)
             elif method == self.HttpMethod.DELETE:
-                response = requests.delete(url = self.base_uri + path, json = payload, headers=headers)
+                response = self.session.delete(url = self.base_uri + path, json = payload, headers=headers, timeout=self.timeout_seconds)
             else:
                 raise Exception(f"Invalid HTTP method: {method.value}")
             end_time = datetime.now()
 
             addl_dimension = {
-                "sessionDB_request_time[MS]": (end_time - start_time).microseconds/1000
+                "sessionDB_request_time[MS]": (end_time - start_time).total_seconds()*1000
             }
             properties = self.logger.get_updated_properties(addl_dimension)
 
@@ -144,4 +313,48 @@ class DataClient:
             return response.text
         except requests.RequestException as re:
             self.logger.error(f"Error making {method.value} request to {path} endpoint: {str(re)}", extra=properties)
-            raise Exception(f"Error making {method.value} request to {path} endpoint: {str(re)}")
\ No newline at end of file
+            raise Exception(f"Error making {method.value} request to {path} endpoint: {str(re)}")
+
+    @retry(reraise=True, stop = stop_after_attempt(3), wait = wait_exponential(multiplier = 1, max = 60))
+    async def _make_request_async(self, path: str, method: HttpMethod, payload: Optional[dict] = None) -> str:
+
+        headers = self.logger.get_converation_and_dialog_ids()
+        properties = self.logger.get_updated_properties(headers)
+
+        self.logger.info(f"Making async {method.value} request to {path} endpoint", extra=properties)
+        start_time = datetime.now()
+
+        try:
+            session = self._get_async_session()
+            async with session.request(method.value, self.base_uri + path, json=payload, headers=headers) as response:
+                response_text = await response.text()
+                end_time = datetime.now()
+
+                addl_dimension = {
+                    "sessionDB_request_time[MS]": (end_time - start_time).total_seconds()*1000
+                }
+                properties = self.logger.get_updated_properties(addl_dimension)
+
+                response.raise_for_status()
+                self.logger.info(f"Received response from {path} endpoint", extra=properties)
+                return response_text
+        except aiohttp.ClientError as ce:
+            self.logger.error(f"Error making {method.value} request to {path} endpoint: {str(ce)}", extra=properties)
+            raise Exception(f"Error making {method.value} request to {path} endpoint: {str(ce)}")
+
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive_seconds)
+            session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout_seconds))
+            self._async_sessions[loop] = session
+        return session
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None:
+            await session.close()
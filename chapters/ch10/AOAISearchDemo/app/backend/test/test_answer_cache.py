@@ -0,0 +1,114 @@
+import unittest
+
+from backend.contracts.chat_response import Answer, ApproachType, ChatResponse
+from backend.utilities.access_management import AccessManager
+from backend.utilities.answer_cache import AnswerCache, InMemoryAnswerCacheStore
+from common.contracts.resource import ResourceProfile, ResourceTypes
+from common.utilities.ttl_cache import TTLCache
+from unittest.mock import Mock, patch
+
+SEARCH_RESOURCES = [ResourceProfile("search-index", ResourceTypes.COGNITIVE_SEARCH)]
+SQL_RESOURCES = [ResourceProfile("sql-db", ResourceTypes.SQL_DB)]
+
+def create_response(formatted_answer: str, approach_type: ApproachType) -> ChatResponse:
+    return ChatResponse(answer=Answer(formatted_answer=formatted_answer), classification=approach_type)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class AnswerCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = InMemoryAnswerCacheStore(2, 60)
+        self.store.cache = TTLCache(2, 60, self.clock)
+        self.answer_cache = AnswerCache(self.store, AccessManager(), Mock(), semantic_max_size=2, ttl_seconds=60, similarity_threshold=0.95)
+
+        clock_patcher = patch("backend.utilities.answer_cache.time.monotonic", self.clock)
+        clock_patcher.start()
+        self.addCleanup(clock_patcher.stop)
+
+    def cache_answer(self, utterance: str, approach_type: ApproachType, allowed_resources: list, embedding: list):
+        key = self.answer_cache.get_keys(utterance, [approach_type], allowed_resources, None)[0]
+        self.answer_cache.set(key, create_response(f"answer to {utterance}", approach_type), embedding)
+
+    def test_exact_hit_matches_normalized_utterance(self):
+        # set up cached answer
+        self.cache_answer("What is Surface Pro 9?", ApproachType.unstructured, SEARCH_RESOURCES, [1.0, 0.0])
+
+        # run test
+        keys = self.answer_cache.get_keys("  what is surface pro 9 ", [ApproachType.unstructured], SEARCH_RESOURCES, None)
+        cached_answer = self.answer_cache.get_exact(keys)
+
+        # assert the answer was returned from the exact tier
+        self.assertEqual("exact", cached_answer.tier)
+        self.assertEqual("answer to What is Surface Pro 9?", cached_answer.response.answer.formatted_answer)
+
+    def test_answers_are_scoped_by_access_and_overrides(self):
+        # set up cached answer for users with access to the search index
+        self.cache_answer("What is Surface Pro 9?", ApproachType.unstructured, SEARCH_RESOURCES, [1.0, 0.0])
+
+        # run test for a user without access to it, and for a request with overrides
+        other_access_keys = self.answer_cache.get_keys("What is Surface Pro 9?", [ApproachType.unstructured], [], None)
+        overrides_keys = self.answer_cache.get_keys("What is Surface Pro 9?", [ApproachType.unstructured], SEARCH_RESOURCES, {"top": 1})
+
+        # assert neither tier returned the answer
+        self.assertIsNone(self.answer_cache.get_exact(other_access_keys))
+        self.assertIsNone(self.answer_cache.get_semantic(other_access_keys, [1.0, 0.0]))
+        self.assertIsNone(self.answer_cache.get_exact(overrides_keys))
+        self.assertIsNone(self.answer_cache.get_semantic(overrides_keys, [1.0, 0.0]))
+
+    def test_semantic_hit_requires_similarity_threshold(self):
+        # set up cached answer
+        self.cache_answer("What is Surface Pro 9?", ApproachType.unstructured, SEARCH_RESOURCES, [1.0, 0.0])
+        keys = self.answer_cache.get_keys("Tell me about Surface Pro 9", [ApproachType.unstructured], SEARCH_RESOURCES, None)
+
+        # run test with embeddings just above and just below the threshold (cosine similarity 0.96 and 0.94)
+        similar_answer = self.answer_cache.get_semantic(keys, [0.96, 0.28])
+        dissimilar_answer = self.answer_cache.get_semantic(keys, [0.94, 0.3412])
+
+        # assert only the similar question was answered from the semantic tier
+        self.assertEqual("semantic", similar_answer.tier)
+        self.assertIsNone(dissimilar_answer)
+
+    def test_structured_answers_are_only_matched_exactly(self):
+        # set up cached structured answer
+        self.cache_answer("How many Surface Pro 9 were sold in March?", ApproachType.structured, SQL_RESOURCES, [1.0, 0.0])
+
+        # run test with a near-duplicate question
+        keys = self.answer_cache.get_keys("How many Surface Pro 9 were sold in April?", [ApproachType.structured], SQL_RESOURCES, None)
+
+        # assert the semantic tier was not used for it
+        self.assertListEqual([], self.answer_cache.get_semantic_keys(keys))
+        self.assertIsNone(self.answer_cache.get_semantic(keys, [1.0, 0.0]))
+        self.assertEqual(0, len(self.answer_cache.semantic_index))
+
+    def test_answers_expire_after_ttl(self):
+        # set up cached answer
+        self.cache_answer("What is Surface Pro 9?", ApproachType.unstructured, SEARCH_RESOURCES, [1.0, 0.0])
+        keys = self.answer_cache.get_keys("What is Surface Pro 9?", [ApproachType.unstructured], SEARCH_RESOURCES, None)
+
+        # run test after the TTL expired
+        self.clock.now = 61
+
+        # assert neither tier returned the answer
+        self.assertIsNone(self.answer_cache.get_exact(keys))
+        self.assertIsNone(self.answer_cache.get_semantic(keys, [1.0, 0.0]))
+
+    def test_least_recently_used_answer_is_evicted(self):
+        # set up cache holding 2 answers, the first one being used again after the second one was cached
+        self.cache_answer("What is Surface Pro 9?", ApproachType.unstructured, SEARCH_RESOURCES, [1.0, 0.0])
+        self.cache_answer("What is Surface Laptop 5?", ApproachType.unstructured, SEARCH_RESOURCES, [0.0, 1.0])
+        first_keys = self.answer_cache.get_keys("What is Surface Pro 9?", [ApproachType.unstructured], SEARCH_RESOURCES, None)
+        second_keys = self.answer_cache.get_keys("What is Surface Laptop 5?", [ApproachType.unstructured], SEARCH_RESOURCES, None)
+        self.assertIsNotNone(self.answer_cache.get_exact(first_keys))
+
+        # run test
+        self.cache_answer("What is Surface Studio 2?", ApproachType.unstructured, SEARCH_RESOURCES, [0.6, 0.8])
+
+        # assert the second answer was evicted and the first one was kept
+        self.assertIsNone(self.answer_cache.get_exact(second_keys))
+        self.assertIsNotNone(self.answer_cache.get_exact(first_keys))
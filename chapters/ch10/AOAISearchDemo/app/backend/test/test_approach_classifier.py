@@ -0,0 +1,37 @@
+import unittest
+
+from backend.approaches.approach_classifier import ApproachClassifier
+from backend.approaches.fast_path_classifier import FastPathClassifier
+from backend.contracts.chat_response import ApproachType
+from common.contracts.chat_session import DialogClassification
+from unittest.mock import Mock
+
+def create_history(*utterances: str, question_type: DialogClassification = DialogClassification.structured_query) -> list:
+    history = []
+    for utterance in utterances:
+        history.append({"participant_type": "user", "utterance": utterance, "question_type": question_type.value})
+    return history
+
+class ApproachClassifierTests(unittest.TestCase):
+    def setUp(self):
+        self.approach_classifier = ApproachClassifier(Mock(), FastPathClassifier())
+
+    def test_fast_path_answers_greeting(self):
+        # run test and assert the greeting was classified locally
+        self.assertEqual(ApproachType.chit_chat, self.approach_classifier.run_fast_path(create_history("Hello there!")))
+
+    def test_fast_path_continues_previous_question_type(self):
+        # run test for a continuation after a structured and after an inappropriate question
+        structured = self.approach_classifier.run_fast_path(create_history("How many were sold?", "tell me more"))
+        inappropriate = self.approach_classifier.run_fast_path(
+            create_history("How do I steal one?", "tell me more", question_type=DialogClassification.inappropiate))
+
+        # assert the continuations kept the classification of the previous question
+        self.assertEqual(ApproachType.structured, structured)
+        self.assertEqual(ApproachType.inappropriate, inappropriate)
+
+    def test_fast_path_leaves_questions_to_the_model(self):
+        # run test and assert questions, which the model also checks for inappropriate content, were not classified locally
+        self.assertIsNone(self.approach_classifier.run_fast_path(create_history("How many surface pro 9 were sold last month?")))
+        self.assertIsNone(self.approach_classifier.run_fast_path(
+            create_history("hi, how many surface pro 9 were sold last month and how do I steal one")))
@@ -0,0 +1,77 @@
+import time
+import unittest
+
+from backend.data_client.chat_session_writer import ChatSessionWriter
+from common.contracts.chat_session import Dialog, DialogClassification, ParticipantType
+from datetime import datetime
+from typing import List, Optional, Tuple
+from unittest.mock import Mock
+
+def create_dialog(utterance: str) -> Dialog:
+    return Dialog(ParticipantType.user, utterance, datetime.now(), DialogClassification.chit_chat)
+
+class FlakyDataClient:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.batch_ids: List[str] = []
+        self.written: List[Tuple[str, List[str]]] = []
+
+    def add_dialogs_to_chat_session(self, user_id: str, conversation_id: str, dialogs: List[Dialog], last_n: Optional[int] = None,
+            batch_id: Optional[str] = None):
+        self.batch_ids.append(batch_id)
+        if self.failures > 0:
+            self.failures -= 1
+            raise Exception("Test exception.")
+        self.written.append((conversation_id, [dialog.utterance for dialog in dialogs]))
+
+class ChatSessionWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.retry_base_seconds = ChatSessionWriter.RETRY_BASE_SECONDS
+        ChatSessionWriter.RETRY_BASE_SECONDS = 0.01
+
+    def tearDown(self):
+        ChatSessionWriter.RETRY_BASE_SECONDS = self.retry_base_seconds
+
+    def test_failed_write_is_retried_with_the_same_batch_id(self):
+        # set up writer with a data client failing twice
+        data_client = FlakyDataClient(2)
+        writer = ChatSessionWriter(data_client, Mock())
+
+        # run test
+        writer.enqueue("user_id", "conversation_id", [create_dialog("hello"), create_dialog("hi")])
+
+        # assert the dialogs were written once, after three attempts sharing one batch ID
+        self.assertTrue(writer.wait_for_conversation("user_id", "conversation_id", 5))
+        self.assertListEqual([("conversation_id", ["hello", "hi"])], data_client.written)
+        self.assertEqual(3, len(data_client.batch_ids))
+        self.assertEqual(1, len(set(data_client.batch_ids)))
+
+    def test_discarded_conversation_is_not_written(self):
+        # set up writer with a data client that always fails, so the dialogs wait to be retried
+        data_client = FlakyDataClient(1000)
+        writer = ChatSessionWriter(data_client, Mock())
+        writer.enqueue("user_id", "conversation_id", [create_dialog("hello")])
+
+        # run test
+        writer.discard_conversation("user_id", "conversation_id")
+
+        # assert the pending dialogs were dropped and dialogs enqueued afterwards are written
+        self.assertTrue(writer.wait_for_conversation("user_id", "conversation_id", 5))
+        data_client.failures = 0
+        writer.enqueue("user_id", "conversation_id", [create_dialog("hi")])
+        self.assertTrue(writer.wait_for_conversation("user_id", "conversation_id", 5))
+        self.assertListEqual([("conversation_id", ["hi"])], data_client.written)
+
+    def test_flush_at_exit_gives_up_after_its_timeout(self):
+        # set up writer with a data client that always fails, so the dialogs never get written
+        logger = Mock()
+        writer = ChatSessionWriter(FlakyDataClient(1000), logger, flush_timeout_seconds=0.1)
+        writer.enqueue("user_id", "conversation_id", [create_dialog("hello")])
+
+        # run test
+        started_at = time.monotonic()
+        writer._flush_at_exit()
+
+        # assert shutdown was only held up for the timeout and the dropped entries were reported
+        self.assertLess(time.monotonic() - started_at, 5)
+        self.assertTrue(any("at exit" in call.args[0] for call in logger.warning.call_args_list))
@@ -0,0 +1,197 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from backend.approaches.chatstructured import ChatStructuredApproach
+from backend.cognition.openai_settings import ChatCompletionsSettings
+from backend.config import DefaultConfig
+from backend.contracts.error import UnauthorizedDBAccessException
+from typing import List
+from unittest.mock import MagicMock, Mock, patch
+
+class WordTokenizer:
+    # counts words instead of tokens, so the tests do not need to download a tiktoken encoding
+    def count(self, text: str) -> int:
+        return len(text.split())
+
+    def count_batch(self, texts: List[str]) -> List[int]:
+        return [self.count(text) for text in texts]
+
+class ChatStructuredApproachTests(unittest.TestCase):
+    def setUp(self):
+        # set up a local SQLite stand-in of the SQL Database with 10 sales
+        handle, self.database = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+        conn = sqlite3.connect(self.database)
+        conn.execute("CREATE TABLE Sales (SaleId INTEGER, Product TEXT)")
+        conn.executemany("INSERT INTO Sales VALUES (?, ?)", [(i, f"product {i}") for i in range(10)])
+        conn.execute("CREATE TABLE ChangeToken (Version INTEGER)")
+        conn.execute("INSERT INTO ChangeToken VALUES (1)")
+        conn.commit()
+        conn.close()
+
+        tokenizer_patcher = patch("backend.approaches.chatstructured.get_tokenizer", return_value=WordTokenizer())
+        tokenizer_patcher.start()
+        self.addCleanup(tokenizer_patcher.stop)
+
+    def tearDown(self):
+        os.remove(self.database)
+
+    def create_approach(self, **kwargs) -> ChatStructuredApproach:
+        approach = ChatStructuredApproach(f"sqlite:///{self.database}", Mock(), **kwargs)
+        self.addCleanup(approach.connection_pool.close)
+        return approach
+
+    def execute(self, statement: str):
+        conn = sqlite3.connect(self.database)
+        try:
+            conn.execute(statement)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def count_sales(self) -> int:
+        conn = sqlite3.connect(self.database)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM Sales").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_run_sql_query_refuses_and_rolls_back_changes(self):
+        # set up approach
+        approach = self.create_approach()
+
+        # run test and assert the statement was refused and nothing was deleted
+        with self.assertRaises(UnauthorizedDBAccessException):
+            approach.run_sql_query("DELETE FROM Sales")
+        self.assertEqual(10, self.count_sales())
+
+    def test_run_sql_query_formats_rows(self):
+        # set up approach
+        approach = self.create_approach()
+
+        # run test
+        sql_result = approach.run_sql_query("SELECT SaleId, Product FROM Sales WHERE SaleId < 2 ORDER BY SaleId")
+
+        # assert the rows were rendered under a header line
+        self.assertEqual("SaleId | Product\n0 | product 0\n1 | product 1", sql_result)
+
+    def test_run_sql_query_formats_empty_result(self):
+        # set up approach
+        approach = self.create_approach()
+
+        # run test and assert the empty result was called out
+        self.assertEqual("SaleId\n(no rows)", approach.run_sql_query("SELECT SaleId FROM Sales WHERE SaleId < 0"))
+
+    def test_fetch_rows_stops_at_max_rows(self):
+        # set up approach fetching at most 4 rows, 3 at a time
+        approach = self.create_approach(max_rows=4, fetch_size=3)
+
+        # run test
+        with approach.connection_pool.connection() as conn:
+            columns, rows, truncated = approach.fetch_rows(conn, "SELECT SaleId FROM Sales ORDER BY SaleId")
+
+        # assert only the first 4 rows were fetched and the result was marked as truncated
+        self.assertListEqual(["SaleId"], columns)
+        self.assertListEqual([(0,), (1,), (2,), (3,)], rows)
+        self.assertTrue(truncated)
+
+    def test_fetch_rows_is_not_truncated_at_exactly_max_rows(self):
+        # set up approach fetching at most as many rows as the table has
+        approach = self.create_approach(max_rows=10)
+
+        # run test
+        with approach.connection_pool.connection() as conn:
+            _, rows, truncated = approach.fetch_rows(conn, "SELECT SaleId FROM Sales")
+
+        # assert every row was fetched and the result was not marked as truncated
+        self.assertEqual(10, len(rows))
+        self.assertFalse(truncated)
+
+    def test_fetch_rows_stops_at_max_bytes(self):
+        # set up approach fetching at most 18 bytes of values, i.e. two "product N" values
+        approach = self.create_approach(max_bytes=18)
+
+        # run test
+        with approach.connection_pool.connection() as conn:
+            _, rows, truncated = approach.fetch_rows(conn, "SELECT Product FROM Sales ORDER BY SaleId")
+
+        # assert the rows stopped at the row reaching the byte limit
+        self.assertListEqual([("product 0",), ("product 1",)], rows)
+        self.assertTrue(truncated)
+
+    def test_format_sql_result_keeps_rows_within_max_tokens(self):
+        # set up approach passing at most 7 words of result: the header and 3 rows of 2 words
+        approach = self.create_approach(max_tokens=7)
+
+        # run test
+        sql_result = approach.format_sql_result(["Product"], [(f"product {i}",) for i in range(5)], False)
+
+        # assert the rows beyond the budget were left out with a notice
+        self.assertEqual("Product\nproduct 0\nproduct 1\nproduct 2\n(truncated: showing the first 3 of 5 rows)", sql_result)
+
+    def test_format_sql_result_notes_truncated_fetch(self):
+        # set up approach
+        approach = self.create_approach()
+
+        # run test
+        sql_result = approach.format_sql_result(["SaleId"], [(0,), (1,)], True)
+
+        # assert the notice says the result had more rows than were fetched
+        self.assertEqual("SaleId\n0\n1\n(truncated: showing the first 2 of more than 2 rows)", sql_result)
+
+    def test_generate_sql_query_is_cached(self):
+        # set up approach caching generated SQL queries, and a model answering with a SQL query
+        approach = self.create_approach(query_cache_max_size=10, query_cache_ttl_seconds=60)
+        approach.build_nl_to_sql_messages = Mock(return_value=[
+            {"role": "system", "content": "system prompt"},
+            {"role": "user", "content": "How many sales? SQL Code: "}
+        ])
+        bot_config = Mock()
+        bot_config.get_chat_completions_settings.return_value = ChatCompletionsSettings("gpt-4", temperature=0)
+        nl_to_sql_response = MagicMock()
+        nl_to_sql_response.__getitem__.return_value = [{"message": {"content": "SELECT COUNT(*) FROM Sales"}}]
+        openai_client = Mock()
+        openai_client.chat_completions.return_value = nl_to_sql_response
+
+        # run test, asking the same question twice with a different spelling
+        with patch.object(DefaultConfig, "AZURE_OPENAI_GPT4_SERVICE", "test", create=True), \
+                patch.object(DefaultConfig, "AZURE_OPENAI_GPT4_API_KEY", "test", create=True):
+            first_sql_query = approach.generate_sql_query([{"utterance": "How many sales?"}], bot_config, openai_client)
+            second_sql_query = approach.generate_sql_query([{"utterance": "  how many sales? "}], bot_config, openai_client)
+
+        # assert the model was only called for the first question
+        self.assertEqual("SELECT COUNT(*) FROM Sales", first_sql_query)
+        self.assertEqual("SELECT COUNT(*) FROM Sales", second_sql_query)
+        self.assertEqual(1, openai_client.chat_completions.call_count)
+
+    def test_sql_result_is_cached_until_change_token_moves(self):
+        # set up approach caching SQL results, reading the change token on every query
+        approach = self.create_approach(result_cache_max_size=10, result_cache_ttl_seconds=60,
+                                        change_token_query="SELECT Version FROM ChangeToken", change_token_seconds=0)
+        self.assertEqual("COUNT(*)\n10", approach.run_sql_query("SELECT COUNT(*) FROM Sales"))
+
+        # run test, adding a sale without and then with moving the change token
+        self.execute("INSERT INTO Sales VALUES (10, 'product 10')")
+        cached_sql_result = approach.run_sql_query("SELECT COUNT(*) FROM Sales;")
+        self.execute("UPDATE ChangeToken SET Version = 2")
+        sql_result = approach.run_sql_query("SELECT COUNT(*) FROM Sales")
+
+        # assert the result was served from the cache until the change token moved
+        self.assertEqual("COUNT(*)\n10", cached_sql_result)
+        self.assertEqual("COUNT(*)\n11", sql_result)
+
+    def test_sql_result_cache_is_bypassed_when_change_token_cannot_be_read(self):
+        # set up approach caching SQL results with a change token query that fails
+        approach = self.create_approach(result_cache_max_size=10, result_cache_ttl_seconds=60,
+                                        change_token_query="SELECT Version FROM MissingTable", change_token_seconds=0)
+        self.assertEqual("COUNT(*)\n10", approach.run_sql_query("SELECT COUNT(*) FROM Sales"))
+
+        # run test
+        self.execute("INSERT INTO Sales VALUES (10, 'product 10')")
+        sql_result = approach.run_sql_query("SELECT COUNT(*) FROM Sales")
+
+        # assert the query ran again and nothing was cached
+        self.assertEqual("COUNT(*)\n11", sql_result)
+        self.assertEqual(0, approach.sql_result_cache.get_stats()["size"])
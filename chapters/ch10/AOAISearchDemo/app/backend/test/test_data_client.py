@@ -0,0 +1,51 @@
+import requests
+import unittest
+
+from backend.data_client.data_client import DataClient
+from unittest.mock import Mock, patch
+
+def create_response(text: str) -> Mock:
+    response = Mock()
+    response.text = text
+    return response
+
+def create_data_client() -> DataClient:
+    data_client = DataClient("http://data-service", Mock())
+    data_client.session = Mock()
+    return data_client
+
+class DataClientTests(unittest.TestCase):
+    def test_request_retries_transient_error(self):
+        # set up data client with a session failing once before succeeding
+        data_client = create_data_client()
+        data_client.session.get.side_effect = [requests.ConnectionError("Connection reset."), create_response("[]")]
+
+        # run test without waiting between attempts
+        with patch.object(DataClient._make_request.retry, "sleep"):
+            user_profiles = data_client.get_all_user_profiles()
+
+        # assert the request was retried and returned the response of the second attempt
+        self.assertEqual(2, data_client.session.get.call_count)
+        self.assertListEqual([], user_profiles)
+
+    def test_request_raises_after_three_attempts(self):
+        # set up data client with a session that always fails
+        data_client = create_data_client()
+        data_client.session.delete.side_effect = requests.ConnectionError("Connection reset.")
+
+        # run test and assert the request was attempted three times before the error was raised
+        with patch.object(DataClient._make_request.retry, "sleep"):
+            with self.assertRaises(Exception):
+                data_client.clear_chat_session("user_id", "conversation_id")
+        self.assertEqual(3, data_client.session.delete.call_count)
+
+    def test_chat_context_without_chat_session_raises(self):
+        # set up data client with a data service returning a chat context without chat session
+        data_client = create_data_client()
+        data_client.session.get.return_value = create_response(
+            '{"user_profile": {"user_id": "user_id", "user_name": "user", "description": "", "sample_questions": []}, "resources": [], "chat_session": null}')
+
+        # run test and assert the missing chat session was reported
+        with self.assertRaises(Exception) as context:
+            data_client.get_chat_context("user_id", "conversation_id")
+        self.assertIn("missing chat session", str(context.exception))
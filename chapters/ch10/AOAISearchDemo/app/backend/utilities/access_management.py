@@ -1,3 +1,5 @@
+import hashlib
+
 from backend.contracts.chat_response import ApproachType
 
 
@@ -14,6 +16,12 @@ class AccessManager:
     def is_user_allowed(self, allowed_approaches, approach_type: ApproachType):
         return approach_type.value in allowed_approaches
     
+    def get_access_scope(self, allowed_resources, approach: ApproachType) -> str:
+        # users with access to the same resources of an approach get the same scope, e.g. to share cached answers
+        resource_type = self.map_approach_to_resource(approach)
+        resource_ids = sorted(resource.resource_id for resource in allowed_resources if resource.resource_type.value == resource_type)
+        return hashlib.sha256("\n".join(resource_ids).encode("utf-8")).hexdigest()
+
     def map_approach_to_resource(self, approach: ApproachType):
         if approach == ApproachType.unstructured:
             return "COGNITIVE_SEARCH"
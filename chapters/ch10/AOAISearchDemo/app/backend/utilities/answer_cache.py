@@ -0,0 +1,252 @@
+import hashlib
+import json
+import threading
+import time
+import numpy as np
+from backend.config import DefaultConfig
+from backend.contracts.chat_response import ApproachType, ChatResponse
+from backend.utilities.access_management import AccessManager
+from backend.utilities.text import normalize_utterance
+from collections import OrderedDict
+from common.contracts.resource import ResourceProfile
+from common.logging.log_helper import CustomLogger
+from common.utilities.ttl_cache import TTLCache
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+# approaches whose answers the semantic tier may return for a similar question. Questions about the data that only differ
+# in a date or a product are near-duplicates in embedding space but have different answers, so structured answers are
+# only returned for the same question
+SEMANTIC_APPROACH_TYPES = frozenset([ApproachType.unstructured])
+
+class AnswerCacheKey(NamedTuple):
+    approach_type: ApproachType
+    # approach type, access scope and overrides: the semantic tier only matches entries of the same scope
+    scope: str
+    # scope and normalized utterance: the key of the exact tier
+    key: str
+
+class CachedAnswer(NamedTuple):
+    approach_type: ApproachType
+    response: ChatResponse
+    tier: str
+
+"""
+Storage of the serialized answers, keyed by AnswerCacheKey.key. Implementations expire entries after their TTL and
+bound their size themselves.
+"""
+class AnswerCacheStore:
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str):
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {}
+
+"""
+Process-local store with least-recently-used eviction, also the local stand-in for Redis during development.
+"""
+class InMemoryAnswerCacheStore(AnswerCacheStore):
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.cache: TTLCache[str] = TTLCache(max_size, ttl_seconds)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.cache.get(key)
+
+    def set(self, key: str, value: str):
+        self.cache.set(key, value)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.cache.get_stats()
+
+"""
+Store shared by all instances of the backend on any server speaking the Redis protocol (Redis, Azure Cache for Redis...).
+Entries expire after their TTL; the size is bounded by the maxmemory setting of the server, which should use an LRU
+eviction policy such as allkeys-lru.
+"""
+class RedisAnswerCacheStore(AnswerCacheStore):
+    def __init__(self, url: str, ttl_seconds: float, prefix: str = "answer-cache:"):
+        # optional dependency, only needed when this store is configured
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str):
+        self.client.set(self.prefix + key, value, ex=max(int(self.ttl_seconds), 1))
+
+"""
+In-process index of the utterance embeddings of the cached answers, grouped by scope, with the same TTL as the store
+and least-recently-used eviction. It only points to entries of the store, so an answer evicted from the store is a miss.
+"""
+class SemanticIndex:
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, scope: str, key: str, embedding: List[float]):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, scope, vector / norm)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def search(self, scope: str, embedding: List[float], threshold: float) -> Optional[str]:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, (expires_at, _, _) in self._entries.items() if expires_at <= now]:
+                del self._entries[key]
+            candidates = [(key, entry_vector) for key, (_, entry_scope, entry_vector) in self._entries.items() if entry_scope == scope]
+        if len(candidates) == 0:
+            return None
+        similarities = np.stack([entry_vector for _, entry_vector in candidates]) @ (vector / norm)
+        best = int(np.argmax(similarities))
+        return candidates[best][0] if similarities[best] >= threshold else None
+
+    def remove(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+"""
+Cache of the answers to the first turn of a conversation, in front of the approaches.
+The exact tier matches the normalized utterance; the semantic tier matches the embedding of the utterance against
+those of the cached utterances when the exact tier misses, for the approaches in SEMANTIC_APPROACH_TYPES only. Entries are scoped by approach type, by the resources of
+that approach the user has access to (see AccessManager.get_access_scope) and by the request overrides, so answers are
+only shared between users with the same access.
+"""
+class AnswerCache:
+    def __init__(self, store: AnswerCacheStore, access_manager: AccessManager, logger: CustomLogger, semantic_max_size: int = 1024,
+                 ttl_seconds: float = 3600, similarity_threshold: float = 0.95, semantic_enabled: bool = True):
+        self.store = store
+        self.access_manager = access_manager
+        self.logger = logger
+        self.similarity_threshold = similarity_threshold
+        self.semantic_index = SemanticIndex(semantic_max_size, ttl_seconds) if semantic_enabled else None
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_index is not None
+
+    """
+    Returns the keys to look the utterance up with, one per approach type the answer may come from.
+    """
+    def get_keys(self, utterance: str, approach_types: List[ApproachType], allowed_resources: List[ResourceProfile],
+                 overrides: Optional[dict]) -> List[AnswerCacheKey]:
+        normalized_utterance = self.normalize(utterance)
+        serialized_overrides = json.dumps(overrides or {}, sort_keys=True)
+        keys = []
+        for approach_type in approach_types:
+            access_scope = self.access_manager.get_access_scope(allowed_resources, approach_type)
+            scope = self._hash(approach_type.value, access_scope, serialized_overrides)
+            keys.append(AnswerCacheKey(approach_type, scope, self._hash(scope, normalized_utterance)))
+        return keys
+
+    def get_exact(self, keys: List[AnswerCacheKey]) -> Optional[CachedAnswer]:
+        for key in keys:
+            value = self.store.get(key.key)
+            if value is not None:
+                return self._hit("exact", key, value)
+        return None
+
+    """
+    Returns the keys the semantic tier looks the utterance up with, empty when the tier is disabled.
+    """
+    def get_semantic_keys(self, keys: List[AnswerCacheKey]) -> List[AnswerCacheKey]:
+        if not self.semantic_enabled:
+            return []
+        return [key for key in keys if key.approach_type in SEMANTIC_APPROACH_TYPES]
+
+    def get_semantic(self, keys: List[AnswerCacheKey], embedding: List[float]) -> Optional[CachedAnswer]:
+        for key in self.get_semantic_keys(keys):
+            matched_key = self.semantic_index.search(key.scope, embedding, self.similarity_threshold)
+            if matched_key is None:
+                continue
+            value = self.store.get(matched_key)
+            if value is not None:
+                return self._hit("semantic", key, value)
+            self.semantic_index.remove(matched_key)
+        return None
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+        self.logger.info("answer cache miss", extra=self.logger.get_updated_properties(self.get_stats()))
+
+    def set(self, key: AnswerCacheKey, response: ChatResponse, embedding: Optional[List[float]] = None):
+        self.store.set(key.key, json.dumps({"approach_type": key.approach_type.value, "response": response.to_item()}))
+        if embedding is not None and len(self.get_semantic_keys([key])) > 0:
+            self.semantic_index.add(key.scope, key.key, embedding)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            stats = {
+                "answer_cache_exact_hits": self.exact_hits,
+                "answer_cache_semantic_hits": self.semantic_hits,
+                "answer_cache_misses": self.misses,
+                "answer_cache_hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups > 0 else 0.0
+            }
+        stats.update({f"answer_cache_store_{name}": value for name, value in self.store.get_stats().items()})
+        return stats
+
+    @staticmethod
+    def normalize(utterance: str) -> str:
+        return normalize_utterance(utterance)
+
+    def _hit(self, tier: str, key: AnswerCacheKey, value: str) -> CachedAnswer:
+        with self._lock:
+            if tier == "exact":
+                self.exact_hits += 1
+            else:
+                self.semantic_hits += 1
+        self.logger.info(f"answer cache {tier} hit", extra=self.logger.get_updated_properties(self.get_stats()))
+        item = json.loads(value)
+        return CachedAnswer(ApproachType(item["approach_type"]), ChatResponse.as_item(item["response"]), tier)
+
+    @staticmethod
+    def _hash(*parts: str) -> str:
+        return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+def load_answer_cache(access_manager: AccessManager, logger: CustomLogger) -> Optional[AnswerCache]:
+    if not DefaultConfig.ANSWER_CACHE_ENABLED:
+        return None
+
+    if DefaultConfig.ANSWER_CACHE_STORE == "redis":
+        store = RedisAnswerCacheStore(DefaultConfig.ANSWER_CACHE_REDIS_URL, DefaultConfig.ANSWER_CACHE_TTL_SECONDS)
+    elif DefaultConfig.ANSWER_CACHE_STORE == "memory":
+        store = InMemoryAnswerCacheStore(DefaultConfig.ANSWER_CACHE_MAX_SIZE, DefaultConfig.ANSWER_CACHE_TTL_SECONDS)
+    else:
+        raise Exception(f"Unknown answer cache store {DefaultConfig.ANSWER_CACHE_STORE}")
+    logger.info(f"caching first turn answers in the {DefaultConfig.ANSWER_CACHE_STORE} store")
+    return AnswerCache(
+        store,
+        access_manager,
+        logger,
+        DefaultConfig.ANSWER_CACHE_MAX_SIZE,
+        DefaultConfig.ANSWER_CACHE_TTL_SECONDS,
+        DefaultConfig.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+        DefaultConfig.ANSWER_CACHE_SEMANTIC_ENABLED
+    )
@@ -0,0 +1,122 @@
+import os
+import threading
+from collections.abc import Mapping
+from textwrap import dedent
+from types import MappingProxyType
+from typing import Any, Dict, Iterator, Optional
+
+import yaml
+from backend.cognition.openai_settings import ChatCompletionsSettings, EmbeddingsSettings
+from common.logging.log_helper import CustomLogger
+
+CHAT_COMPLETIONS_SECTIONS = [
+    "approach_classifier",
+    "structured_query_nl_to_sql",
+    "structured_final_answer_generation",
+    "unstructured_search_query_generation",
+    "unstructured_final_answer_generation",
+]
+EMBEDDINGS_SECTION = "embeddings"
+
+
+class InvalidBotConfigError(Exception):
+    pass
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+"""
+Read-only, validated view of bot_config.yaml. Behaves like the parsed dictionary, so sections can still be indexed
+with bot_config["section"]["key"], and additionally exposes values derived once at load time:
+the ChatCompletionsSettings/EmbeddingsSettings of each section and the dedented system prompts.
+"""
+class BotConfig(Mapping):
+    def __init__(self, raw_config: dict):
+        self._validate(raw_config)
+        self._sections = _freeze(raw_config)
+
+        self.chat_completions_settings: Dict[str, ChatCompletionsSettings] = {
+            section: ChatCompletionsSettings(**raw_config[section]["openai_settings"])
+            for section in CHAT_COMPLETIONS_SECTIONS
+        }
+        self.embeddings_settings = EmbeddingsSettings(**raw_config[EMBEDDINGS_SECTION]["openai_settings"])
+        self.system_prompts: Dict[str, str] = {
+            section: dedent(raw_config[section]["system_prompt"])
+            for section in CHAT_COMPLETIONS_SECTIONS
+        }
+
+    def __getitem__(self, key: str) -> Any:
+        return self._sections[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sections)
+
+    def __len__(self) -> int:
+        return len(self._sections)
+
+    def get_chat_completions_settings(self, section: str) -> ChatCompletionsSettings:
+        return self.chat_completions_settings[section]
+
+    def get_system_prompt(self, section: str) -> str:
+        return self.system_prompts[section]
+
+    @staticmethod
+    def _validate(raw_config: Any):
+        if not isinstance(raw_config, dict):
+            raise InvalidBotConfigError("Bot config must be a mapping of sections.")
+
+        for section in CHAT_COMPLETIONS_SECTIONS:
+            section_config = raw_config.get(section)
+            if not isinstance(section_config, dict):
+                raise InvalidBotConfigError(f"Missing bot config section {section}.")
+            for key in ["system_prompt", "history", "openai_settings"]:
+                if key not in section_config:
+                    raise InvalidBotConfigError(f"Missing {key} in bot config section {section}.")
+            if "include" not in section_config["history"]:
+                raise InvalidBotConfigError(f"Missing history.include in bot config section {section}.")
+            if "engine" not in section_config["openai_settings"]:
+                raise InvalidBotConfigError(f"Missing openai_settings.engine in bot config section {section}.")
+
+        embeddings_config = raw_config.get(EMBEDDINGS_SECTION)
+        if not isinstance(embeddings_config, dict) or "engine" not in embeddings_config.get("openai_settings", {}):
+            raise InvalidBotConfigError(f"Missing openai_settings.engine in bot config section {EMBEDDINGS_SECTION}.")
+
+
+"""
+Loads bot_config.yaml once and reloads it only when the file's modification time changes.
+If a changed file fails to parse or validate, the previously loaded config keeps being served.
+"""
+class BotConfigLoader:
+    def __init__(self, path: str, logger: Optional[CustomLogger] = None):
+        self.path = path
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._bot_config: Optional[BotConfig] = None
+        self.get()
+
+    def get(self) -> BotConfig:
+        mtime = os.stat(self.path).st_mtime
+        if self._bot_config is not None and mtime == self._mtime:
+            return self._bot_config
+
+        with self._lock:
+            if self._bot_config is None or mtime != self._mtime:
+                try:
+                    with open(self.path, "r") as bot_config_file:
+                        self._bot_config = BotConfig(yaml.safe_load(bot_config_file))
+                    if self.logger:
+                        self.logger.info(f"loaded bot config from {self.path}")
+                except (yaml.YAMLError, InvalidBotConfigError) as e:
+                    if self._bot_config is None:
+                        raise
+                    if self.logger:
+                        self.logger.error(f"keeping previous bot config, failed to reload {self.path}: {e}")
+                self._mtime = mtime
+            return self._bot_config
@@ -1,38 +1,72 @@
 import json
+import re
+from functools import lru_cache
+from typing import Collection, Dict, List, Optional, Tuple
+
+SLOT_PATTERN = re.compile(r"\{([^{}]+)\}")
+
+class PromptTemplate:
+    """
+    Prompt template parsed once into alternating literal chunks and slot names, so rendering is a single join.
+    Only slots listed in slot_names (or every {name} slot if slot_names is None) are substituted; any other
+    braces, e.g. the {info1.txt} source examples in the system prompts, are kept as literal text.
+    """
+    def __init__(self, template: str, slot_names: Optional[Collection[str]] = None):
+        self.template = template
+        self.parts: List[Tuple[bool, str]] = []
+
+        position = 0
+        for match in SLOT_PATTERN.finditer(template):
+            name = match.group(1)
+            if slot_names is not None and name not in slot_names:
+                continue
+            self.parts.append((False, template[position:match.start()]))
+            self.parts.append((True, name))
+            position = match.end()
+        self.parts.append((False, template[position:]))
+
+    def render(self, values: Dict[str, Optional[str]]) -> str:
+        rendered = []
+        for is_slot, text in self.parts:
+            if not is_slot:
+                rendered.append(text)
+            elif values.get(text) is not None:
+                rendered.append(values[text])
+            else:
+                # slots without a value are left untouched
+                rendered.append("{" + text + "}")
+        return "".join(rendered)
+
+@lru_cache(maxsize=64)
+def compile_template(template: str, slot_names: Optional[Tuple[str, ...]] = None) -> PromptTemplate:
+    return PromptTemplate(template, slot_names)
+
+@lru_cache(maxsize=4096)
+def decode_assistant_utterance(utterance: str) -> Dict[str, Optional[str]]:
+    # assistant utterances are stored as JSON and never change, so each one is only decoded once per process
+    return json.loads(utterance)
 
 def generate_history_messages(history, config):
     formatted_messages = []
-    
-    user_message_format = config["user_message_format"]
-    assistant_message_format = config["assistant_message_format"]
+
+    user_message_template = compile_template(config["user_message_format"])
+    assistant_message_template = compile_template(config["assistant_message_format"])
     history_length = config["length"]
 
     for message in history[-(history_length*2):]:
-        # load the message components from history
-        message_values = message
-        role = ""
-
         # This is dont since assistant messages can have multiple components like "sql_query", "sql_results" etc.
         # TODO: unify all messages to support multiple components natively
         if message["participant_type"] == "user":
-            formatted_message = user_message_format
+            formatted_message = user_message_template.render(message)
             role = "user"
         else:
-            formatted_message = assistant_message_format
-            message_values = json.loads(message["utterance"])
+            formatted_message = assistant_message_template.render(decode_assistant_utterance(message["utterance"]))
             role = "assistant"
-        
-        for key in message_values:
-            if message_values[key] is not None:
-                formatted_message = formatted_message.replace("{" + key + "}", message_values[key])
-        
+
         formatted_messages.append({"role": role, "content": formatted_message})
 
     return formatted_messages
 
 def generate_system_prompt(config, arguments):
-    system_prompt = config["system_prompt"]
-    for argument_name in config["system_prompt_arguments"]:
-        system_prompt = system_prompt.replace("{" + argument_name + "}", arguments[argument_name])
-    
-    return system_prompt
\ No newline at end of file
+    system_prompt_template = compile_template(config["system_prompt"], tuple(config["system_prompt_arguments"]))
+    return system_prompt_template.render(arguments)
@@ -1,5 +1,5 @@
-import tiktoken
 from backend.config import DefaultConfig
+from backend.utilities.tokenizer import get_tokenizer
 from typing import List, Optional
 
 convert_history_to_text = lambda lst: ' '.join(f"{key}: {value}" for conversation in lst for key, value in conversation.items())
@@ -7,41 +7,57 @@ combine_index = lambda idx_lst: ' '.join(idx_lst)
 
 
 def compute_tokens(input_str: str, model_name: Optional[str] = "gpt-4") -> int:
-    encoding = tiktoken.encoding_for_model(model_name)
-    return len(encoding.encode(input_str))
+    return get_tokenizer(model_name).count(input_str)
+
+
+def compute_history_turn_tokens(history: List[dict], model_name: Optional[str] = "gpt-4") -> List[int]:
+    # token count of each conversation turn, encoded once with the separator used by convert_history_to_text
+    return get_tokenizer(model_name).count_batch([' ' + convert_history_to_text([conversation]) for conversation in history])
+
+
+def compute_index_tokens(index: List[str], model_name: Optional[str] = "gpt-4") -> List[int]:
+    # token count of each search result, encoded once with the separator used by combine_index
+    return get_tokenizer(model_name).count_batch([' ' + content for content in index])
 
 
 def trim_history(history: List[dict], max_token_length: int, model_name: Optional[str] = "gpt-4") -> List[dict]:
     if len(history) == 0:
         return history
-    
-    encoding = tiktoken.encoding_for_model(model_name)
-    current_token_length = len(encoding.encode(convert_history_to_text(history)))
 
-    while current_token_length > max_token_length:
+    history_tokens = compute_history_turn_tokens(history, model_name)
+    current_token_length = sum(history_tokens)
+
+    start = 0
+    while current_token_length > max_token_length and start < len(history):
         # Remove the oldest conversation, first element containing user query and second element containing assistant response
-        history = history[2:]
-        current_token_length = len(encoding.encode(convert_history_to_text(history)))    
-    
-    return history
+        current_token_length -= sum(history_tokens[start:start + 2])
+        start += 2
+
+    return history[start:]
 
 
 def trim_history_and_index_combined(history: List[dict], index: List, max_token_length: int, model_name: Optional[str] = "gpt-4") -> List[dict]:
     # start trimming from index first
     trimming_idx = 1
-    
-    encoding = tiktoken.encoding_for_model(model_name)
-    current_token_length = len(encoding.encode(convert_history_to_text(history) + combine_index(index)))
 
-    while current_token_length > max_token_length:
+    history_tokens = compute_history_turn_tokens(history, model_name)
+    index_tokens = compute_index_tokens(index, model_name)
+    current_token_length = sum(history_tokens) + sum(index_tokens)
+
+    history_start = 0
+    index_end = len(index)
+    while current_token_length > max_token_length and (index_end > 0 or history_start < len(history)):
         # Index is ranking based on relevance, remove the last element (least relevant)
-        if len(index) and trimming_idx % (DefaultConfig.RATIO_OF_INDEX_TO_HISTORY + 1) != 0:
-            index.pop()
+        if index_end > 0 and trimming_idx % (DefaultConfig.RATIO_OF_INDEX_TO_HISTORY + 1) != 0:
+            index_end -= 1
+            current_token_length -= index_tokens[index_end]
         # Remove the oldest conversation, first element containing user query and second element containing assistant response
-        elif len(history):
-            history = history[2:]
-        current_token_length = len(encoding.encode(convert_history_to_text(history) + combine_index(index)))
+        elif history_start < len(history):
+            current_token_length -= sum(history_tokens[history_start:history_start + 2])
+            history_start += 2
 
         trimming_idx += 1
-    
-    return history, index
\ No newline at end of file
+
+    # the index is trimmed in place, like the callers expect
+    del index[index_end:]
+    return history[history_start:], index
@@ -0,0 +1,117 @@
+import atexit
+import pyodbc
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple, Union
+
+Connection = Union[pyodbc.Connection, sqlite3.Connection]
+
+# errors raised by the database for a query or a connection, whichever the database is
+DATABASE_ERRORS = (pyodbc.Error, sqlite3.Error)
+
+# connection strings starting with this prefix open a local SQLite database instead, a stand-in for the SQL Database
+# during development (see scripts/prepopulate/populate_sqlite.py)
+SQLITE_PREFIX = "sqlite:///"
+
+"""
+Bounded pool of database connections (pyodbc, or sqlite3 for a local stand-in), so each question does not pay for a new login to the database.
+At most `max_size` connections are open at once; callers wait up to `acquire_timeout_seconds` for one to be released.
+Connections are opened lazily, without autocommit and with `query_timeout_seconds` as their query timeout. Every
+connection is rolled back before it is returned to the pool, so nothing a query changed is ever committed and no
+transaction is left open on a pooled connection. A connection that has been idle for more than
+`health_check_seconds`, or that raised while it was in use, is checked with a trivial query before it is handed out
+again and replaced if it fails.
+SQLite stand-ins have no query timeout.
+"""
+class SqlConnectionPool:
+    HEALTH_CHECK_QUERY = "SELECT 1"
+
+    def __init__(self, connection_string: str, max_size: int = 10, query_timeout_seconds: int = 30, login_timeout_seconds: int = 15,
+                 acquire_timeout_seconds: float = 30, health_check_seconds: float = 60):
+        self.connection_string = connection_string
+        self.max_size = max_size
+        self.query_timeout_seconds = query_timeout_seconds
+        self.login_timeout_seconds = login_timeout_seconds
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        self.health_check_seconds = health_check_seconds
+        # most recently used first, so surplus connections stay idle and are the ones checked before reuse
+        self._idle: "queue.LifoQueue[Tuple[Connection, float]]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        atexit.register(self.close)
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        if not self._slots.acquire(timeout=self.acquire_timeout_seconds):
+            raise Exception(f"No SQL connection available after {self.acquire_timeout_seconds} seconds, all {self.max_size} are in use.")
+        conn: Optional[Connection] = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except BaseException:
+            if conn is not None and not self._is_healthy(conn):
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                if self._rollback(conn):
+                    self._idle.put((conn, time.monotonic()))
+                else:
+                    self._discard(conn)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def _checkout(self) -> Connection:
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used <= self.health_check_seconds or self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def _connect(self) -> Connection:
+        if self.connection_string.startswith(SQLITE_PREFIX):
+            # the connection is handed out to one thread at a time, not necessarily the one that opened it
+            return sqlite3.connect(self.connection_string[len(SQLITE_PREFIX):], timeout=self.login_timeout_seconds,
+                                   check_same_thread=False)
+        conn = pyodbc.connect(self.connection_string, autocommit=False, timeout=self.login_timeout_seconds)
+        conn.timeout = self.query_timeout_seconds
+        return conn
+
+    def _is_healthy(self, conn: Connection) -> bool:
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.HEALTH_CHECK_QUERY).fetchone()
+            finally:
+                cursor.close()
+            return True
+        except DATABASE_ERRORS:
+            return False
+
+    @staticmethod
+    def _rollback(conn: Connection) -> bool:
+        try:
+            conn.rollback()
+            return True
+        except DATABASE_ERRORS:
+            return False
+
+    @staticmethod
+    def _discard(conn: Connection):
+        try:
+            conn.close()
+        except DATABASE_ERRORS:
+            pass
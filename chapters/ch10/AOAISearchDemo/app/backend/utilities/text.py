@@ -1,2 +1,9 @@
+import re
+
 def nonewlines(s: str) -> str:
     return s.replace('\n', ' ').replace('\r', ' ')
+
+
+def normalize_utterance(utterance: str) -> str:
+    # case, whitespace and trailing punctuation do not change the meaning of a question
+    return re.sub(r"\s+", " ", utterance.lower()).strip().rstrip("?!. ")
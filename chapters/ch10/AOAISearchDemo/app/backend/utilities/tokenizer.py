@@ -0,0 +1,67 @@
+import hashlib
+import threading
+import tiktoken
+from backend.config import DefaultConfig
+from common.utilities.ttl_cache import TTLCache
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Process-wide token counting. Holds one tiktoken encoding per model or encoding name and a bounded LRU of
+token counts keyed by (encoding name, content hash), so strings that repeat across turns - system prompts,
+history turns, search results - are only encoded once per process.
+"""
+class Tokenizer:
+    def __init__(self, encoding: tiktoken.Encoding, cache_max_size: int = 8192, num_threads: int = 4):
+        self.encoding = encoding
+        self.num_threads = num_threads
+        # counts never go stale, only the LRU bound applies
+        self._counts: TTLCache[int] = TTLCache(cache_max_size, float("inf"))
+
+    def _key(self, text: str) -> Tuple[str, bytes]:
+        return (self.encoding.name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+
+    def encode(self, text: str) -> List[int]:
+        return self.encoding.encode(text)
+
+    def count(self, text: str) -> int:
+        key = self._key(text)
+        num_tokens = self._counts.get(key)
+        if num_tokens is None:
+            num_tokens = len(self.encoding.encode(text))
+            self._counts.set(key, num_tokens)
+        return num_tokens
+
+    """
+    Counts the tokens of several strings at once. Strings missing from the cache are encoded together with
+    encode_batch, which spreads the work over num_threads threads.
+    """
+    def count_batch(self, texts: List[str]) -> List[int]:
+        keys = [self._key(text) for text in texts]
+        counts: List[Optional[int]] = [self._counts.get(key) for key in keys]
+
+        missing = [i for i, num_tokens in enumerate(counts) if num_tokens is None]
+        if len(missing) > 0:
+            encoded = self.encoding.encode_batch([texts[i] for i in missing], num_threads=self.num_threads)
+            for i, tokens in zip(missing, encoded):
+                counts[i] = len(tokens)
+                self._counts.set(keys[i], counts[i])
+
+        return counts
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._counts.get_stats()
+
+_tokenizers: Dict[str, Tokenizer] = {}
+_tokenizers_lock = threading.Lock()
+
+def get_tokenizer(model_name: Optional[str] = "gpt-4", encoding_name: Optional[str] = None) -> Tokenizer:
+    name = encoding_name or model_name
+    tokenizer = _tokenizers.get(name)
+    if tokenizer is None:
+        with _tokenizers_lock:
+            tokenizer = _tokenizers.get(name)
+            if tokenizer is None:
+                encoding = tiktoken.get_encoding(encoding_name) if encoding_name else tiktoken.encoding_for_model(model_name)
+                tokenizer = Tokenizer(encoding, DefaultConfig.TOKEN_COUNT_CACHE_MAX_SIZE, DefaultConfig.TOKENIZER_THREADS)
+                _tokenizers[name] = tokenizer
+    return tokenizer
@@ -30,6 +30,15 @@ class Resource:
     def __init__(self, resource_id: str):
         self.resource_id = resource_id
 
+    def __hash__(self):
+        return hash(self.resource_id)
+
+    def __eq__(self, other):
+        if isinstance(other, Resource):
+            return self.resource_id == other.resource_id
+        else:
+            return False
+
     def to_item(self) -> dict:
         return {
             "resource_id": self.resource_id,
@@ -0,0 +1,45 @@
+import json
+from typing import List, Optional
+
+from common.contracts.chat_session import ChatSession
+from common.contracts.resource import ResourceProfile
+from common.contracts.user_profile import UserProfile
+from common.utilities.property_item_reader import MissingPropertyError, read_item_property_with_type
+
+"""
+Object bundling everything the backend needs to look up before handling a chat turn:
+the user profile, the resources the user has access to and the chat session.
+"""
+class ChatContext:
+    def __init__(self, user_profile: UserProfile, resources: List[ResourceProfile], chat_session: Optional[ChatSession] = None):
+        self.user_profile = user_profile
+        self.resources = resources
+        self.chat_session = chat_session
+
+    def to_item(self) -> dict:
+        return {
+            "user_profile": self.user_profile.to_item(),
+            "resources": [resource.to_item() for resource in self.resources],
+            "chat_session": self.chat_session.to_item() if self.chat_session is not None else None
+        }
+
+    @staticmethod
+    def as_item(dct: dict):
+        user_profile_dict = read_item_property_with_type(dct, "user_profile", dict, ChatContext)
+        resources_dict = read_item_property_with_type(dct, "resources", list, ChatContext)
+        chat_session_dict = read_item_property_with_type(dct, "chat_session", dict, ChatContext, nullable=True, optional=True)
+
+        user_profile = UserProfile.as_item(user_profile_dict)
+        resources = [ResourceProfile.as_item(resource_dict) for resource_dict in resources_dict]
+        chat_session = ChatSession.as_item(chat_session_dict) if chat_session_dict is not None else None
+
+        return ChatContext(user_profile, resources, chat_session)
+
+    @staticmethod
+    def as_payload(payload: str):
+        dct = json.loads(payload)
+
+        try:
+            return ChatContext.as_item(dct)
+        except MissingPropertyError:
+            raise Exception("Invalid ChatContext payload.")
@@ -0,0 +1,128 @@
+import hashlib
+import math
+import os
+import re
+import struct
+import threading
+import numpy as np
+from common.utilities.ttl_cache import TTLCache
+from typing import Any, Dict, List, Optional, Tuple
+
+# digest of the text (16 bytes), byte offset of the vector in the vectors file, number of dimensions
+INDEX_RECORD = struct.Struct("<16sQI")
+
+"""
+Append-only store of the embeddings of one model in `directory`: the float32 vectors are appended to
+<model>.f32, which is read through a memory map, and <model>.idx maps text digests to vector offsets.
+Writes are appended with O_APPEND, vector first, so several processes (the backend workers, prepdocs.py) can share the
+files; entries written by other processes are picked up when a lookup misses.
+"""
+class DiskEmbeddingStore:
+    def __init__(self, directory: str, model: str):
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.vectors_path = os.path.join(directory, f"{name}.f32")
+        self.index_path = os.path.join(directory, f"{name}.idx")
+        self._offsets: Dict[bytes, Tuple[int, int]] = {}
+        self._index_position = 0
+        self._vectors: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self._refresh_index()
+
+    def get(self, digest: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            location = self._offsets.get(digest)
+            if location is None:
+                self._refresh_index()
+                location = self._offsets.get(digest)
+                if location is None:
+                    return None
+            offset, dimensions = location
+            start = offset // 4
+            if self._vectors is None or start + dimensions > len(self._vectors):
+                # the vectors file has grown since it was mapped
+                self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r")
+            return np.array(self._vectors[start:start + dimensions])
+
+    def set(self, digest: bytes, vector: np.ndarray):
+        data = vector.astype(np.float32).tobytes()
+        with self._lock:
+            if digest in self._offsets:
+                return
+            with open(self.vectors_path, "ab") as vectors_file:
+                vectors_file.write(data)
+                vectors_file.flush()
+                offset = vectors_file.tell() - len(data)
+            # the index entry is only written once the vector it points to is on disk
+            with open(self.index_path, "ab") as index_file:
+                index_file.write(INDEX_RECORD.pack(digest, offset, len(vector)))
+            self._offsets[digest] = (offset, len(vector))
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def _refresh_index(self):
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, "rb") as index_file:
+            index_file.seek(self._index_position)
+            data = index_file.read()
+        # ignore a record that is still being written
+        complete = len(data) - len(data) % INDEX_RECORD.size
+        for digest, offset, dimensions in INDEX_RECORD.iter_unpack(data[:complete]):
+            self._offsets[digest] = (offset, dimensions)
+        self._index_position += complete
+
+"""
+Cache of embedding vectors keyed by (model or deployment, hash of the text), so repeated texts skip the embeddings
+round-trip. Vectors are kept as float32: a least-recently-used in-memory tier of `max_size` vectors, backed by an
+optional memory-mapped tier in `directory` that persists across restarts and is shared by the backend and prepdocs.py.
+"""
+class EmbeddingCache:
+    def __init__(self, max_size: int = 4096, directory: Optional[str] = None):
+        self.directory = directory
+        self._memory: TTLCache[np.ndarray] = TTLCache(max_size, math.inf)
+        self._disk: Dict[str, DiskEmbeddingStore] = {}
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        digest = self._digest(text)
+        vector = self._memory.get((model, digest))
+        if vector is None and self.directory:
+            vector = self._get_disk_store(model).get(digest)
+            if vector is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                self._memory.set((model, digest), vector)
+        return vector.tolist() if vector is not None else None
+
+    def set(self, model: str, text: str, embedding: List[float]):
+        digest = self._digest(text)
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._memory.set((model, digest), vector)
+        if self.directory:
+            self._get_disk_store(model).set(digest, vector)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._memory.get_stats()
+        with self._lock:
+            # every disk hit was first a memory miss
+            lookups = stats["hits"] + stats["misses"]
+            stats["disk_hits"] = self.disk_hits
+            stats["misses"] -= self.disk_hits
+            stats["hit_ratio"] = (stats["hits"] + self.disk_hits) / lookups if lookups > 0 else 0.0
+            stats["disk_size"] = sum(len(store) for store in self._disk.values())
+        return stats
+
+    def _get_disk_store(self, model: str) -> DiskEmbeddingStore:
+        with self._lock:
+            store = self._disk.get(model)
+            if store is None:
+                store = DiskEmbeddingStore(self.directory, model)
+                self._disk[model] = store
+            return store
+
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
@@ -1,17 +1,21 @@
 import json
-from common.contracts.access_rule import Member, Resource
+import sys
+from common.contracts.access_rule import Member, MemberType, Resource
+from common.contracts.chat_context import ChatContext
 from common.contracts.chat_session import Dialog, DialogClassification, ParticipantType
 from common.contracts.group import User
 from common.contracts.resource import ResourceProfile, ResourceTypes
 from common.utilities.property_item_reader import read_item_property_with_type, read_item_property_with_enum, NullValueError, MissingPropertyError
 from data.config import DefaultConfig
 from data.cosmosdb.container import CosmosConflictError
+from data.cosmosdb.registry import CosmosDBContainerRegistry
 from data.managers.chat_sessions.api.manager import SessionNotFoundError, ChatSessionManager
 from data.managers.permissions.manager import PermissionsManager
 from data.managers.entities.api.manager import EntitiesManager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from flask import Flask, Response, request
-from typing import List, Set
+from typing import List, Optional, Set
 
 # initialize config
 DefaultConfig.initialize()
@@ -28,9 +32,22 @@ cosmos_db_chat_sessions_container_name = DefaultConfig.COSMOS_DB_CHAT_SESSIONS_C
 cosmos_db_entities_container_name = DefaultConfig.COSMOS_DB_ENTITIES_CONTAINER_NAME
 cosmos_db_permissions_container_name = DefaultConfig.COSMOS_DB_PERMISSIONS_CONTAINER_NAME
 
-chat_manager = ChatSessionManager(cosmos_db_endpoint, cosmos_db_key, cosmos_db_name, cosmos_db_chat_sessions_container_name)
-entities_manager = EntitiesManager(cosmos_db_endpoint, cosmos_db_key, cosmos_db_name, cosmos_db_entities_container_name)
-permissions_manager = PermissionsManager(cosmos_db_endpoint, cosmos_db_key, cosmos_db_name, cosmos_db_permissions_container_name)
+# run `python data/app.py --provision` once to create the database and containers; otherwise they are expected to exist
+provision = "--provision" in sys.argv or DefaultConfig.DATA_SERVICE_PROVISION
+
+# a single Cosmos DB client and connection pool is shared by all managers
+container_registry = CosmosDBContainerRegistry(cosmos_db_endpoint, cosmos_db_key, provision)
+chat_manager = ChatSessionManager(cosmos_db_endpoint, cosmos_db_key, cosmos_db_name, cosmos_db_chat_sessions_container_name, container_registry)
+entities_manager = EntitiesManager(cosmos_db_endpoint, cosmos_db_key, cosmos_db_name, cosmos_db_entities_container_name, container_registry)
+permissions_manager = PermissionsManager(cosmos_db_endpoint, cosmos_db_key, cosmos_db_name, cosmos_db_permissions_container_name, container_registry)
+
+# open connections before the first request is served
+warm_up_start = datetime.now()
+container_registry.warm_up()
+logger.info(f"Cosmos DB warm-up completed in {(datetime.now() - warm_up_start).total_seconds()*1000} ms (provision: {provision})")
+
+# bounded pool used to fan out independent Cosmos DB lookups within a single request
+prefetch_executor = ThreadPoolExecutor(max_workers=DefaultConfig.DATA_SERVICE_PREFETCH_WORKERS)
 
 @app.route('/chat-sessions/<user_id>/<conversation_id>', methods=['POST'])
 def create_chat_session(user_id: str, conversation_id: str):
@@ -54,7 +71,7 @@ def create_chat_session(user_id: str, conversation_id: str):
         
         end = datetime.now()
         
-        addl_dim = {"create-chat-sessions[MS]": (end - start).microseconds/1000}
+        addl_dim = {"create-chat-sessions[MS]": (end - start).total_seconds()*1000}
         properties = logger.get_updated_properties(addl_dim)
         logger.info(f'chat session created for user_id {user_id} session_id {conversation_id}', extra=properties)
 
@@ -76,11 +93,12 @@ def get_chat_session(user_id: str, conversation_id: str):
     logger.info("get_chat_session", extra=properties)
 
     try:
+        last_n = get_last_n(request)
         start = datetime.now()
-        session = chat_manager.get_chat_session(user_id, conversation_id)
+        session = chat_manager.get_chat_session(user_id, conversation_id, last_n)
         end = datetime.now()
         
-        addl_dim ={"get-chat-sessions[MS]": (end - start).microseconds/1000}
+        addl_dim ={"get-chat-sessions[MS]": (end - start).total_seconds()*1000}
         properties = logger.get_updated_properties(addl_dim)
 
         if session is None:
@@ -89,6 +107,9 @@ def get_chat_session(user_id: str, conversation_id: str):
         else:
             logger.info("get-chat-session: session found", extra=properties)
             return Response(response=json.dumps(session.to_item()), status=200)
+    except ValueError as e:
+        logger.exception(f"get-chat-session: error: {e} ", extra=properties)
+        return Response(response=str(e), status=400)
     except Exception as e:
         logger.exception(f"get-chat-session: error: {e} ", extra=properties)
         return Response(response=str(e), status=500)
@@ -103,7 +124,7 @@ def check_chat_session(user_id: str, conversation_id: str):
         start = datetime.now()
         session = chat_manager.get_chat_session(user_id, conversation_id)
         end = datetime.now()
-        addl_dim= {"get-chat-sessions[MS]":(end - start).microseconds/1000}
+        addl_dim= {"get-chat-sessions[MS]":(end - start).total_seconds()*1000}
         properties = logger.get_updated_properties(addl_dim)
         if session is None:
             logger.info(f"check-chat-session: session not found for user_id {user_id} and conversation_id {conversation_id}", extra=properties)
@@ -115,6 +136,30 @@ def check_chat_session(user_id: str, conversation_id: str):
         logger.exception(f"check-chat-session: error: {e} ", extra=properties)
         return Response(response=str(e), status=500)
 
+@app.route('/get-or-create-chat-session/<user_id>/<conversation_id>', methods=['POST'])
+def get_or_create_chat_session(user_id: str, conversation_id: str):
+
+    properties = get_log_properties(request, user_id)
+    logger.info("get_or_create_chat_session", extra=properties)
+
+    try:
+        last_n = get_last_n(request)
+        start = datetime.now()
+        session, created = chat_manager.get_or_create_chat_session(user_id, conversation_id, last_n)
+        end = datetime.now()
+
+        addl_dim = {"get-or-create-chat-session[MS]": (end - start).total_seconds()*1000}
+        properties = logger.get_updated_properties(addl_dim)
+        logger.info(f"get-or-create-chat-session: session {'created' if created else 'found'} for user_id {user_id} and conversation_id {conversation_id}", extra=properties)
+
+        return Response(response=json.dumps(session.to_item()), status=201 if created else 200)
+    except ValueError as e:
+        logger.exception(f"get-or-create-chat-session: error: {e} ", extra=properties)
+        return Response(response=str(e), status=400)
+    except Exception as e:
+        logger.exception(f"get-or-create-chat-session: error: {e} ", extra=properties)
+        return Response(response=str(e), status=500)
+
 @app.route('/chat-sessions/<user_id>/<conversation_id>', methods=['PUT'])
 def update_chat_session(user_id: str, conversation_id: str):
 
@@ -137,10 +182,12 @@ def update_chat_session(user_id: str, conversation_id: str):
         valid_dialog_classifications = [classification.value for classification in DialogClassification]
         classification = read_item_property_with_enum(body, 'classification', valid_dialog_classifications, DialogClassification)
     
-        session = chat_manager.add_dialog_to_chat_session(user_id, conversation_id, participant_type, timestamp, utterance, classification)
+        last_n = get_last_n(request)
+    
+        session = chat_manager.add_dialog_to_chat_session(user_id, conversation_id, participant_type, timestamp, utterance, classification, last_n)
         end = datetime.now()
 
-        addl_dim= {"update-chat-session[MS]":(end - start).microseconds/1000}
+        addl_dim= {"update-chat-session[MS]":(end - start).total_seconds()*1000}
         properties = logger.get_updated_properties(addl_dim)
         logger.info("update-chat-session: session updated", extra=properties)
 
@@ -155,6 +202,45 @@ def update_chat_session(user_id: str, conversation_id: str):
         logger.exception(f"update-chat-session: error: {e} ", extra=properties)
         return Response(response=str(e), status=500)
     
+@app.route('/chat-sessions/<user_id>/<conversation_id>/dialogs', methods=['POST'])
+def add_dialogs_to_chat_session(user_id: str, conversation_id: str):
+
+    properties = get_log_properties(request, user_id)
+    logger.info("add_dialogs_to_chat_session", extra=properties)
+
+    body = request.json
+    if body is None:
+        logger.error("add-dialogs-to-chat-session: Missing request body.", extra=properties)
+        return Response(response="Missing request body.", status=400)
+
+    try:
+        start = datetime.now()
+
+        dialogs_dict = read_item_property_with_type(body, 'dialogs', list)
+        dialogs = [Dialog.as_item(dialog_dict) for dialog_dict in dialogs_dict]
+        batch_id = body.get('batch_id')
+        if batch_id is not None and not isinstance(batch_id, str):
+            raise TypeError("batch_id must be a string.")
+        last_n = get_last_n(request)
+
+        session = chat_manager.add_dialogs_to_chat_session(user_id, conversation_id, dialogs, last_n, batch_id)
+        end = datetime.now()
+
+        addl_dim = {"add-dialogs-to-chat-session[MS]": (end - start).total_seconds()*1000}
+        properties = logger.get_updated_properties(addl_dim)
+        logger.info(f"add-dialogs-to-chat-session: {len(dialogs)} dialogs added", extra=properties)
+
+        return Response(response=json.dumps(session.to_item()), status=200)
+    except (TypeError, NullValueError, MissingPropertyError, ValueError) as e:
+        logger.exception(f"add-dialogs-to-chat-session: error: {e} ", extra=properties)
+        return Response(response=str(e), status=400)
+    except SessionNotFoundError as e:
+        logger.exception(f"add-dialogs-to-chat-session: error: {e} ", extra=properties)
+        return Response(response=str(e), status=404)
+    except Exception as e:
+        logger.exception(f"add-dialogs-to-chat-session: error: {e} ", extra=properties)
+        return Response(response=str(e), status=500)
+
 @app.route('/chat-sessions/<user_id>/<conversation_id>', methods=['DELETE'])
 def clear_chat_session(user_id: str, conversation_id: str):
     try:
@@ -227,6 +313,7 @@ def create_user_group(group_id: str):
                 users.add(User.as_item(user_dict))
 
         user_group = entities_manager.create_user_group(group_id, group_name, users)
+        invalidate_effective_resources([Member(user.user_id, MemberType.USER) for user in users])
         return Response(response=json.dumps(user_group.to_item()), status=201)
     except (TypeError, NullValueError, MissingPropertyError) as e:
         return Response(response=str(e), status=400)
@@ -271,6 +358,7 @@ def update_user_group(group_id: str):
             new_users.add(User.as_item(user_dict))
     
         user_group = entities_manager.add_users_to_user_group(group_id, new_users)
+        invalidate_effective_resources([Member(user.user_id, MemberType.USER) for user in new_users])
         return Response(response=json.dumps(user_group.to_item()), status=200)
     except (TypeError, NullValueError, MissingPropertyError, ValueError) as e:
         return Response(response=str(e), status=400)
@@ -312,22 +400,103 @@ def get_resource(resource_id: str):
 @app.route('/resources/user/<user_id>', methods=['GET'])
 def get_user_resources(user_id: str):
     try:
-        user_profile = entities_manager.get_user_profile(user_id)
-        if user_profile is None:
+        resource_profiles = resolve_user_resources(user_id)
+        if resource_profiles is None:
             return Response(response=f"User with user_id {user_id} not found.", status=404)
-        user_groups = entities_manager.get_user_member_groups(user_id)
-        resources = permissions_manager.get_user_resources(user_profile, user_groups)
-        
-        resource_profiles: List[ResourceProfile] = []
-        for resource in resources:
-            resource_profile = entities_manager.get_resource(resource.resource_id)
-            if resource_profile is not None:
-                resource_profiles.append(resource_profile)
-            else:
-                return Response(response="Could not find resource profile for resource ID {resource.resource_id}.", status=500)
         return Response(response=json.dumps([resource_profile.to_item() for resource_profile in resource_profiles]), status=200)
     except Exception as e:
         return Response(response=str(e), status=500)
+
+@app.route('/chat-context/<user_id>/<conversation_id>', methods=['GET'])
+def get_chat_context(user_id: str, conversation_id: str):
+
+    properties = get_log_properties(request, user_id)
+    logger.info("get_chat_context", extra=properties)
+
+    try:
+        last_n = get_last_n(request)
+        start = datetime.now()
+
+        # the three lookups run concurrently and the caller pays for a single round-trip; resolving the resources reuses
+        # the profile being fetched alongside instead of reading it again
+        user_profile_future = prefetch_executor.submit(entities_manager.get_user_profile, user_id)
+        resources_future = prefetch_executor.submit(resolve_user_resources, user_id, user_profile_future)
+        session_future = prefetch_executor.submit(chat_manager.get_chat_session, user_id, conversation_id, last_n)
+
+        user_profile = user_profile_future.result()
+        resource_profiles = resources_future.result()
+        session = session_future.result()
+
+        if user_profile is None or resource_profiles is None:
+            logger.info(f"get-chat-context: user with user_id {user_id} not found", extra=properties)
+            return Response(response=f"User with user_id {user_id} not found.", status=404)
+
+        # the session is only created once the user is known to exist, so unknown users never leave empty sessions behind
+        session_created = False
+        if session is None:
+            session, session_created = chat_manager.get_or_create_chat_session(user_id, conversation_id, last_n)
+
+        end = datetime.now()
+
+        addl_dim = {"get-chat-context[MS]": (end - start).total_seconds()*1000}
+        properties = logger.get_updated_properties(addl_dim)
+
+        logger.info(f"get-chat-context: context loaded, session {'created' if session_created else 'found'}", extra=properties)
+        chat_context = ChatContext(user_profile, resource_profiles, session)
+        return Response(response=json.dumps(chat_context.to_item()), status=200)
+    except ValueError as e:
+        logger.exception(f"get-chat-context: error: {e} ", extra=properties)
+        return Response(response=str(e), status=400)
+    except Exception as e:
+        logger.exception(f"get-chat-context: error: {e} ", extra=properties)
+        return Response(response=str(e), status=500)
+
+"""
+Resolves the profiles of all resources the user with the specified user ID has access to.
+Uses a constant number of Cosmos DB requests regardless of how many groups and resources are involved and,
+if enabled, serves and stores the result as a materialized per-user document.
+Returns None if no such user exists. If the user profile is already being fetched, pass its future to reuse it.
+"""
+def resolve_user_resources(user_id: str, user_profile_future: Optional[Future] = None) -> Optional[List[ResourceProfile]]:
+    etag = None
+    if DefaultConfig.DATA_SERVICE_MATERIALIZE_EFFECTIVE_RESOURCES:
+        effective_resources, etag = entities_manager.get_effective_resources(user_id)
+        if effective_resources is not None:
+            return effective_resources
+
+    user_profile = user_profile_future.result() if user_profile_future is not None else entities_manager.get_user_profile(user_id)
+    if user_profile is None:
+        return None
+    user_groups = entities_manager.get_user_member_groups(user_id, check_user_exists=False)
+    resources = permissions_manager.get_user_resources(user_profile, user_groups)
+
+    resource_ids = sorted(resource.resource_id for resource in resources)
+    resource_profiles = entities_manager.get_resources(resource_ids)
+    missing_resource_ids = set(resource_ids) - set(resource_profile.resource_id for resource_profile in resource_profiles)
+    if len(missing_resource_ids) > 0:
+        raise Exception(f"Could not find resource profile for resource ID {sorted(missing_resource_ids)[0]}.")
+
+    if DefaultConfig.DATA_SERVICE_MATERIALIZE_EFFECTIVE_RESOURCES:
+        # not stored if the list was invalidated while it was being resolved, as it may reflect the old access rules
+        entities_manager.set_effective_resources(user_id, resource_profiles, etag)
+    return resource_profiles
+
+"""
+Invalidates the materialized resource lists of every user affected by a change to the specified access rule members.
+"""
+def invalidate_effective_resources(members: List[Member]):
+    if not DefaultConfig.DATA_SERVICE_MATERIALIZE_EFFECTIVE_RESOURCES:
+        return
+
+    user_ids: Set[str] = set()
+    for member in members:
+        if member.member_type == MemberType.USER:
+            user_ids.add(member.id)
+        else:
+            user_group = entities_manager.get_user_group(member.id)
+            if user_group is not None:
+                user_ids.update(user.user_id for user in user_group.users)
+    entities_manager.invalidate_effective_resources(user_ids)
     
 @app.route('/access-rules/<rule_id>', methods=['POST'])
 def create_access_rule(rule_id: str):
@@ -348,6 +517,7 @@ def create_access_rule(rule_id: str):
             resources.append(Resource.as_item(resource_dict))
 
         access_rule = permissions_manager.create_access_rule(rule_id, resources, members)
+        invalidate_effective_resources(members)
         return Response(response=json.dumps(access_rule.to_item()), status=201)
     except (TypeError, NullValueError, MissingPropertyError) as e:
         return Response(response=str(e), status=400)
@@ -375,8 +545,24 @@ def get_log_properties(request, user_id: str) -> dict:
 
     dim = logger.get_converation_and_dialog_ids()
     return logger.get_updated_properties({**dim, "user_id": user_id})
+
+"""
+Reads the optional last_n query parameter, which limits chat sessions to their last N dialogs.
+Raises a ValueError if the parameter is not a non-negative integer.
+"""
+def get_last_n(request) -> Optional[int]:
+    last_n = request.args.get('last_n', None)
+    if last_n is None:
+        return None
+    last_n = int(last_n)
+    if last_n < 0:
+        raise ValueError(f"last_n must be a non-negative integer, got {last_n}.")
+    return last_n
     
 if __name__ == '__main__':
+    if "--provision" in sys.argv:
+        logger.info("Cosmos DB database and containers provisioned.")
+        sys.exit(0)
     host = DefaultConfig.DATA_SERVICE_HOST
     port = int(DefaultConfig.DATA_SERVICE_PORT)
     app.run(host=host, port=port)
\ No newline at end of file
@@ -40,7 +40,7 @@ class Config_Reader():
             start = datetime.now()
             value = self._get_secret_from_keyvault(key_name)
             end = datetime.now()
-            duration = (end - start).microseconds/1000
+            duration = (end - start).total_seconds()*1000
             addl_dimension = {"keyvault_duration": duration}
             
             if self.logger:
@@ -76,6 +76,11 @@ class DefaultConfig:
 
                 cls.DATA_SERVICE_HOST = os.getenv("DATA-SERVICE-HOST", "") if os.getenv("DATA-SERVICE-HOST") != "" else ""
                 cls.DATA_SERVICE_PORT = os.getenv("DATA-SERVICE-PORT", "") if os.getenv("DATA-SERVICE-PORT") != "" else ""
+                cls.DATA_SERVICE_PREFETCH_WORKERS = int(os.getenv("DATA-SERVICE-PREFETCH-WORKERS", 8)) if os.getenv("DATA-SERVICE-PREFETCH-WORKERS") != "" else 8
+                cls.DATA_SERVICE_MATERIALIZE_EFFECTIVE_RESOURCES = os.getenv("DATA-SERVICE-MATERIALIZE-EFFECTIVE-RESOURCES", "false").lower() == "true"
+                # create the Cosmos DB database and containers on startup; skipped in production, where they are provisioned by the infra templates
+                default_provision = "false" if os.getenv("ENVIRONMENT") == "PROD" else "true"
+                cls.DATA_SERVICE_PROVISION = os.getenv("DATA-SERVICE-PROVISION", default_provision).lower() == "true"
 
                 cls._initialized = True
                 
@@ -1,3 +1,4 @@
+from azure.core import MatchConditions
 from azure.cosmos import CosmosClient, PartitionKey
 from azure.cosmos.exceptions import CosmosHttpResponseError
 from typing import Any, Dict, List, Optional
@@ -5,16 +6,34 @@ from typing import Any, Dict, List, Optional
 class CosmosConflictError(BaseException):
     pass
 
+class CosmosNotFoundError(BaseException):
+    pass
+
+class CosmosPreconditionFailedError(BaseException):
+    pass
+
 class CosmosDBContainer:
-    def __init__(self, database_name: str, container_name: str, partition_key_name: str, client: CosmosClient, unique_keys: Optional[List[Dict[str, Any]]] = None):
+    def __init__(self, database_name: str, container_name: str, partition_key_name: str, client: CosmosClient, unique_keys: Optional[List[Dict[str, Any]]] = None, provision: bool = True):
         database_name = database_name
         self.container_name = container_name
         self.client = client
-        database = client.create_database_if_not_exists(id=database_name)
         self.partition_key_name = partition_key_name
-        partition_key = PartitionKey(path="/" + partition_key_name)
-        unique_key_policy = { 'uniqueKeys': unique_keys } if unique_keys is not None else None
-        self.container = database.create_container_if_not_exists(id=container_name, partition_key=partition_key, unique_key_policy=unique_key_policy)
+        if provision:
+            database = client.create_database_if_not_exists(id=database_name)
+            partition_key = PartitionKey(path="/" + partition_key_name)
+            unique_key_policy = { 'uniqueKeys': unique_keys } if unique_keys is not None else None
+            self.container = database.create_container_if_not_exists(id=container_name, partition_key=partition_key, unique_key_policy=unique_key_policy)
+        else:
+            # the database and container must already exist (created by the infra templates or a provisioning run),
+            # so no management requests are made and the proxy is built locally
+            self.container = client.get_database_client(database_name).get_container_client(container_name)
+
+    def warm_up(self):
+        # reads the container properties, which opens a connection and fills the client's metadata caches
+        try:
+            self.container.read()
+        except CosmosHttpResponseError as e:
+            raise Exception(f"Error warming up Cosmos DB container {self.container_name}: {e.message}.")
 
     def create_item(self, id: str, partition_key: str, item: Dict[str, Any]) -> Dict[str, Any]:
         try:
@@ -29,22 +48,11 @@ class CosmosDBContainer:
         
     def get_item(self, id: str, partition_key: str) -> Optional[Dict[str, Any]]:
         try:
-            query = "SELECT * FROM c WHERE c.id = @item_id"
-            params: List[Dict[str, object]] = [
-                dict(name="@item_id", value=id)
-            ]
-
-            results = self.container.query_items(
-                query=query, parameters=params, partition_key=partition_key
-            )
-            items = [item for item in results]
-
-            if len(items) == 0:
-                return None
-            elif len(items) > 1:
-                raise Exception(f"Multiple items found with the same id {id} in container {self.container_name}.")
-            return items[0]
+            # id and partition key are both known, so a point read is used instead of a query
+            return self.container.read_item(item=id, partition_key=partition_key)
         except CosmosHttpResponseError as e:
+            if e.status_code == 404:
+                return None
             raise Exception(f"Error getting item from Cosmos DB container: {e.message}.")
         
     def get_all_items(self, partition_key: str) -> List[Dict[str, Any]]:
@@ -58,20 +66,44 @@ class CosmosDBContainer:
         except CosmosHttpResponseError as e:
             raise Exception(F"Error getting all items from Cosmos DB container: {e.message}.")
         
-    def update_item(self, id: str, partition_key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+    def update_item(self, id: str, partition_key: str, item: Dict[str, Any], etag: Optional[str] = None) -> Dict[str, Any]:
+        # with an etag, the item is only replaced if it has not changed since it was read with that etag
+        kwargs = {"etag": etag, "match_condition": MatchConditions.IfNotModified} if etag is not None else {}
         try:
             item["id"] = id
             item[self.partition_key_name] = partition_key
-            return self.container.replace_item(id, item)
+            return self.container.replace_item(id, item, **kwargs)
         except CosmosHttpResponseError as e:
+            if e.status_code == 412:
+                raise CosmosPreconditionFailedError(f"Item with id {id} has changed since it was read.")
             raise Exception(f"Error updating item in Cosmos DB container: {e.message}.")
         
+    def upsert_item(self, id: str, partition_key: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        try:
+            item["id"] = id
+            item[self.partition_key_name] = partition_key
+            return self.container.upsert_item(item)
+        except CosmosHttpResponseError as e:
+            raise Exception(f"Error upserting item in Cosmos DB container: {e.message}.")
+
+    def patch_item(self, id: str, partition_key: str, patch_operations: List[Dict[str, Any]], filter_predicate: Optional[str] = None) -> Dict[str, Any]:
+        # the patch is only applied if the item matches the filter predicate, e.g. "FROM c WHERE c.status = 'open'"
+        kwargs = {"filter_predicate": filter_predicate} if filter_predicate is not None else {}
+        try:
+            return self.container.patch_item(item=id, partition_key=partition_key, patch_operations=patch_operations, **kwargs)
+        except CosmosHttpResponseError as e:
+            if e.status_code == 404:
+                raise CosmosNotFoundError(f"Item with id {id} does not exist in container {self.container_name}.")
+            if e.status_code == 412:
+                raise CosmosPreconditionFailedError(f"Item with id {id} does not match the filter predicate of the patch.")
+            raise Exception(f"Error patching item in Cosmos DB container: {e.message}.")
+
     def delete_item(self, id: str, partition_key):
         try:
-            item = self.get_item(id, partition_key)
-            if item is not None:
-                self.container.delete_item(item, partition_key=partition_key)
+            self.container.delete_item(item=id, partition_key=partition_key)
         except CosmosHttpResponseError as e:
+            if e.status_code == 404:
+                return
             raise Exception(f"Error deleting item from Cosmos DB container: {e.message}.")
         
     def query_items(self, query: str, params: List[Dict[str, object]], partition_key: str) -> List[Dict[str, Any]]:
@@ -0,0 +1,29 @@
+from azure.cosmos import CosmosClient
+from data.cosmosdb.container import CosmosDBContainer
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Holds the single CosmosClient of a process and the containers opened through it, so every manager shares one
+connection pool and metadata cache instead of building its own client.
+If provision is False, containers are opened without the idempotent create-if-not-exists calls.
+"""
+class CosmosDBContainerRegistry:
+    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, provision: bool = True):
+        self.client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
+        self.provision = provision
+        self._containers: Dict[Tuple[str, str], CosmosDBContainer] = {}
+
+    def get_container(self, database_name: str, container_name: str, partition_key_name: str, unique_keys: Optional[List[Dict[str, Any]]] = None) -> CosmosDBContainer:
+        key = (database_name, container_name)
+        container = self._containers.get(key)
+        if container is None:
+            container = CosmosDBContainer(database_name, container_name, partition_key_name, self.client, unique_keys, self.provision)
+            self._containers[key] = container
+        return container
+
+    """
+    Opens a connection to every registered container ahead of the first request.
+    """
+    def warm_up(self):
+        for container in self._containers.values():
+            container.warm_up()
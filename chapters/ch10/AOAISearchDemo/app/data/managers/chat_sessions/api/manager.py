@@ -1,10 +1,12 @@
+import uuid
 from azure.cosmos import CosmosClient
 from common.contracts.chat_session import ChatSession, Dialog, DialogClassification, ParticipantType
-from data.cosmosdb.container import CosmosDBContainer, CosmosConflictError
+from data.cosmosdb.container import CosmosDBContainer, CosmosConflictError, CosmosNotFoundError, CosmosPreconditionFailedError
+from data.cosmosdb.registry import CosmosDBContainerRegistry
 from datetime import datetime
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-class SessionNotFoundError(BaseException):
+class SessionNotFoundError(Exception):
     pass
 
 """
@@ -15,10 +17,16 @@ class ChatSessionManager:
     UNIQUE_KEYS = [
         {"paths": [f"/{PARTITION_KEY_NAME}"]}
     ]
+    # Cosmos DB accepts at most 10 operations in a single patch request
+    MAX_DIALOGS_PER_BATCH = 10
 
-    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, cosmos_db_name: str, cosmos_db_chat_sessions_container_name: str):
-        cosmos_client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
-        self.container = CosmosDBContainer(cosmos_db_name, cosmos_db_chat_sessions_container_name, self.PARTITION_KEY_NAME, cosmos_client, self.UNIQUE_KEYS)
+    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, cosmos_db_name: str, cosmos_db_chat_sessions_container_name: str,
+            container_registry: Optional[CosmosDBContainerRegistry] = None):
+        if container_registry is not None:
+            self.container = container_registry.get_container(cosmos_db_name, cosmos_db_chat_sessions_container_name, self.PARTITION_KEY_NAME, self.UNIQUE_KEYS)
+        else:
+            cosmos_client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
+            self.container = CosmosDBContainer(cosmos_db_name, cosmos_db_chat_sessions_container_name, self.PARTITION_KEY_NAME, cosmos_client, self.UNIQUE_KEYS)
     
     """
     Creates a new chat session with the specified conversation ID and optional initial conversation.
@@ -35,42 +43,118 @@ class ChatSessionManager:
 
     """
     Retrieves and deserializes a chat session using the specified conversation ID.
+    If last_n is specified, only the last N dialogs of the conversation are read from storage.
     Returns None if no chat session witht with the specified conversation ID exists.
     Raises an exception if deserialization of any expected property fails.
     """
-    def get_chat_session(self, user_id: str, conversation_id: str) -> Optional[ChatSession]:
-        item = self.container.get_item(conversation_id, f"{user_id}|{conversation_id}")
+    def get_chat_session(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> Optional[ChatSession]:
+        partition_key = f"{user_id}|{conversation_id}"
+        if last_n is None:
+            item = self.container.get_item(conversation_id, partition_key)
+        else:
+            item = self._get_chat_session_tail(conversation_id, partition_key, last_n)
         if item is None:
             return None
         
         return ChatSession.as_item(item)
     
+    """
+    Retrieves the chat session with the specified conversation ID, creating an empty one if it does not exist yet.
+    If last_n is specified, only the last N dialogs of an existing conversation are read from storage.
+    Returns the chat session and whether it was created by this call.
+    """
+    def get_or_create_chat_session(self, user_id: str, conversation_id: str, last_n: Optional[int] = None) -> Tuple[ChatSession, bool]:
+        partition_key = f"{user_id}|{conversation_id}"
+        chat_session = self.get_chat_session(user_id, conversation_id, last_n)
+        if chat_session is not None:
+            return chat_session, False
+
+        try:
+            created_item = self.container.create_item(conversation_id, partition_key, ChatSession(user_id, conversation_id, []).to_item())
+            return ChatSession.as_item(created_item), True
+        except CosmosConflictError:
+            # another request created the session between the read and the insert
+            chat_session = self.get_chat_session(user_id, conversation_id, last_n)
+            if chat_session is None:
+                raise SessionNotFoundError(f"Chat session with conversation ID {conversation_id} could not be found.")
+            return chat_session, False
+
     """
     Clears the chat session with the specified conversation ID.
     Raises an exception if no chat session exists with the specified conversation ID.
     """
     def clear_chat_session(self, user_id: str, conversation_id: str):
-        chat_session = self.get_chat_session(user_id, conversation_id)
-        if chat_session is None:
-            raise SessionNotFoundError(f"Chat session with conversation ID {conversation_id} could not be found.")
-        
-        chat_session.clear_conversation()
-        item = chat_session.to_item()
         partition_key = f"{user_id}|{conversation_id}"
-        self.container.update_item(conversation_id, partition_key, item)
+        try:
+            self.container.patch_item(conversation_id, partition_key, [
+                {"op": "set", "path": "/conversation", "value": []}
+            ])
+        except CosmosNotFoundError:
+            raise SessionNotFoundError(f"Chat session with conversation ID {conversation_id} could not be found.")
 
     """
     Adds a new dialog to the chat session with the specified conversation ID.
+    The dialog is appended in place with a patch operation, so the session document is neither read nor rewritten.
+    If last_n is specified, only the last N dialogs of the updated conversation are returned.
     Raises an exception if no chat session exists with the specified conversation ID.
     """
     def add_dialog_to_chat_session(self, user_id: str, conversation_id: str, participant_type: ParticipantType, 
-            timestamp: datetime, utterance: str, classification: DialogClassification) -> ChatSession:
+            timestamp: datetime, utterance: str, classification: DialogClassification, last_n: Optional[int] = None) -> ChatSession:
         dialog = Dialog(participant_type, utterance, timestamp, classification)
-        chat_session = self.get_chat_session(user_id, conversation_id)
-        if chat_session is None:
-            raise SessionNotFoundError(f"Chat session with conversation ID {conversation_id} could not be found.")
-        chat_session.add_dialog(dialog)
-        item = chat_session.to_item()
+        return self.add_dialogs_to_chat_session(user_id, conversation_id, [dialog], last_n)
+
+    """
+    Atomically appends the specified dialogs, in order, to the chat session with the specified conversation ID.
+    All dialogs are sent in a single patch request, which Cosmos DB applies all-or-nothing.
+    If last_n is specified, only the last N dialogs of the updated conversation are returned.
+    Appending is not idempotent: a request retried after its response was lost appends the dialogs again, unless a
+    batch_id (a UUID chosen by the caller and kept across retries) is specified. The batch ID is stored with the dialogs
+    and the patch is only applied if no dialog of the conversation has it yet; otherwise the session is returned as is.
+    Raises a ValueError if no dialogs or more than MAX_DIALOGS_PER_BATCH dialogs are specified, or if batch_id is not a UUID.
+    Raises an exception if no chat session exists with the specified conversation ID.
+    """
+    def add_dialogs_to_chat_session(self, user_id: str, conversation_id: str, dialogs: List[Dialog], last_n: Optional[int] = None,
+            batch_id: Optional[str] = None) -> ChatSession:
+        if len(dialogs) == 0 or len(dialogs) > self.MAX_DIALOGS_PER_BATCH:
+            raise ValueError(f"Between 1 and {self.MAX_DIALOGS_PER_BATCH} dialogs can be added at once, got {len(dialogs)}.")
+
         partition_key = f"{user_id}|{conversation_id}"
-        updated_item = self.container.update_item(conversation_id, partition_key, item)
-        return ChatSession.as_item(updated_item)
\ No newline at end of file
+        filter_predicate = None
+        if batch_id is None:
+            patch_operations = [{"op": "add", "path": "/conversation/-", "value": dialog.to_item()} for dialog in dialogs]
+        else:
+            # parsed as a UUID so that it can be inlined in the predicate, which takes no parameters
+            batch_id = str(uuid.UUID(batch_id))
+            patch_operations = [{"op": "add", "path": "/conversation/-", "value": dict(dialog.to_item(), batch_id=batch_id)} for dialog in dialogs]
+            filter_predicate = f'FROM c WHERE NOT ARRAY_CONTAINS(c.conversation, {{"batch_id": "{batch_id}"}}, true)'
+        try:
+            updated_item = self.container.patch_item(conversation_id, partition_key, patch_operations, filter_predicate)
+        except CosmosNotFoundError:
+            raise SessionNotFoundError(f"Chat session with conversation ID {conversation_id} could not be found.")
+        except CosmosPreconditionFailedError:
+            # the batch was already appended by an earlier attempt
+            chat_session = self.get_chat_session(user_id, conversation_id, last_n)
+            if chat_session is None:
+                raise SessionNotFoundError(f"Chat session with conversation ID {conversation_id} could not be found.")
+            return chat_session
+
+        chat_session = ChatSession.as_item(updated_item)
+        if last_n is not None:
+            chat_session.conversation = chat_session.conversation[-last_n:] if last_n > 0 else []
+        return chat_session
+
+    def _get_chat_session_tail(self, conversation_id: str, partition_key: str, last_n: int) -> Optional[Dict[str, Any]]:
+        # ARRAY_SLICE runs server-side, so only the requested dialogs are returned no matter how long the conversation is
+        query = (
+            "SELECT c.user_id, c.conversation_id, "
+            "ARRAY_SLICE(c.conversation, (ARRAY_LENGTH(c.conversation) > @last_n ? ARRAY_LENGTH(c.conversation) - @last_n : 0), @last_n) AS conversation "
+            "FROM c WHERE c.id = @item_id"
+        )
+        params: List[Dict[str, object]] = [
+            dict(name="@item_id", value=conversation_id),
+            dict(name="@last_n", value=max(last_n, 0))
+        ]
+        items = self.container.query_items(query, params, partition_key)
+        if len(items) == 0:
+            return None
+        return items[0]
@@ -2,9 +2,10 @@ from azure.cosmos import CosmosClient
 from common.contracts.group import User, UserGroup
 from common.contracts.user_profile import UserProfile
 from common.contracts.resource import ResourceProfile, ResourceTypes
-from data.cosmosdb.container import CosmosConflictError, CosmosDBContainer
+from data.cosmosdb.container import CosmosConflictError, CosmosDBContainer, CosmosPreconditionFailedError
+from data.cosmosdb.registry import CosmosDBContainerRegistry
 from enum import Enum
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 class UserGroupNotFoundError(BaseException):
     pass
@@ -13,6 +14,7 @@ class PartitionType(Enum):
     USER = "user"
     GROUP = "group"
     RESOURCE = "resource"
+    EFFECTIVE_RESOURCES = "effective_resources"
 
 """
 Manager API for creating and retrieving user profiles and user groups access rules.
@@ -23,9 +25,13 @@ class EntitiesManager:
         {"paths": [f"/user_id", "/group_id", "/resource_id"]}
     ]
 
-    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, cosmos_db_name: str, cosmos_db_entities_container_name: str):
-        cosmos_client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
-        self.container = CosmosDBContainer(cosmos_db_name, cosmos_db_entities_container_name, self.PARTITION_KEY_NAME, cosmos_client, self.UNIQUE_KEYS)
+    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, cosmos_db_name: str, cosmos_db_entities_container_name: str,
+            container_registry: Optional[CosmosDBContainerRegistry] = None):
+        if container_registry is not None:
+            self.container = container_registry.get_container(cosmos_db_name, cosmos_db_entities_container_name, self.PARTITION_KEY_NAME, self.UNIQUE_KEYS)
+        else:
+            cosmos_client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
+            self.container = CosmosDBContainer(cosmos_db_name, cosmos_db_entities_container_name, self.PARTITION_KEY_NAME, cosmos_client, self.UNIQUE_KEYS)
     
     """
     Create a new user profile with the specified user properties.
@@ -93,11 +99,11 @@ class EntitiesManager:
     
     """
     Retrieves and deserializes all user groups the user with the specified user ID belongs to.
-    Returns None if no such user exists.
+    Returns None if no such user exists. The existence check can be skipped by callers that already hold the user profile.
     Raises an exception if deserialization of any expected property fails.
     """
-    def get_user_member_groups(self, user_id: str) -> Optional[List[UserGroup]]:
-        if self.get_user_profile(user_id) is None:
+    def get_user_member_groups(self, user_id: str, check_user_exists: bool = True) -> Optional[List[UserGroup]]:
+        if check_user_exists and self.get_user_profile(user_id) is None:
             return None
 
         query = "SELECT * FROM c WHERE ARRAY_CONTAINS(c.users, {'user_id': @user_id})"
@@ -149,4 +155,68 @@ class EntitiesManager:
         if item is None:
             return None
         
-        return ResourceProfile.as_item(item)
\ No newline at end of file
+        return ResourceProfile.as_item(item)
+    
+    """
+    Retrieves and deserializes the resources with the specified resource IDs using a single query.
+    Resources that do not exist are omitted from the result.
+    Raises an exception if deserialization of any expected property fails.
+    """
+    def get_resources(self, resource_ids: List[str]) -> List[ResourceProfile]:
+        if len(resource_ids) == 0:
+            return []
+
+        query = "SELECT * FROM c WHERE ARRAY_CONTAINS(@resource_ids, c.id)"
+        params: List[Dict[str, object]] = [
+            dict(name="@resource_ids", value=resource_ids)
+        ]
+        items = self.container.query_items(query, params, PartitionType.RESOURCE.value)
+        return [ResourceProfile.as_item(item) for item in items]
+
+    """
+    Retrieves the materialized list of resources the user with the specified user ID has access to, along with the etag
+    of the document to pass to set_effective_resources.
+    The list is None if it has not been materialized yet or has been invalidated since; the etag is None if no document
+    exists for the user.
+    """
+    def get_effective_resources(self, user_id: str) -> Tuple[Optional[List[ResourceProfile]], Optional[str]]:
+        item = self.container.get_item(user_id, PartitionType.EFFECTIVE_RESOURCES.value)
+        if item is None:
+            return None, None
+        if item.get("resources") is None:
+            return None, item["_etag"]
+
+        return [ResourceProfile.as_item(resource_dict) for resource_dict in item["resources"]], item["_etag"]
+
+    """
+    Materializes the list of resources the user with the specified user ID has access to, resolved after reading the
+    document with the specified etag (None if there was no document). The write only succeeds if the document has not
+    changed since, so a list resolved from access rules that were invalidated in the meantime is never stored.
+    Returns whether the list was stored.
+    """
+    def set_effective_resources(self, user_id: str, resources: List[ResourceProfile], etag: Optional[str]) -> bool:
+        item = {
+            "user_id": user_id,
+            "resources": [resource.to_item() for resource in resources]
+        }
+        try:
+            if etag is None:
+                self.container.create_item(user_id, PartitionType.EFFECTIVE_RESOURCES.value, item)
+            else:
+                self.container.update_item(user_id, PartitionType.EFFECTIVE_RESOURCES.value, item, etag)
+            return True
+        except (CosmosConflictError, CosmosPreconditionFailedError):
+            return False
+
+    """
+    Invalidates the materialized resource lists of the users with the specified user IDs, so they get resolved again on
+    next read. The documents are overwritten with an empty marker rather than deleted, which changes their etag and
+    fails any write of a list resolved before the invalidation.
+    """
+    def invalidate_effective_resources(self, user_ids: Set[str]):
+        for user_id in user_ids:
+            item = {
+                "user_id": user_id,
+                "resources": None
+            }
+            self.container.upsert_item(user_id, PartitionType.EFFECTIVE_RESOURCES.value, item)
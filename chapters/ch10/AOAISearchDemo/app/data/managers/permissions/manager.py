@@ -3,6 +3,7 @@ from common.contracts.access_rule import AccessRule, Member, MemberType, Resourc
 from common.contracts.group import UserGroup
 from common.contracts.user_profile import UserProfile
 from data.cosmosdb.container import CosmosConflictError, CosmosDBContainer
+from data.cosmosdb.registry import CosmosDBContainerRegistry
 from typing import Any, Dict, List, Set, Optional
 
 """
@@ -15,9 +16,13 @@ class PermissionsManager:
         {"paths": ["/rule_id"]}
     ]
 
-    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, cosmos_db_name: str, cosmos_db_permissions_container_name: str):
-        cosmos_client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
-        self.container = CosmosDBContainer(cosmos_db_name, cosmos_db_permissions_container_name, self.PARTITION_KEY_NAME, cosmos_client, self.UNIQUE_KEYS)
+    def __init__(self, cosmos_db_endpoint: str, cosmos_db_credential: Any, cosmos_db_name: str, cosmos_db_permissions_container_name: str,
+            container_registry: Optional[CosmosDBContainerRegistry] = None):
+        if container_registry is not None:
+            self.container = container_registry.get_container(cosmos_db_name, cosmos_db_permissions_container_name, self.PARTITION_KEY_NAME, self.UNIQUE_KEYS)
+        else:
+            cosmos_client = CosmosClient(url=cosmos_db_endpoint, credential=cosmos_db_credential, consistency_level="Session")
+            self.container = CosmosDBContainer(cosmos_db_name, cosmos_db_permissions_container_name, self.PARTITION_KEY_NAME, cosmos_client, self.UNIQUE_KEYS)
     
     """
     Create a new resource access rule with the specified rule properties.
@@ -46,28 +51,28 @@ class PermissionsManager:
     
     """
     Retrives and deserializes the set of resources the user with the specified user profile has access to.
+    Rules granting access to the user or to any of the user's groups are matched with a single query.
     """
     def get_user_resources(self, user: UserProfile, user_groups: Optional[List[UserGroup]]) -> Set[Resource]:        
-        query = "SELECT * FROM c WHERE ARRAY_CONTAINS(c.members, {'id': @id, 'member_type': @member_type})"
+        query = (
+            "SELECT VALUE c.resources FROM c WHERE EXISTS("
+            "SELECT VALUE m FROM m IN c.members WHERE "
+            "(m.member_type = @user_member_type AND m.id = @user_id) OR "
+            "(m.member_type = @group_member_type AND ARRAY_CONTAINS(@group_ids, m.id)))"
+        )
+        group_ids = [user_group.group_id for user_group in user_groups] if user_groups is not None else []
         params: List[Dict[str, object]] = [
-            dict(name="@id", value=user.user_id),
-            dict(name="@member_type", value=MemberType.USER.value)
+            dict(name="@user_id", value=user.user_id),
+            dict(name="@user_member_type", value=MemberType.USER.value),
+            dict(name="@group_ids", value=group_ids),
+            dict(name="@group_member_type", value=MemberType.GROUP.value)
         ]
         partition_key = self.PARTITION_KEY_VALUE
-        items = self.container.query_items(query, params, partition_key)
-
-        if not user_groups is None:
-            for user_group in user_groups:
-                params: List[Dict[str, object]] = [
-                    dict(name="@id", value=user_group.group_id),
-                    dict(name="@member_type", value=MemberType.GROUP.value)
-                ]
-                items.extend(self.container.query_items(query, params, partition_key))
+        rule_resources = self.container.query_items(query, params, partition_key)
 
         resources: Set[Resource] = set()
-        for item in items:
-            rule = AccessRule.as_item(item)
-            for resource in rule.resources:
-                resources.add(resource)
+        for resources_dict in rule_resources:
+            for resource_dict in resources_dict:
+                resources.add(Resource.as_item(resource_dict))
 
         return resources
@@ -0,0 +1,77 @@
+"""
+Micro-benchmark comparing the request charge (RU) and latency of point reads against the
+equivalent single-item SQL query used by CosmosDBContainer.get_item before it switched to read_item.
+
+Runs against the Azure Cosmos DB emulator by default (or any account set through the environment):
+    cd app/data
+    python -m test.benchmark_point_reads --iterations 200
+
+Not named test_*.py on purpose, so it is not picked up by `python -m unittest`.
+"""
+import argparse
+import os
+import statistics
+import time
+import uuid
+
+from azure.cosmos import CosmosClient
+from cosmosdb.container import CosmosDBContainer
+from typing import Callable, Dict, List, Tuple
+
+# well-known key of the local emulator, see https://learn.microsoft.com/azure/cosmos-db/emulator
+EMULATOR_ENDPOINT = "https://localhost:8081/"
+EMULATOR_KEY = "C2y6yDjf5/R+ob0N8A7Cgv30VRDJIWEHLM+4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnqyMsEcaGQy67XIw/Jw=="
+
+def query_read(container: CosmosDBContainer, id: str, partition_key: str):
+    # the query path get_item used before point reads
+    params: List[Dict[str, object]] = [
+        dict(name="@item_id", value=id)
+    ]
+    return container.query_items("SELECT * FROM c WHERE c.id = @item_id", params, partition_key)
+
+def point_read(container: CosmosDBContainer, id: str, partition_key: str):
+    return container.get_item(id, partition_key)
+
+def measure(container: CosmosDBContainer, read: Callable, id: str, partition_key: str, iterations: int) -> Tuple[List[float], List[float]]:
+    latencies_ms: List[float] = []
+    charges: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        read(container, id, partition_key)
+        latencies_ms.append((time.perf_counter() - start) * 1000)
+        headers = container.container.client_connection.last_response_headers
+        charges.append(float(headers.get("x-ms-request-charge", 0)))
+    return latencies_ms, charges
+
+def report(name: str, latencies_ms: List[float], charges: List[float]):
+    latencies_ms = sorted(latencies_ms)
+    p95 = latencies_ms[int(len(latencies_ms) * 0.95) - 1]
+    print(f"{name:<12} RU/op {statistics.mean(charges):7.2f}   mean {statistics.mean(latencies_ms):7.2f} ms   "
+          f"p50 {statistics.median(latencies_ms):7.2f} ms   p95 {p95:7.2f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Cosmos DB point reads with single-item queries.")
+    parser.add_argument("--endpoint", default=os.getenv("COSMOS_BENCHMARK_ENDPOINT", EMULATOR_ENDPOINT))
+    parser.add_argument("--key", default=os.getenv("COSMOS_BENCHMARK_KEY", EMULATOR_KEY))
+    parser.add_argument("--iterations", type=int, default=100)
+    args = parser.parse_args()
+
+    # the emulator serves a self-signed certificate
+    verify = not args.endpoint.startswith("https://localhost")
+    client = CosmosClient(url=args.endpoint, credential=args.key, consistency_level="Session", connection_verify=verify)
+    database_name = f"benchmark-{uuid.uuid4().hex[:8]}"
+    container = CosmosDBContainer(database_name, "items", "partition_key", client)
+
+    try:
+        partition_key = "benchmark"
+        item = {"conversation": [{"utterance": "x" * 200} for _ in range(20)]}
+        container.create_item("item", partition_key, item)
+
+        # warm up connections and caches so both paths are measured in steady state
+        measure(container, query_read, "item", partition_key, 5)
+        measure(container, point_read, "item", partition_key, 5)
+
+        report("query", *measure(container, query_read, "item", partition_key, args.iterations))
+        report("point read", *measure(container, point_read, "item", partition_key, args.iterations))
+    finally:
+        client.delete_database(database_name)
@@ -1,7 +1,9 @@
 import copy
 import unittest
 
-from cosmosdb.container import CosmosDBContainer
+from azure.core import MatchConditions
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from cosmosdb.container import CosmosDBContainer, CosmosNotFoundError, CosmosPreconditionFailedError
 from typing import List, Dict, Any, Optional, Iterable
 from unittest.mock import Mock
 
@@ -14,25 +16,43 @@ def create_item_raise_exception(item: dict):
 def query_items(query: str, parameters: Optional[List[Dict[str, Any]]], partition_key: Optional[Any]) -> Iterable[Dict[str, Any]]:
     return [{"property1": "value1", "property2": "value2"}]
 
-def query_items_no_item(query: str, parameters: Optional[List[Dict[str, Any]]], partition_key: Optional[Any]) -> Iterable[Dict[str, Any]]:
-    return []
-
-def query_items_multiple_items(query: str, parameters: Optional[List[Dict[str, Any]]], partition_key: Optional[Any]) -> Iterable[Dict[str, Any]]:
-    return [{"property1": "value1", "property2": "value2"}, {"property3": "value3"}]
-
 def query_items_raise_exception(query: str, parameters: Optional[List[Dict[str, Any]]], partition_key: Optional[Any]) -> Iterable[Dict[str, Any]]:
     raise Exception("Test exception.")
 
+def read_item(item: str, partition_key: str) -> Dict[str, Any]:
+    return {"property1": "value1", "property2": "value2"}
+
+def read_item_not_found(item: str, partition_key: str) -> Dict[str, Any]:
+    raise CosmosHttpResponseError(status_code=404, message="Not found.")
+
+def read_item_raise_exception(item: str, partition_key: str) -> Dict[str, Any]:
+    raise CosmosHttpResponseError(status_code=500, message="Test exception.")
+
 def replace_item(item: str, body: Dict[str, Any]) -> Dict[str, Any]:
     return copy.deepcopy(body)
 
 def replace_item_raise_exception(item: str, body: Dict[str, Any]) -> Dict[str, Any]:
     raise Exception("Test exception.")
 
-def delete_item(item: Dict[str, Any], partition_key: str):
+def replace_item_precondition_failed(item: str, body: Dict[str, Any], etag: str, match_condition: MatchConditions) -> Dict[str, Any]:
+    raise CosmosHttpResponseError(status_code=412, message="Precondition failed.")
+
+def patch_item(item: str, partition_key: str, patch_operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"id": item, "conversation": [patch_operations[0]["value"]]}
+
+def patch_item_not_found(item: str, partition_key: str, patch_operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    raise CosmosHttpResponseError(status_code=404, message="Not found.")
+
+def patch_item_precondition_failed(item: str, partition_key: str, patch_operations: List[Dict[str, Any]], filter_predicate: str) -> Dict[str, Any]:
+    raise CosmosHttpResponseError(status_code=412, message="Precondition failed.")
+
+def delete_item(item: str, partition_key: str):
     pass
 
-def delete_item_raise_exception(item: Dict[str, Any], partition_key: str):
+def delete_item_not_found(item: str, partition_key: str):
+    raise CosmosHttpResponseError(status_code=404, message="Not found.")
+
+def delete_item_raise_exception(item: str, partition_key: str):
     raise Exception("Test exception.")
 
 class CosmosDBContainerTests(unittest.TestCase):
@@ -55,6 +75,23 @@ class CosmosDBContainerTests(unittest.TestCase):
         cosmos_container_proxy.create_item.assert_called_once_with(expected_item)
         self.assertDictEqual(created_item, expected_item)
 
+    def test_init_without_provisioning(self):
+        # set up client mock that must not receive any create calls
+        cosmos_container_proxy = Mock()
+        cosmos_database_proxy = Mock()
+        cosmos_database_proxy.get_container_client.return_value = cosmos_container_proxy
+        cosmos_client_mock = Mock()
+        cosmos_client_mock.get_database_client.return_value = cosmos_database_proxy
+
+        # run test
+        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock, provision=False)
+
+        # assert the container proxy was built without create-if-not-exists calls
+        cosmos_client_mock.create_database_if_not_exists.assert_not_called()
+        cosmos_client_mock.get_database_client.assert_called_once_with("database_name")
+        cosmos_database_proxy.get_container_client.assert_called_once_with("container_name")
+        self.assertIs(container.container, cosmos_container_proxy)
+
     def test_create_item_raises_exception(self):
         # set up container with mocked dependencies
         cosmos_container_proxy = Mock()
@@ -73,7 +110,7 @@ class CosmosDBContainerTests(unittest.TestCase):
     def test_get_item(self):
         # set up container with mocked dependencies
         cosmos_container_proxy = Mock()
-        cosmos_container_proxy.query_items.side_effect = query_items
+        cosmos_container_proxy.read_item.side_effect = read_item
         cosmos_database_proxy = Mock()
         cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
         cosmos_client_mock = Mock()
@@ -85,9 +122,10 @@ class CosmosDBContainerTests(unittest.TestCase):
         partition_key = "partition_key"
         retrieved_item = container.get_item(id, partition_key)
 
-        # assert container proxy was called as expected and returned item is as expected 
+        # assert container proxy was called with a point read and returned item is as expected 
         expected_item = {"property1": "value1", "property2": "value2"}
-        cosmos_container_proxy.query_items.assert_called_once_with(query='SELECT * FROM c WHERE c.id = @item_id', parameters=[{'name': '@item_id', 'value': id}], partition_key=partition_key)
+        cosmos_container_proxy.read_item.assert_called_once_with(item=id, partition_key=partition_key)
+        cosmos_container_proxy.query_items.assert_not_called()
         self.assertIsNotNone(retrieved_item)
         if retrieved_item is not None:
             self.assertDictEqual(expected_item, retrieved_item)
@@ -95,7 +133,7 @@ class CosmosDBContainerTests(unittest.TestCase):
     def test_get_item_returns_none(self):
         # set up container with mocked dependencies
         cosmos_container_proxy = Mock()
-        cosmos_container_proxy.query_items.side_effect = query_items_no_item
+        cosmos_container_proxy.read_item.side_effect = read_item_not_found
         cosmos_database_proxy = Mock()
         cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
         cosmos_client_mock = Mock()
@@ -107,31 +145,14 @@ class CosmosDBContainerTests(unittest.TestCase):
         partition_key = "partition_key"
         retrieved_item = container.get_item(id, partition_key)
 
-        # assert container proxy was called as expected and returned item is None as expected 
-        cosmos_container_proxy.query_items.assert_called_once_with(query='SELECT * FROM c WHERE c.id = @item_id', parameters=[{'name': '@item_id', 'value': id}], partition_key=partition_key)
+        # assert container proxy was called as expected and the 404 was mapped to None 
+        cosmos_container_proxy.read_item.assert_called_once_with(item=id, partition_key=partition_key)
         self.assertIsNone(retrieved_item)
 
-    def test_get_item_returns_multiple(self):
-        # set up container with mocked dependencies
-        cosmos_container_proxy = Mock()
-        cosmos_container_proxy.query_items.side_effect = query_items_multiple_items
-        cosmos_database_proxy = Mock()
-        cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
-        cosmos_client_mock = Mock()
-        cosmos_client_mock.create_database_if_not_exists.return_value = cosmos_database_proxy
-        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock)
-
-        # run test and assert container proxy was called as expected and container client caught and reraised exception
-        id = "id"
-        partition_key = "partition_key"
-        with self.assertRaises(Exception):
-            container.get_item(id, partition_key)
-            cosmos_container_proxy.query_items.assert_called_once_with(query='SELECT * FROM c WHERE c.id = @item_id', parameters=[{'name': '@item_id', 'value': id}], partition_key=partition_key)
-
     def test_get_item_raises_exception(self):
         # set up container with mocked dependencies
         cosmos_container_proxy = Mock()
-        cosmos_container_proxy.query_items.side_effect = query_items_raise_exception
+        cosmos_container_proxy.read_item.side_effect = read_item_raise_exception
         cosmos_database_proxy = Mock()
         cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
         cosmos_client_mock = Mock()
@@ -175,11 +196,76 @@ class CosmosDBContainerTests(unittest.TestCase):
             item = {"property1": "value1", "property2": "value2"}
             container.update_item("id", "partition_key", item)
 
+    def test_update_item_with_etag_raises_precondition_failed(self):
+        # set up container with mocked dependencies
+        cosmos_container_proxy = Mock()
+        cosmos_container_proxy.replace_item.side_effect = replace_item_precondition_failed
+        cosmos_database_proxy = Mock()
+        cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
+        cosmos_client_mock = Mock()
+        cosmos_client_mock.create_database_if_not_exists.return_value = cosmos_database_proxy
+        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock)
+
+        # run test and assert the replace was made conditional on the etag and the 412 translated into a CosmosPreconditionFailedError
+        item = {"property1": "value1", "property2": "value2"}
+        with self.assertRaises(CosmosPreconditionFailedError):
+            container.update_item("id", "partition_key", item, "etag")
+        cosmos_container_proxy.replace_item.assert_called_once_with("id", item, etag="etag", match_condition=MatchConditions.IfNotModified)
+
+    def test_patch_item(self):
+        # set up container with mocked dependencies
+        cosmos_container_proxy = Mock()
+        cosmos_container_proxy.patch_item.side_effect = patch_item
+        cosmos_database_proxy = Mock()
+        cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
+        cosmos_client_mock = Mock()
+        cosmos_client_mock.create_database_if_not_exists.return_value = cosmos_database_proxy
+        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock)
+
+        # run test
+        patch_operations = [{"op": "add", "path": "/conversation/-", "value": {"property1": "value1"}}]
+        patched_item = container.patch_item("id", "partition_key", patch_operations)
+
+        # assert container proxy was called as expected and returned patched item as expected 
+        cosmos_container_proxy.patch_item.assert_called_once_with(item="id", partition_key="partition_key", patch_operations=patch_operations)
+        self.assertDictEqual({"id": "id", "conversation": [{"property1": "value1"}]}, patched_item)
+
+    def test_patch_item_raises_not_found(self):
+        # set up container with mocked dependencies
+        cosmos_container_proxy = Mock()
+        cosmos_container_proxy.patch_item.side_effect = patch_item_not_found
+        cosmos_database_proxy = Mock()
+        cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
+        cosmos_client_mock = Mock()
+        cosmos_client_mock.create_database_if_not_exists.return_value = cosmos_database_proxy
+        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock)
+
+        # run test and assert container client translated the 404 into a CosmosNotFoundError
+        with self.assertRaises(CosmosNotFoundError):
+            container.patch_item("id", "partition_key", [{"op": "set", "path": "/conversation", "value": []}])
+
+    def test_patch_item_raises_precondition_failed(self):
+        # set up container with mocked dependencies
+        cosmos_container_proxy = Mock()
+        cosmos_container_proxy.patch_item.side_effect = patch_item_precondition_failed
+        cosmos_database_proxy = Mock()
+        cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
+        cosmos_client_mock = Mock()
+        cosmos_client_mock.create_database_if_not_exists.return_value = cosmos_database_proxy
+        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock)
+
+        # run test and assert the filter predicate was passed and the 412 translated into a CosmosPreconditionFailedError
+        patch_operations = [{"op": "add", "path": "/conversation/-", "value": {"property1": "value1"}}]
+        filter_predicate = "FROM c WHERE NOT ARRAY_CONTAINS(c.conversation, {\"batch_id\": \"batch\"}, true)"
+        with self.assertRaises(CosmosPreconditionFailedError):
+            container.patch_item("id", "partition_key", patch_operations, filter_predicate)
+        cosmos_container_proxy.patch_item.assert_called_once_with(item="id", partition_key="partition_key", patch_operations=patch_operations,
+                                                                  filter_predicate=filter_predicate)
+
     def test_delete_item(self):
         # set up container with mocked dependencies
         cosmos_container_proxy = Mock()
         cosmos_container_proxy.delete_item.side_effect = delete_item
-        cosmos_container_proxy.query_items.side_effect = query_items
         cosmos_database_proxy = Mock()
         cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
         cosmos_client_mock = Mock()
@@ -191,16 +277,29 @@ class CosmosDBContainerTests(unittest.TestCase):
         partition_key = "partition_key"
         container.delete_item(id, partition_key)
 
-        # assert container proxy was called as expected
-        item = {"property1": "value1", "property2": "value2"}
-        cosmos_container_proxy.query_items.assert_called_once_with(query='SELECT * FROM c WHERE c.id = @item_id', parameters=[{'name': '@item_id', 'value': id}], partition_key=partition_key)
-        cosmos_container_proxy.delete_item.assert_called_once_with(item, partition_key=partition_key)        
+        # assert container proxy deleted the item directly, without reading it first
+        cosmos_container_proxy.delete_item.assert_called_once_with(item=id, partition_key=partition_key)
+        cosmos_container_proxy.query_items.assert_not_called()
+        cosmos_container_proxy.read_item.assert_not_called()
+
+    def test_delete_item_not_found(self):
+        # set up container with mocked dependencies
+        cosmos_container_proxy = Mock()
+        cosmos_container_proxy.delete_item.side_effect = delete_item_not_found
+        cosmos_database_proxy = Mock()
+        cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
+        cosmos_client_mock = Mock()
+        cosmos_client_mock.create_database_if_not_exists.return_value = cosmos_database_proxy
+        container = CosmosDBContainer("database_name", "container_name", "partition_key_name", cosmos_client_mock)
+
+        # run test and assert deleting a missing item is a no-op, as it was before
+        container.delete_item("id", "partition_key")
+        cosmos_container_proxy.delete_item.assert_called_once_with(item="id", partition_key="partition_key")
 
     def test_delete_item_raises_exception(self):
         # set up container with mocked dependencies
         cosmos_container_proxy = Mock()
         cosmos_container_proxy.delete_item.side_effect = delete_item_raise_exception
-        cosmos_container_proxy.query_items.side_effect = query_items
         cosmos_database_proxy = Mock()
         cosmos_database_proxy.create_container_if_not_exists.return_value = cosmos_container_proxy
         cosmos_client_mock = Mock()
@@ -212,9 +311,6 @@ class CosmosDBContainerTests(unittest.TestCase):
             id = "id"
             partition_key = "partition_key"
             container.delete_item(id, partition_key)
-            item = {"property1": "value1", "property2": "value2"}
-            cosmos_container_proxy.query_items.assert_called_once_with(query='SELECT * FROM c WHERE c.id = @item_id', parameters=[{'name': '@item_id', 'value': id}], partition_key=id)
-            cosmos_container_proxy.delete_item.assert_called_once_with(item, partition_key=id)
 
     def test_query_items(self):
         # set up container with mocked dependencies
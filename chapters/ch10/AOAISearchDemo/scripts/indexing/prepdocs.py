@@ -26,6 +26,7 @@ from azure.search.documents.indexes.models import (
     HnswParameters
 )
 from azure.storage.blob import BlobServiceClient
+from common.utilities.embedding_cache import EmbeddingCache
 from typing import List
 from pypdf import PdfReader, PdfWriter
 
@@ -66,6 +67,8 @@ parser.add_argument("--openAIEngine", required=False, help="OpenAI embeddings mo
 parser.add_argument("--openAITokenLimit", required=False, help="The max token limit for requests to the specidied OpenAI embeddings model")
 parser.add_argument("--openAIDimensions", required=False,
                     help="The max number of dimensions allowed for an embeddings request to the specified OpenAI model")
+parser.add_argument("--embeddingcachedir", required=False,
+                    help="Optional. Directory of the embeddings cache shared with the backend (EMBEDDING_CACHE_DIRECTORY), so unchanged content is not vectorized again")
 parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
 args = parser.parse_args()
 
@@ -74,8 +77,6 @@ azd_credential = AzureDeveloperCliCredential() if args.tenantid == None else Azu
     tenant_id=args.tenantid)
 default_creds = azd_credential if args.searchkey == None or args.storagekey == None else None
 search_creds = default_creds if args.searchkey == None and default_creds is not None else AzureKeyCredential(args.searchkey)
-openai.api_type = "azure"
-openai.api_version = "2023-03-15-preview"
 skipvectorization = True if args.skipvectorization.lower() == "true" else False if args.skipvectorization.lower() == "false" else None
 if skipvectorization is None:
     raise ValueError("skipvectorization must be 'true' or 'false'")
@@ -205,9 +206,11 @@ def get_document_text(filename):
 
     return page_map
 
+# resolved once, chunk_content runs for every section of every document
+enc = tiktoken.encoding_for_model("gpt-4")
+
 def chunk_content(content):
     token_limit = int(args.openAITokenLimit)
-    enc = tiktoken.encoding_for_model("gpt-4")
     tokenized_content = enc.encode(content)
     section_chunks: List[str] = []
 
@@ -229,11 +232,20 @@ def chunk_content(content):
 
     return section_chunks
 
+# memory only unless a cache directory is given
+embedding_cache = EmbeddingCache(directory=args.embeddingcachedir)
+
 def vectorize_content(content):
-    openai.api_base = f"https://{args.openAIService}.openai.azure.com"
-    openai.api_key = args.openAIKey
-    response = openai.Embedding.create(engine=args.openAIEngine, input=content)
-    return response['data'][0]['embedding']
+    embedding = embedding_cache.get(args.openAIEngine, content)
+    if embedding is not None:
+        return embedding
+    # the endpoint and key are passed per request instead of being set on the openai module
+    response = openai.Embedding.create(engine=args.openAIEngine, input=content, api_type="azure",
+                                       api_version="2023-03-15-preview",
+                                       api_base=f"https://{args.openAIService}.openai.azure.com", api_key=args.openAIKey)
+    embedding = response['data'][0]['embedding']
+    embedding_cache.set(args.openAIEngine, content, embedding)
+    return embedding
 
 def create_sections(filename, page_map):
     for i, (pagenum, _, section) in enumerate(page_map):
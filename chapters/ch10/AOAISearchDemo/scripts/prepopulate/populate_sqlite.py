@@ -0,0 +1,34 @@
+import argparse
+import os
+import sqlite3
+import pandas as pd
+
+parser = argparse.ArgumentParser(
+    description="create a local SQLite stand-in of the SQL Database with the starter data, to run the structured approach and its caches without Azure SQL.",
+    epilog="Example: populate_sqlite.py --database ./sql_data.db, then set SQL_CONNECTION_STRING to sqlite:///./sql_data.db"
+)
+parser.add_argument("--database", help="The path of the SQLite database file to create.")
+parser.add_argument("--datadir", default="./scripts/prepopulate/sql_data", help="Optional. The directory of the starter data CSV files.")
+parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output.")
+args = parser.parse_args()
+
+# same tables as populate_sql.py
+tables = {
+    "customers.csv": "Customers",
+    "products.csv": "Products",
+    "merchants.csv": "Merchants",
+    "stock.csv": "Stock",
+    "sales.csv": "Sales",
+    "sales_detail.csv": "Sales_Detail"
+}
+
+if args.verbose: print(f"Creating SQLite database {args.database}")
+cnxn = sqlite3.connect(args.database)
+
+for file_name, table_name in tables.items():
+    if args.verbose: print(f"Populating {table_name}")
+    df = pd.read_csv(os.path.join(args.datadir, file_name))
+    df.to_sql(table_name, cnxn, if_exists="replace", index=False)
+
+cnxn.commit()
+cnxn.close()
@@ -14,6 +14,8 @@ import time
 import mlflow
 from openai import OpenAI
 import tiktoken as tk
+import hashlib
+from collections import OrderedDict
 from colorama import Fore, Style, init
 
 # Set OpenAI API key
@@ -48,7 +50,15 @@ def print_ai_output(text):
     print(f"{Fore.BLUE}AI Assistant:{Style.RESET_ALL}", text)
 
 # count tokens
+# the conversation so far is counted again on every turn; counts are cached by content hash
+token_counts = OrderedDict()
+
 def count_tokens(string: str, encoding_name="cl100k_base") -> int:
+    key = (encoding_name, hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest())
+    if key in token_counts:
+        token_counts.move_to_end(key)
+        return token_counts[key]
+
     # Get the encoding
     encoding = tk.get_encoding(encoding_name)
     
@@ -57,6 +67,11 @@ def count_tokens(string: str, encoding_name="cl100k_base") -> int:
 
     # Count the number of tokens
     num_tokens = len(encoded_string)
+
+    # Keep the 4096 most recently used counts
+    token_counts[key] = num_tokens
+    if len(token_counts) > 4096:
+        token_counts.popitem(last=False)
     return num_tokens
 
 # Generate text using OpenAI API